@@ -1,12 +1,55 @@
-import json
-from datetime import datetime
-from pathlib import Path
-import smtplib
+from datetime import datetime, timedelta
+import uuid
 from email.mime.text import MIMEText
 
 import pandas as pd
 import streamlit as st
 import streamlit.components.v1 as components 
+from streamlit.runtime.scriptrunner import get_script_run_ctx
+
+import dependencies
+import guest_cart
+import metrics
+import order_archive
+import order_ingest
+from catalog_views import SORT_OPTIONS
+from decant_sets import (
+    NOTE_FACETS,
+    PRICE_COLUMNS as DECANT_PRICE_COLUMNS,
+    SIZES as DECANT_SIZES,
+    best_sets,
+    family_labels,
+    preference_scores,
+)
+from facets import FACETS
+from models import CartLine, Order, UserRecord
+from order_index import COLUMNS as ORDER_COLUMNS, SORT_KEYS as ORDER_SORT_KEYS
+from product_grid import product_grid
+from ratelimit import RateLimiter
+from session_offload import IdleSessionManager, is_offloaded
+from shop_data import (
+    CATEGORY_PAGES,
+    aggregates_version,
+    catalog_version,
+    get_category_views,
+    get_copurchase,
+    get_facet_index,
+    get_image_features,
+    get_name_resolver,
+    get_grid_payload,
+    get_image_urls,
+    get_order_index,
+    get_thumbnails,
+    load_archived_orders,
+    load_catalog,
+    load_compositions_by_id,
+    load_users,
+    parfum_row,
+    priced_lines,
+    save_users,
+    store_user_state,
+)
+
 # ================== CONFIG GLOBALE ==================
 
 st.set_page_config(
@@ -14,11 +57,13 @@ st.set_page_config(
     layout="wide",
 )
 
+# endpoint / fichier de métriques si configuré (voir metrics.py), une fois par process
+metrics.start_exporter()
+
 # ================== CONSTANTES ======================
 
-CATALOG_CSV = "Catalogue_Parfums_Complet.csv"   # ton CSV actuel
-USERS_FILE = "users.json"
-COMPO_FILE = "parfums_composition.txt"          # nouveau fichier texte
+ADMIN_PAGE_SIZE = 50                            # lignes de commande par page (Admin)
+
 # ================== PROMOTIONS ======================
 
 PROMOS = [
@@ -76,11 +121,8 @@ def is_admin():
     user = st.session_state.get("user")
     return user in ADMIN_USERS
 
-# Lien shareable Botpress
-CHATBOT_URL = (
-    "https://cdn.botpress.cloud/webchat/v3.3/shareable.html"
-    "?configUrl=https://files.bpcontent.cloud/2025/10/06/14/20251006143331-TLGNO0TS.json"
-)
+# script particles.js : copie locale si disponible (voir dependencies.py)
+PARTICLES_SCRIPT_TAG = "<!-- particles.js -->"
 PARTICLES_HTML = """
 <!DOCTYPE html>
 <html lang="en">
@@ -100,9 +142,9 @@ PARTICLES_HTML = """
 </head>
 <body>
   <div id="particles-js"></div>
-  <script src="https://cdn.jsdelivr.net/particles.js/2.0.0/particles.min.js"></script>
+  <!-- particles.js -->
   <script>
-    particlesJS("particles-js", {
+    if (window.particlesJS) particlesJS("particles-js", {
       "particles": {
         "number": {
           "value": 300,
@@ -174,140 +216,116 @@ def do_rerun():
 
 # ================== FONCTIONS UTILES ==================
 
-@st.cache_data
-def load_catalog():
-    """
-    Charge le catalogue CSV et force un ID interne cohérent :
+def ensure_session_state():
+    st.session_state.setdefault("user", None)
+    st.session_state.setdefault("password_plain", None)
+    st.session_state.setdefault("page", "Accueil")  # page courante pour la nav
+    st.session_state.setdefault("session_id", uuid.uuid4().hex)  # clé du rate limiting
+    # activité notée d'abord : après ce point, le déchargement ne touche plus
+    # à la session ; s'il est passé juste avant, les clés manquent et on relit
+    get_session_manager().touch(
+        st.session_state["session_id"],
+        get_script_run_ctx().session_state,
+        st.session_state.get("user"),
+    )
+    rehydrate_session()
+    st.session_state.setdefault("cart", [])
+    st.session_state.setdefault("favorites", set())
+    st.session_state.setdefault("history", [])
+
 
-    - image_id = index de la ligne + 1
-    - image_path = images/{image_id}.png
+# ================== SESSIONS INACTIVES ======================
 
-    Donc la ligne 1 du CSV = id 1 = images/1.png
-         la ligne 2 du CSV = id 2 = images/2.png
-         etc.
+@st.cache_resource
+def get_session_manager():
     """
-    try:
-        df = pd.read_csv(CATALOG_CSV)
-    except Exception:
-        return pd.DataFrame()
+    Gestionnaire partagé par toutes les sessions du process (voir
+    session_offload.py) : l'état des sessions inactives est libéré, et relu
+    depuis users.json par rehydrate_session() au retour.
+    """
+    manager = IdleSessionManager()
+    manager.start()
+    return manager
 
-    # On ignore complètement les colonnes d'ID existantes,
-    # on repart sur un index propre.
-    df = df.reset_index(drop=True)
-    df["image_id"] = df.index + 1
-    df["image_path"] = df["image_id"].apply(lambda i: f"images/{i}.png")
-    return df
 
+# ================== LIMITATION DE DÉBIT ======================
 
-@st.cache_data
-def load_compositions():
-    """
-    Lit parfums_composition.txt avec des sections de type:
+@st.cache_resource
+def get_rate_limiter():
+    """Limiteur partagé par toutes les sessions du process (voir ratelimit.py)."""
+    return RateLimiter()
 
-    ### NOM DU PARFUM
-    Famille olfactive : ...
-    Notes de tête : ...
-    Notes de cœur : ...
-    Notes de fond : ...
 
-    et retourne un dict {nom: texte_markdown}
+def check_rate_limit(action: str, username=None) -> float:
     """
-    path = Path(COMPO_FILE)
-    if not path.exists():
-        return {}
-
-    compositions = {}
-    current_name = None
-    buffer = []
-
-    with path.open("r", encoding="utf-8") as f:
-        for line in f:
-            line = line.rstrip("\n")
-            if line.startswith("### "):
-                # on ferme l’ancien bloc
-                if current_name is not None:
-                    compositions[current_name] = "\n".join(buffer).strip()
-                current_name = line[4:].strip()
-                buffer = []
-            else:
-                buffer.append(line)
-
-    # dernier bloc
-    if current_name is not None:
-        compositions[current_name] = "\n".join(buffer).strip()
-
-    return compositions
+    Consomme un jeton pour `action`, par session et (si connu) par utilisateur.
+    Retourne 0.0 si l'action est autorisée, sinon le délai d'attente en secondes.
+    """
+    keys = [f"session:{st.session_state.get('session_id')}"]
+    if username:
+        keys.append(f"user:{username}")
+    return get_rate_limiter().hit(action, keys)
 
 
-def load_users():
-    """Charge le fichier users.json (ou dict vide)."""
-    path = Path(USERS_FILE)
-    if not path.exists():
-        return {}
-    try:
-        with path.open("r", encoding="utf-8") as f:
-            return json.load(f)
-    except Exception:
-        return {}
+def rate_limit_message(wait: float) -> str:
+    return (
+        "Trop de tentatives en peu de temps. "
+        f"Réessayez dans {max(1, round(wait))} seconde(s)."
+    )
 
 
-def save_users(users: dict):
-    """Sauvegarde le dictionnaire d’utilisateurs dans users.json."""
-    path = Path(USERS_FILE)
-    with path.open("w", encoding="utf-8") as f:
-        json.dump(users, f, ensure_ascii=False, indent=2)
+def sync_current_user_to_file():
+    """Recopie l’état en mémoire (cart/favs/history) vers users.json pour l’utilisateur courant."""
+    user = st.session_state.get("user")
+    if not user:
+        return
+    store_user_state(user, st.session_state)
 
 
-def ensure_session_state():
-    st.session_state.setdefault("user", None)
-    st.session_state.setdefault("password_plain", None)
-    st.session_state.setdefault("cart", [])
-    st.session_state.setdefault("favorites", set())
-    st.session_state.setdefault("history", [])
-    st.session_state.setdefault("page", "Accueil")  # page courante pour la nav
+def load_user_session(username: str, data: dict):
+    """Charge l'enregistrement users.json `data` dans la session (connexion ou rehydratation)."""
+    data = dict(data)
+    data["history"] = order_archive.hot_orders(
+        data.get("history", []), order_archive.archive_entry(username)
+    )
+    # validation + migration de l'enregistrement, une fois pour la session
+    record = UserRecord.from_dict(data, resolve=get_name_resolver(CATALOG_VERSION))
+    st.session_state["cart"] = record.cart
+    st.session_state["favorites"] = record.favorites
+    st.session_state["history"] = record.history
 
 
-def normalize_cart_items(cart_list):
+def rehydrate_session():
     """
-    S'assure que chaque item du panier a un champ 'units' (nombre de flacons).
-    Utile pour compatibilité avec d'anciens fichiers users.json.
+    Relit depuis users.json l'état d'une session déchargée pour inactivité
+    (session_offload.py) : clés panier / favoris / historique absentes
+    alors qu'un client est connecté.
     """
-    normalized = []
-    for item in cart_list:
-        if "units" not in item:
-            item["units"] = 1
-        normalized.append(item)
-    return normalized
-
-
-def sync_current_user_to_file():
-    """Recopie l’état en mémoire (cart/favs/history) vers users.json pour l’utilisateur courant."""
-    user = st.session_state.get("user")
-    if not user:
+    username = st.session_state.get("user")
+    if not username or not is_offloaded(st.session_state):
         return
-    users = load_users()
-    if user not in users:
-        users[user] = {"password": st.session_state.get("password_plain") or ""}
-    users[user]["password"] = st.session_state.get("password_plain") or ""
-    # normalisation du panier avant sauvegarde
-    cart = normalize_cart_items(st.session_state.get("cart", []))
-    st.session_state["cart"] = cart
-    users[user]["cart"] = cart
-    users[user]["favorites"] = list(st.session_state.get("favorites", set()))
-    users[user]["history"] = st.session_state.get("history", [])
-    save_users(users)
+    data = load_users().get(username)
+    if data is None:
+        # compte supprimé entre-temps : la session repart déconnectée
+        st.session_state["user"] = None
+        st.session_state["password_plain"] = None
+        return
+    load_user_session(username, data)
+    metrics.SESSIONS_REHYDRATED.inc()
 
 
 def login_user(username: str, password: str) -> bool:
     users = load_users()
     if username in users and users[username].get("password") == password:
+        guest = st.session_state.get("cart", [])
         st.session_state["user"] = username
         st.session_state["password_plain"] = password
-        data = users[username]
-        # normalisation du panier pour intégrer 'units'
-        st.session_state["cart"] = normalize_cart_items(data.get("cart", []))
-        st.session_state["favorites"] = set(data.get("favorites", []))
-        st.session_state["history"] = data.get("history", [])
+        load_user_session(username, users[username])
+        if guest:
+            # panier invité fusionné dans celui du compte : une seule écriture
+            st.session_state["cart"] = guest_cart.merge_carts(st.session_state["cart"], guest)
+            sync_current_user_to_file()
+            metrics.GUEST_CARTS_MERGED.inc()
         return True
     return False
 
@@ -316,16 +334,15 @@ def signup_user(username: str, password: str):
     users = load_users()
     if username in users:
         return False, "Ce nom d'utilisateur existe déjà."
-    users[username] = {
-        "password": password,
-        "cart": [],
-        "favorites": [],
-        "history": [],
-    }
+    # le panier invité devient celui du compte, dans la même écriture
+    guest = st.session_state.get("cart", [])
+    users[username] = UserRecord(password=password, cart=list(guest)).to_dict()
     save_users(users)
+    if guest:
+        metrics.GUEST_CARTS_MERGED.inc()
     st.session_state["user"] = username
     st.session_state["password_plain"] = password
-    st.session_state["cart"] = []
+    st.session_state["cart"] = list(guest)
     st.session_state["favorites"] = set()
     st.session_state["history"] = []
     return True, "Compte créé."
@@ -341,21 +358,79 @@ def require_login():
         st.stop()
 
 
-def add_to_cart(name, price, qte_ml, units=1):
+def add_to_cart(parfum_id, name, price, qte_ml, units=1):
     """Ajoute un parfum au panier, avec quantité en ml + nombre de flacons."""
-    item = {
-        "name": name,
-        "price": price,
-        "qte_ml": qte_ml,
-        "units": int(units) if units else 1,
-    }
-    st.session_state["cart"].append(item)
+    item = CartLine(
+        name=str(name),
+        price=float(price),
+        qte_ml=int(qte_ml),
+        units=int(units) if units else 1,
+        parfum_id=int(parfum_id),
+    )
+    add_lines_to_cart([item])
+
+
+def add_lines_to_cart(lines):
+    """Ajoute plusieurs CartLine au panier en une seule écriture de users.json."""
+    st.session_state["cart"].extend(lines)
     sync_current_user_to_file()
+    metrics.ADD_TO_CART.inc(len(lines))
+
+
+def add_many_to_cart(lines):
+    """
+    Ajoute des lignes (parfum_id, qte_ml, flacons) en une transaction, au
+    prix actuel du catalogue : une écriture de users.json pour le tout.
+    Retourne (CartLine ajoutées, lignes ignorées : parfum retiré du
+    catalogue ou taille sans prix).
+    """
+    items, skipped = priced_cart_lines(lines)
+    if items:
+        add_lines_to_cart(items)
+    return items, skipped
+
+
+def priced_cart_lines(lines):
+    """
+    CartLine au prix actuel du catalogue pour des lignes (parfum_id,
+    qte_ml, flacons). Retourne (CartLine, lignes ignorées).
+    """
+    return priced_lines(df_catalog, lines)
+
 
+def report_bulk_add(items, skipped):
+    """Message de résultat d'un ajout groupé au panier."""
+    if items:
+        st.success(f"{len(items)} ligne(s) ajoutée(s) au panier, aux prix actuels.")
+    if skipped:
+        st.warning(f"{len(skipped)} ligne(s) ignorée(s) : parfum plus disponible au catalogue.")
 
-def add_to_favorites(name):
+
+def persist_guest_cart():
+    """
+    Synchronise le panier invité avec le navigateur (guest_cart.py) : le
+    relit au premier rendu de la session, puis en garde une copie à jour.
+    Connecté, la copie du navigateur est vidée (le panier est dans users.json).
+    """
+    restored = st.session_state.get("guest_cart_restored", False)
+    user = st.session_state.get("user")
+    lines = [] if user else guest_cart.encode_cart(st.session_state["cart"])
+    with st.sidebar:
+        value = guest_cart.guest_cart_store(lines, restored=restored, key="guest_cart")
+    if restored or value is None:
+        return
+    st.session_state["guest_cart_restored"] = True
+    if user is not None or not isinstance(value, dict):
+        return
+    stored, _ = priced_cart_lines(guest_cart.decode_lines(value.get("lines")))
+    if stored:
+        st.session_state["cart"] = guest_cart.merge_carts(stored, st.session_state["cart"])
+        do_rerun()  # badge du panier à jour
+
+
+def add_to_favorites(parfum_id):
     favs = st.session_state["favorites"]
-    favs.add(name)
+    favs.add(int(parfum_id))
     st.session_state["favorites"] = favs
     sync_current_user_to_file()
 
@@ -363,7 +438,24 @@ def add_to_favorites(name):
 def get_cart_item_count():
     """Retourne le nombre total de flacons dans le panier."""
     cart = st.session_state.get("cart", [])
-    return sum(int(item.get("units", 1)) for item in cart)
+    return sum(item.units for item in cart)
+
+
+def render_parfum_thumbnails(title: str, parfum_ids):
+    """Rangée de vignettes cliquables (co-achats, flacons similaires...)."""
+    rows = [get_parfum_by_id(i) for i in parfum_ids if i is not None]
+    rows = [row for row in rows if row is not None]
+    if not rows:
+        return
+    st.subheader(title)
+    cols = st.columns(len(rows))
+    for col, row in zip(cols, rows):
+        with col:
+            try:
+                st.image(get_image_path(row["image_id"], "thumb"), width=90)
+            except Exception:
+                pass
+            st.markdown(f"[{row['name']}](?parfum_id={int(row['image_id'])})")
 
 
 def render_bot_link(prefix: str):
@@ -378,49 +470,123 @@ def render_bot_link(prefix: str):
         st.session_state["page"] = "Chatbot"
         do_rerun()
 
-def get_parfum_by_name(name: str):
+def get_parfum_by_id(image_id: int):
     """
-    Retourne la ligne du catalogue (Series) correspondant Çÿ ce parfum,
-    ou None si introuvable.
+    Retourne la ligne du catalogue pour un given image_id (parfum_id),
+    ou None si introuvable (accès direct, voir shop_data.parfum_row).
     """
-    if df_catalog is None or df_catalog.empty:
-        return None
+    return parfum_row(df_catalog, image_id)
 
-    sub = df_catalog[df_catalog["name"] == name]
-    if sub.empty:
-        sub = df_catalog[df_catalog["name"].str.lower() == str(name).lower()]
 
-    if sub.empty:
-        return None
+def get_image_path(parfum_id, variant="full") -> str:
+    """
+    Image d'un parfum : URL statique hashée si les images sont publiées
+    (static_images.py, mise en cache par le navigateur), sinon chemin local
+    passé par le gestionnaire de médias. `variant="thumb"` : vignette 96 px.
+    """
+    urls = get_image_urls(CATALOG_VERSION)
+    if urls is not None:
+        url = urls.url(parfum_id, variant)
+        if url:
+            return url
+    row = get_parfum_by_id(parfum_id)
+    if row is None:
+        return ""
+    return row.get("image_path", "") or ""
+
+FILTER_FACETS = [
+    ["famille", "prix10", "prix20", "prix30"],
+    ["note_tete", "note_coeur", "note_fond", "couleur"],
+]
 
-    return sub.iloc[0]
 
-def get_parfum_by_id(image_id: int):
+def render_facet_filters(index, base_mask: int, key_prefix: str) -> int:
     """
-    Retourne la ligne du catalogue pour un given image_id (parfum_id),
-    ou None si introuvable.
+    Filtres famille / tranches de prix / notes / couleur du flacon, avec le
+    nombre de parfums correspondant à chaque valeur compte tenu des autres
+    filtres. Une facette sans valeur (ex : couleurs pas encore calculées)
+    n'est pas affichée.
+    Retourne le bitset des lignes retenues.
     """
-    if df_catalog is None or df_catalog.empty:
-        return None
+    selection = {
+        facet: st.session_state.get(f"facet_{key_prefix}_{facet}", [])
+        for row in FILTER_FACETS
+        for facet in row
+    }
+    counts = index.counts(selection, base_mask)
+
+    with st.expander("Filtres : famille olfactive, prix, notes, couleur"):
+        for row in FILTER_FACETS:
+            row = [facet for facet in row if index.values(facet)]
+            if not row:
+                continue
+            cols = st.columns(len(row))
+            for col, facet in zip(cols, row):
+                with col:
+                    selection[facet] = st.multiselect(
+                        FACETS[facet],
+                        index.values(facet),
+                        key=f"facet_{key_prefix}_{facet}",
+                        format_func=lambda v, f=facet: f"{v} ({counts[f].get(v, 0)})",
+                    )
+
+    return index.query(selection, base_mask)
 
-    sub = df_catalog[df_catalog["image_id"] == int(image_id)]
-    if sub.empty:
-        return None
-    return sub.iloc[0]
 
-def get_image_path_for_name(name: str) -> str:
+def render_product_grid(df, key_prefix: str, visible_ids=None):
     """
-    Retourne le chemin d'image pour un parfum donné, à partir de df_catalog.
-    On fait une recherche exacte puis insensible à la casse.
+    Page catégorie en grille navigateur (product_grid.py) : la tranche du
+    catalogue part une fois en JSON, seuls les clics reviennent ici.
     """
-    row = get_parfum_by_name(name)
-    if row is None:
-        return ""
-    return row.get("image_path", "") or ""
+    get_thumbnails(CATALOG_VERSION)
+    event = product_grid(
+        get_grid_payload(key_prefix, CATALOG_VERSION),
+        visible_ids=visible_ids,
+        logged_in=st.session_state.get("user") is not None,
+        key=f"product_grid_{key_prefix}",
+    )
+
+    # la valeur du composant reste la même aux reruns suivants : un clic = un seq
+    seen_key = f"grid_seq_{key_prefix}"
+    if not event or event.get("seq") == st.session_state.get(seen_key):
+        return
+    st.session_state[seen_key] = event.get("seq")
+
+    # valeur renvoyée par le navigateur : rien n'y est cru sans vérification
+    try:
+        parfum_id = int(event["id"])
+    except (KeyError, TypeError, ValueError):
+        return
+    if event.get("event") == "open":
+        st.query_params["parfum_id"] = str(parfum_id)
+        do_rerun()
 
-def render_product_list(df, key_prefix: str):
+    row = get_parfum_by_id(parfum_id)
+    if row is None:
+        return
+    name = str(row.get("name", ""))
+    if event.get("event") == "cart":
+        try:
+            qte_ml = int(event.get("qte_ml") or 10)
+            units = max(1, min(20, int(event.get("units") or 1)))
+        except (TypeError, ValueError):
+            return
+        # prix relu dans le catalogue, taille vérifiée (comme les ajouts groupés)
+        items, skipped = add_many_to_cart([(parfum_id, qte_ml, units)])
+        if items:
+            st.toast(f"{name} ajouté au panier.")
+        if skipped:
+            st.toast(f"{name} n'est pas disponible en {qte_ml} ml.")
+    elif event.get("event") == "fav" and st.session_state.get("user") is not None:
+        add_to_favorites(parfum_id)
+        st.toast(f"{name} ajouté aux favoris.")
+
+
+def render_product_list(df, key_prefix: str, view=None):
     """
     Affiche une liste de produits avec :
+    - filtres à facettes + tris précalculés (si `view` est fourni : df est
+      alors le catalogue complet et `view` la CategoryView de la page)
     - recherche
     - tri
     - choix ml
@@ -428,10 +594,23 @@ def render_product_list(df, key_prefix: str):
     - boutons panier/favoris
     - lien fiche parfum
     """
-    if df.empty:
+    if df.empty or (view is not None and not len(view)):
         st.info("Aucun parfum dans cette catégorie.")
         return
 
+    if view is not None:
+        index = get_facet_index(CATALOG_VERSION)
+        mask = render_facet_filters(index, view.mask, key_prefix)
+        selected = None if mask == view.mask else index.to_bool(mask)
+
+        if st.toggle(
+            "Grille rapide (recherche, tri et pages dans le navigateur)",
+            key=f"grid_{key_prefix}",
+        ):
+            visible = None if selected is None else df["image_id"].take(index.positions(mask)).tolist()
+            render_product_grid(df, key_prefix, visible)
+            return
+
     col_search, col_sort = st.columns([2, 1])
 
     with col_search:
@@ -444,20 +623,23 @@ def render_product_list(df, key_prefix: str):
     with col_sort:
         sort = st.selectbox(
             "Trier par",
-            ["Nom A-Z", "Prix 10 ml croissant", "Prix 10 ml décroissant"],
+            SORT_OPTIONS,
             key=f"sort_{key_prefix}",
         )
 
-    if search:
-        df = df[df["name"].str.contains(search, case=False, na=False)]
-
-    if sort == "Prix 10 ml croissant":
+    if view is not None:
+        # page catégorie : simple prise des lignes dans l'ordre précalculé
+        df = df.iloc[view.ordered_positions(sort, selected)]
+    elif sort == "Prix 10 ml croissant":
         df = df.sort_values("price10", ascending=True)
     elif sort == "Prix 10 ml décroissant":
         df = df.sort_values("price10", ascending=False)
     else:
         df = df.sort_values("name", ascending=True)
 
+    if search:
+        df = df[df["name"].str.contains(search, case=False, na=False)]
+
     if df.empty:
         st.info("Aucun parfum ne correspond à la recherche.")
         return
@@ -474,7 +656,7 @@ def render_product_list(df, key_prefix: str):
         col1, col2, col3 = st.columns([1, 2, 1])
 
         with col1:
-            img_path = row.get("image_path", "")
+            img_path = get_image_path(image_id)
             try:
                 if img_path:
                     st.image(img_path, use_container_width=True)
@@ -494,50 +676,50 @@ def render_product_list(df, key_prefix: str):
             )
 
         with col3:
+            # panier ouvert aux visiteurs (gardé dans le navigateur, voir guest_cart.py)
+            qty = st.selectbox(
+                "Quantité (ml)",
+                [10, 20, 30],
+                key=f"qty_{key_prefix}_{idx}",
+            )
+
+            if qty == 10:
+                price = price10
+            elif qty == 20:
+                price = price20
+            else:
+                price = price30
+
+            units = st.number_input(
+                "Nombre de flacons",
+                min_value=1,
+                max_value=20,
+                step=1,
+                value=1,
+                key=f"units_{key_prefix}_{idx}",
+            )
+
+            if st.button(
+                "Ajouter au panier",
+                key=f"add_cart_{key_prefix}_{idx}",
+            ):
+                add_to_cart(image_id, name, price, qty, units)
+                st.success("Ajouté au panier.")
+
             if user is None:
-                st.caption("Connectez-vous pour ajouter au panier ou aux favoris.")
+                st.caption("Connectez-vous pour ajouter aux favoris.")
                 if st.button(
                     "Aller à la page Login / Signup",
                     key=f"login_redirect_{key_prefix}_{idx}",
                 ):
                     st.session_state["page"] = "Login / Signup"
                     do_rerun()
-            else:
-                qty = st.selectbox(
-                    "Quantité (ml)",
-                    [10, 20, 30],
-                    key=f"qty_{key_prefix}_{idx}",
-                )
-
-                if qty == 10:
-                    price = price10
-                elif qty == 20:
-                    price = price20
-                else:
-                    price = price30
-
-                units = st.number_input(
-                    "Nombre de flacons",
-                    min_value=1,
-                    max_value=20,
-                    step=1,
-                    value=1,
-                    key=f"units_{key_prefix}_{idx}",
-                )
-
-                if st.button(
-                    "Ajouter au panier",
-                    key=f"add_cart_{key_prefix}_{idx}",
-                ):
-                    add_to_cart(name, price, qty, units)
-                    st.success("Ajouté au panier.")
-
-                if st.button(
-                    "Ajouter aux favoris",
-                    key=f"add_fav_{key_prefix}_{idx}",
-                ):
-                    add_to_favorites(name)
-                    st.success("Ajouté aux favoris.")
+            elif st.button(
+                "Ajouter aux favoris",
+                key=f"add_fav_{key_prefix}_{idx}",
+            ):
+                add_to_favorites(image_id)
+                st.success("Ajouté aux favoris.")
 
         st.markdown("---")
 
@@ -548,14 +730,13 @@ def render_parfum_detail(df_catalog, compo_map, parfum_id: int):
         st.error("Catalogue vide ou introuvable.")
         return
 
-    sub = df_catalog[df_catalog["image_id"] == parfum_id]
-    if sub.empty:
+    row = parfum_row(df_catalog, parfum_id)  # accès direct, pas de parcours du catalogue
+    if row is None:
         st.error(f"Parfum introuvable pour l'id {parfum_id}.")
         return
 
-    row = sub.iloc[0]
     name = str(row.get("name", "Parfum"))
-    img_path = row.get("image_path", "")
+    img_path = get_image_path(parfum_id)
     price10 = float(row.get("price10", 0) or 0)
     price20 = float(row.get("price20", 0) or 0)
     price30 = float(row.get("price30", 0) or 0)
@@ -581,41 +762,39 @@ def render_parfum_detail(df_catalog, compo_map, parfum_id: int):
 
         st.markdown("---")
         user = st.session_state.get("user")
-        if user is not None:
-            qty_ml = st.selectbox(
-                "Quantité (ml)",
-                [10, 20, 30],
-                key=f"detail_qty_{parfum_id}",
-            )
-            if qty_ml == 10:
-                price = price10
-            elif qty_ml == 20:
-                price = price20
-            else:
-                price = price30
-
-            units = st.number_input(
-                "Nombre de flacons",
-                min_value=1,
-                max_value=20,
-                step=1,
-                value=1,
-                key=f"detail_units_{parfum_id}",
-            )
+        qty_ml = st.selectbox(
+            "Quantité (ml)",
+            [10, 20, 30],
+            key=f"detail_qty_{parfum_id}",
+        )
+        if qty_ml == 10:
+            price = price10
+        elif qty_ml == 20:
+            price = price20
+        else:
+            price = price30
+
+        units = st.number_input(
+            "Nombre de flacons",
+            min_value=1,
+            max_value=20,
+            step=1,
+            value=1,
+            key=f"detail_units_{parfum_id}",
+        )
 
-            if st.button("Ajouter au panier", key=f"detail_add_cart_{parfum_id}"):
-                add_to_cart(name, price, qty_ml, units)
-                st.success("Ajouté au panier.")
+        if st.button("Ajouter au panier", key=f"detail_add_cart_{parfum_id}"):
+            add_to_cart(parfum_id, name, price, qty_ml, units)
+            st.success("Ajouté au panier.")
 
+        if user is not None:
             if st.button("Ajouter aux favoris", key=f"detail_add_fav_{parfum_id}"):
-                add_to_favorites(name)
+                add_to_favorites(parfum_id)
                 st.success("Ajouté aux favoris.")
-        else:
-            pass
 
 
     # Composition
-    comp = compo_map.get(name.upper())
+    comp = compo_map.get(int(parfum_id))
     st.markdown("---")
     if comp:
         st.subheader("Composition olfactive")
@@ -625,6 +804,22 @@ def render_parfum_detail(df_catalog, compo_map, parfum_id: int):
             "La composition de ce parfum n'est pas renseignée dans la base de connaissances."
         )
 
+    # Co-achats : top-k précalculé, lecture en temps constant
+    also_bought = get_copurchase(aggregates_version()).also_bought(int(parfum_id), k=4)
+    if also_bought:
+        st.markdown("---")
+        render_parfum_thumbnails(
+            "Les clients ont aussi acheté", [other for other, _ in also_bought]
+        )
+
+    # Flacons visuellement proches : caractéristiques précalculées, aucune image lue
+    features = get_image_features(CATALOG_VERSION)
+    if features is not None:
+        similar = features.nearest(int(parfum_id), k=4)
+        if similar:
+            st.markdown("---")
+            render_parfum_thumbnails("Flacons similaires", similar)
+
     st.markdown("---")
     st.markdown(
         "Utilisez le menu de gauche pour revenir au catalogue ou modifiez l'URL pour changer de parfum."
@@ -669,16 +864,55 @@ Message :
     msg["From"] = username
     msg["To"] = to_email
 
-    with smtplib.SMTP(host, port) as server:
-        server.starttls()
-        server.login(username, password)
-        server.send_message(msg)
+    # budget de 5 s : au-delà (ou SMTP en panne), le message est mis en file
+    config = {"host": host, "port": port, "username": username, "password": password}
+    return dependencies.send_mail(config, msg)
+
+
+# ================== DÉPENDANCES EXTERNES (REPLIS) ==================
+
+def render_particles():
+    """
+    Animation d'accueil avec la copie locale de particles.js ; sautée tant
+    que la copie n'est pas récupérée (en arrière-plan, voir dependencies.py).
+    """
+    if not dependencies.particles_script_available():
+        return
+    if st.get_option("server.enableStaticServing"):
+        tag = f'<script src="{dependencies.PARTICLES_STATIC_URL}"></script>'
+    else:
+        tag = f"<script>{dependencies.PARTICLES_FILE.read_text(encoding='utf-8')}</script>"
+    components.html(PARTICLES_HTML.replace(PARTICLES_SCRIPT_TAG, tag), height=400, scrolling=False)
+
+
+def render_chatbot_fallback(df, compo_map):
+    """Webchat injoignable : recherche locale dans les fiches (nom, notes, famille)."""
+    st.warning(
+        "Le conseiller virtuel est momentanément indisponible. "
+        "En attendant, cherchez un parfum par nom, note ou famille olfactive."
+    )
+    st.markdown(f"[Ouvrir le chatbot dans un nouvel onglet]({dependencies.CHATBOT_URL})")
+    query = st.text_input("Nom, note ou famille", key="chatbot_fallback_query",
+                          placeholder="Ex : vanille, boisé, Sauvage...")
+    if not query:
+        return
+    term = query.strip().lower()
+    hits = [
+        (int(image_id), name)
+        for image_id, name in zip(df["image_id"], df["name"])
+        if term in str(name).lower() or term in str(compo_map.get(int(image_id), "")).lower()
+    ]
+    if not hits:
+        st.info("Aucun parfum ne correspond.")
+    for image_id, name in hits[:10]:
+        st.markdown(f"- [{name}](?parfum_id={image_id})")
 
 
 # ================== DONNÉES & ÉTAT ==========================
 
-df_catalog = load_catalog()
-compo_map = load_compositions()
+CATALOG_VERSION = catalog_version()
+df_catalog = load_catalog(CATALOG_VERSION)
+compo_map = load_compositions_by_id(CATALOG_VERSION)
 ensure_session_state()
 
 
@@ -694,6 +928,7 @@ if parfum_id_param is not None:
     try:
         pid = int(parfum_id_param)
         render_parfum_detail(df_catalog, compo_map, pid)
+        persist_guest_cart()
         st.stop()
     except ValueError:
         # si l'id n'est pas un entier, on continue normalement
@@ -707,6 +942,7 @@ PAGES = [
     "Parfums homme",
     "Parfums femme",
     "Parfums mixte / niche",
+    "Coffret découverte",
     "Chatbot",
     "Panier",
     "Historique d'achat",
@@ -745,6 +981,7 @@ if page_radio != st.session_state["page"]:
     do_rerun()
 
 page = st.session_state["page"]
+metrics.RERUNS.inc(page=page)
 
 st.sidebar.markdown("---")
 st.sidebar.caption("Projet Botpress + Streamlit — DJERIPERFUM")
@@ -755,7 +992,7 @@ if page == "Accueil":
     st.title("DJERIPERFUM – Boutique de décants + conseiller virtuel")
 
     # Animation de fond
-    components.html(PARTICLES_HTML, height=400, scrolling=False)
+    render_particles()
 
     # Contenu de la page d'accueil
 
@@ -792,7 +1029,7 @@ elif page == "Promotions":
                 continue
 
             name = str(row.get("name", promo["label"]))
-            img_path = row.get("image_path", "")
+            img_path = get_image_path(image_id)
 
             col_img, col_info, col_actions = st.columns([1, 2, 2])
 
@@ -843,7 +1080,7 @@ elif page == "Promotions":
                         key=f"promo_add_cart_{idx}",
                     ):
                         # On utilise le prix promo + qte_ml promo
-                        add_to_cart(name, new_price, qte_ml, units)
+                        add_to_cart(image_id, name, new_price, qte_ml, units)
                         st.success("Ajouté au panier avec la promotion.")
 
             st.markdown("---")
@@ -855,9 +1092,9 @@ elif page == "Parfums homme":
     if df_catalog.empty:
         st.warning("Catalogue vide ou fichier CSV manquant.")
     else:
-        df = df_catalog[df_catalog["category"].str.contains("Homme", na=False)]
-        st.write(f"{len(df)} références trouvées dans cette catégorie.")
-        render_product_list(df, "homme")
+        view = get_category_views(CATALOG_VERSION)["homme"]
+        st.write(f"{len(view)} références trouvées dans cette catégorie.")
+        render_product_list(df_catalog, "homme", view=view)
 
 elif page == "Parfums femme":
     st.title("Parfums Femme")
@@ -866,9 +1103,9 @@ elif page == "Parfums femme":
     if df_catalog.empty:
         st.warning("Catalogue vide ou fichier CSV manquant.")
     else:
-        df = df_catalog[df_catalog["category"].str.contains("Femme", na=False)]
-        st.write(f"{len(df)} références trouvées dans cette catégorie.")
-        render_product_list(df, "femme")
+        view = get_category_views(CATALOG_VERSION)["femme"]
+        st.write(f"{len(view)} références trouvées dans cette catégorie.")
+        render_product_list(df_catalog, "femme", view=view)
 
 elif page == "Parfums mixte / niche":
     st.title("Parfums Mixte / Niche")
@@ -877,12 +1114,77 @@ elif page == "Parfums mixte / niche":
     if df_catalog.empty:
         st.warning("Catalogue vide ou fichier CSV manquant.")
     else:
-        df = df_catalog[
-            df_catalog["category"].str.contains("Niche", na=False)
-            | df_catalog["category"].str.contains("Mixte", na=False)
-        ]
-        st.write(f"{len(df)} références trouvées dans cette catégorie.")
-        render_product_list(df, "mixte")
+        view = get_category_views(CATALOG_VERSION)["mixte"]
+        st.write(f"{len(view)} références trouvées dans cette catégorie.")
+        render_product_list(df_catalog, "mixte", view=view)
+
+elif page == "Coffret découverte":
+    st.title("Coffret découverte sous budget")
+    st.write(
+        "Indiquez votre budget et vos envies : nous composons les meilleurs "
+        "coffrets de décants possibles, un parfum différent par décant."
+    )
+
+    if df_catalog.empty:
+        st.warning("Catalogue vide ou fichier CSV manquant.")
+    else:
+        index = get_facet_index(CATALOG_VERSION)
+        notes_options = sorted({note for facet in NOTE_FACETS for note in index.bits.get(facet, {})})
+
+        with st.form("decant_set_form"):
+            col_budget, col_prefs = st.columns(2)
+            with col_budget:
+                budget = st.number_input(
+                    "Budget (DH)", min_value=100, max_value=10000, value=600, step=50, key="set_budget"
+                )
+                count_min, count_max = st.slider("Nombre de décants", 1, 10, (3, 5), key="set_counts")
+                sizes = st.multiselect(
+                    "Tailles acceptées (ml)", list(DECANT_SIZES), default=list(DECANT_SIZES), key="set_sizes"
+                )
+                category = st.selectbox(
+                    "Catégorie", ["Toutes", *CATEGORY_PAGES], key="set_category",
+                    format_func=lambda key: key.capitalize(),
+                )
+            with col_prefs:
+                families = st.multiselect(
+                    "Familles olfactives préférées", sorted(index.bits.get("famille", {})), key="set_families"
+                )
+                notes = st.multiselect("Notes préférées", notes_options, key="set_notes")
+                max_per_family = st.slider("Parfums max. par famille olfactive", 1, 5, 2, key="set_max_family")
+            submitted = st.form_submit_button("Composer mon coffret")
+
+        if submitted:
+            candidates = None
+            if category != "Toutes":
+                candidates = index.positions(get_category_views(CATALOG_VERSION)[category].mask)
+            st.session_state["decant_sets"] = (CATALOG_VERSION, best_sets(
+                df_catalog[list(DECANT_PRICE_COLUMNS)].to_numpy(dtype=float, na_value=0.0),
+                preference_scores(index, families, notes),
+                family_labels(index),
+                budget,
+                counts=range(count_min, count_max + 1),
+                sizes=sorted(sizes),
+                max_per_family=max_per_family,
+                candidates=candidates,
+            ))
+
+        version, sets = st.session_state.get("decant_sets", (None, None))
+        if sets is not None and version == CATALOG_VERSION:
+            if not sets:
+                st.info("Aucun coffret ne tient dans ce budget : augmentez-le ou acceptez plus de tailles.")
+            for result in sets:
+                st.subheader(f"{result['count']} décants — {result['total']:.0f} DH")
+                lines = []
+                for position, qte_ml in result["items"]:
+                    row = df_catalog.iloc[position]
+                    price = float(row.get(f"price{qte_ml}", 0) or 0)
+                    lines.append((int(row["image_id"]), qte_ml, 1))
+                    st.markdown(
+                        f"- [{row['name']}](?parfum_id={int(row['image_id'])}) — {qte_ml} ml : {price:.0f} DH"
+                    )
+                if st.button("Ajouter ce coffret au panier", key=f"add_set_{result['count']}"):
+                    report_bulk_add(*add_many_to_cart(lines))
+                st.markdown("---")
 
 elif page == "Chatbot":
     st.title("Assistant DJERIPERFUM (Botpress)")
@@ -893,15 +1195,18 @@ elif page == "Chatbot":
     """
     )
 
-    st.components.v1.iframe(CHATBOT_URL, height=600, scrolling=True)
+    # état du webchat sondé en arrière-plan : la page n'attend jamais Botpress
+    if dependencies.chatbot_available():
+        st.components.v1.iframe(dependencies.CHATBOT_URL, height=600, scrolling=True)
+    else:
+        render_chatbot_fallback(df_catalog, compo_map)
 
 elif page == "Panier":
     st.title("Votre panier")
-    require_login()
+    # un visiteur voit et modifie son panier (gardé dans le navigateur) ;
+    # il se connecte pour valider, le panier est alors fusionné au compte
 
     cart = st.session_state["cart"]
-    cart = normalize_cart_items(cart)
-    st.session_state["cart"] = cart
 
     if not cart:
         st.info("Votre panier est vide.")
@@ -919,20 +1224,12 @@ elif page == "Panier":
             changed = False
 
             for i, item in enumerate(cart):
-                name = item["name"]
-                price = float(item["price"])
-                qte = item["qte_ml"]
-                units = int(item.get("units", 1))
-                parfum_row = get_parfum_by_name(name)
-                image_path = ""
-                image_id = None
-                if parfum_row is not None:
-                    image_path = parfum_row.get("image_path", "") or ""
-                    image_id = (
-                        int(parfum_row.get("image_id"))
-                        if "image_id" in parfum_row
-                        else None
-                    )
+                name = item.name
+                price = item.price
+                qte = item.qte_ml
+                units = item.units
+                image_id = item.parfum_id
+                image_path = get_image_path(image_id, "thumb")
 
                 # 5 colonnes : image | détails | qté flacons | prix | suppression
                 cols = st.columns([1, 3, 2, 2, 2])
@@ -961,11 +1258,11 @@ elif page == "Panier":
                         key=f"cart_units_{i}",
                     )
                     if new_units != units:
-                        cart[i]["units"] = int(new_units)
+                        item.units = int(new_units)
                         changed = True
 
                 with cols[3]:
-                    line_total = price * cart[i]["units"]
+                    line_total = item.line_total
                     st.write(f"Prix unitaire : {price:.0f} DH")
                     st.write(f"Total ligne : {line_total:.0f} DH")
                     total += line_total
@@ -988,50 +1285,80 @@ elif page == "Panier":
             st.markdown("---")
             st.write(f"**Total : {total:.0f} DH**")
 
-            if st.button("Valider l'achat"):
-                st.session_state["history"].append(
-                    {
-                        "items": cart.copy(),
-                        "total": total,
-                        "timestamp": datetime.now().isoformat(),
-                    }
+            if st.session_state.get("user") is None:
+                st.info(
+                    "Connectez-vous ou créez un compte pour valider la commande : "
+                    "votre panier sera conservé."
+                )
+                if st.button("Se connecter", key="cart_login_btn"):
+                    st.session_state["page"] = "Login / Signup"
+                    do_rerun()
+            elif st.button("Valider l'achat"):
+                wait = check_rate_limit("checkout", st.session_state.get("user"))
+                if wait:
+                    metrics.CHECKOUTS.inc(result="rate_limited")
+                    st.error(rate_limit_message(wait))
+                else:
+                    with metrics.CHECKOUT_SECONDS.time():
+                        # chargés (ou amorcés) avant d'enregistrer la commande,
+                        # pour ne pas la compter deux fois
+                        version = aggregates_version()
+                        order_index, copurchase = get_order_index(version), get_copurchase(version)
+                        order = Order(
+                            items=cart.copy(),
+                            total=total,
+                            timestamp=datetime.now().isoformat(),
+                            order_id=uuid.uuid4().hex,
+                        )
+                        st.session_state["history"].append(order)
+                        st.session_state["cart"] = []
+                        sync_current_user_to_file()
+                        order_index.add_order(st.session_state["user"], order)
+                        copurchase.record([[item.parfum_id for item in order.items]])
+                    metrics.CHECKOUTS.inc(result="ok")
+                    st.success("Achat validé et ajouté à l'historique.")
+
+            if st.session_state["cart"]:
+                st.markdown("---")
+                suggestions = get_copurchase(aggregates_version()).for_basket(
+                    [item.parfum_id for item in st.session_state["cart"]], k=4
+                )
+                render_parfum_thumbnails(
+                    "Les clients ont aussi acheté", [other for other, _ in suggestions]
                 )
-                st.session_state["cart"] = []
-                sync_current_user_to_file()
-                st.success("Achat validé et ajouté à l'historique.")
 
 elif page == "Historique d'achat":
     st.title("Historique d'achat")
     require_login()
 
-    history = st.session_state["history"]
+    # anciennes commandes (archives compressées) + commandes récentes ; une
+    # session ouverte avant une compaction garde encore les commandes
+    # archivées depuis : on les retire pour ne pas les afficher deux fois
+    user = st.session_state["user"]
+    archived = load_archived_orders(user, order_archive.archive_version())
+    recent = order_archive.hot_orders(
+        st.session_state["history"], order_archive.archive_entry(user)
+    )
+    history = archived + recent
     if not history:
         st.info("Aucun achat pour le moment.")
     else:
         for i, order in enumerate(history, start=1):
             st.subheader(f"Achat {i}")
-            ts = order.get("timestamp")
+            ts = order.timestamp
             if ts:
                 try:
                     dt = datetime.fromisoformat(ts)
                     st.caption(dt.strftime("Date et heure : %d/%m/%Y %H:%M"))
                 except Exception:
                     st.caption(f"Date et heure : {ts}")
-            for item in order["items"]:
-                units = int(item.get("units", 1))
-                name = item["name"]
-                qte = item["qte_ml"]
-                price = float(item["price"])
-                parfum_row = get_parfum_by_name(name)
-                image_path = ""
-                image_id = None
-                if parfum_row is not None:
-                    image_path = parfum_row.get("image_path", "") or ""
-                    image_id = (
-                        int(parfum_row.get("image_id"))
-                        if "image_id" in parfum_row
-                        else None
-                    )
+            for item in order.items:
+                units = item.units
+                name = item.name
+                qte = item.qte_ml
+                price = item.price
+                image_id = item.parfum_id
+                image_path = get_image_path(image_id, "thumb")
 
                 cols = st.columns([1, 4])
 
@@ -1053,7 +1380,11 @@ elif page == "Historique d'achat":
                             f"- **{name}** — {qte} ml — {units} flacon(s) — {price:.0f} DH / flacon"
                         )
 
-            st.write(f"Total : {order['total']:.0f} DH")
+            st.write(f"Total : {order.total:.0f} DH")
+            if st.button("Recommander", key=f"reorder_{i}", help="Remettre toute la commande dans le panier, aux prix actuels."):
+                report_bulk_add(*add_many_to_cart(
+                    [(item.parfum_id, item.qte_ml, item.units) for item in order.items]
+                ))
             st.markdown("---")
 
 elif page == "Favoris":
@@ -1064,17 +1395,24 @@ elif page == "Favoris":
     if not favs:
         st.info("Aucun parfum en favori.")
     else:
-        for name in sorted(favs):
-            parfum_row = get_parfum_by_name(name)
-            image_path = ""
-            image_id = None
-            if parfum_row is not None:
-                image_path = parfum_row.get("image_path", "") or ""
-                image_id = (
-                    int(parfum_row.get("image_id"))
-                    if "image_id" in parfum_row
-                    else None
-                )
+        rows = [get_parfum_by_id(parfum_id) for parfum_id in favs]
+        rows = sorted((row for row in rows if row is not None), key=lambda row: str(row["name"]))
+
+        col_qty, col_add = st.columns([1, 2])
+        with col_qty:
+            bulk_qty = st.selectbox("Quantité (ml)", [10, 20, 30], key="fav_bulk_qty")
+        with col_add:
+            st.write("")
+            if st.button("Tout ajouter au panier", key="fav_add_all"):
+                report_bulk_add(*add_many_to_cart(
+                    [(int(row["image_id"]), bulk_qty, 1) for row in rows]
+                ))
+        st.markdown("---")
+
+        for row in rows:
+            name = str(row["name"])
+            image_id = int(row["image_id"])
+            image_path = get_image_path(image_id, "thumb")
 
             cols = st.columns([1, 4])
 
@@ -1086,10 +1424,7 @@ elif page == "Favoris":
                         pass
 
             with cols[1]:
-                if image_id is not None:
-                    st.markdown(f"[**{name}**](?parfum_id={image_id})")
-                else:
-                    st.write(f"- **{name}**")
+                st.markdown(f"[**{name}**](?parfum_id={image_id})")
 
 
 elif page == "Me contacter":
@@ -1119,15 +1454,26 @@ elif page == "Me contacter":
         submitted = st.form_submit_button("Envoyer")
 
         if submitted:
-            if not nom or not email or not message:
+            wait = check_rate_limit("contact", st.session_state.get("user"))
+            if wait:
+                st.error(rate_limit_message(wait))
+            elif not nom or not email or not message:
                 st.error("Merci de remplir au minimum votre nom, email et message.")
             else:
                 try:
-                    send_contact_email(nom, email, objet, message)
-                    st.success(
-                        "Message envoyé avec succès. Nous vous répondrons dès que possible."
-                    )
+                    status = send_contact_email(nom, email, objet, message)
+                    metrics.CONTACT_EMAILS.inc(result=status)
+                    if status == "sent":
+                        st.success(
+                            "Message envoyé avec succès. Nous vous répondrons dès que possible."
+                        )
+                    else:
+                        st.success(
+                            "Message enregistré : le service d'envoi est momentanément lent, "
+                            "il sera transmis dès que possible."
+                        )
                 except Exception as e:
+                    metrics.CONTACT_EMAILS.inc(result="failed")
                     st.error(
                         "Une erreur est survenue lors de l'envoi du message. "
                         "Vérifiez la configuration de l'email dans secrets.toml."
@@ -1145,9 +1491,15 @@ elif page == "Login / Signup":
         username = st.text_input("Nom d'utilisateur", key="login_user")
         password = st.text_input("Mot de passe", type="password", key="login_pass")
         if st.button("Se connecter"):
-            if login_user(username, password):
+            wait = check_rate_limit("login", username)
+            if wait:
+                metrics.LOGINS.inc(result="rate_limited")
+                st.error(rate_limit_message(wait))
+            elif login_user(username, password):
+                metrics.LOGINS.inc(result="ok")
                 st.success("Connexion réussie.")
             else:
+                metrics.LOGINS.inc(result="failed")
                 st.error("Identifiants incorrects.")
 
     with tab2:
@@ -1157,10 +1509,15 @@ elif page == "Login / Signup":
             "Nouveau mot de passe", type="password", key="signup_pass"
         )
         if st.button("Créer le compte"):
-            if not new_user or not new_pass:
+            wait = check_rate_limit("signup", new_user)
+            if wait:
+                metrics.SIGNUPS.inc(result="rate_limited")
+                st.error(rate_limit_message(wait))
+            elif not new_user or not new_pass:
                 st.error("Veuillez saisir un nom d'utilisateur et un mot de passe.")
             else:
                 ok, msg = signup_user(new_user, new_pass)
+                metrics.SIGNUPS.inc(result="ok" if ok else "exists")
                 if ok:
                     st.success(msg)
                 else:
@@ -1184,59 +1541,200 @@ elif page == "Admin":
     if not is_admin():
         st.error("Accès réservé à l’administrateur.")
     else:
-        users = load_users()
-
-        rows = []
-        for username, data in users.items():
-            history = data.get("history", [])
-            for order in history:
-                ts = order.get("timestamp")
-                total_cmd = float(order.get("total", 0) or 0)
-
-                for item in order.get("items", []):
-                    name = item.get("name")
-                    qte_ml = item.get("qte_ml")
-                    units = int(item.get("units", 1))
-                    price_unit = float(item.get("price", 0) or 0)
-                    total_ligne = price_unit * units
-
-                    rows.append(
-                        {
-                            "user": username,
-                            "timestamp": ts,
-                            "parfum": name,
-                            "qte_ml": qte_ml,
-                            "nb_flacons": units,
-                            "prix_unitaire_DH": price_unit,
-                            "total_ligne_DH": total_ligne,
-                            "total_commande_DH": total_cmd,
-                        }
-                    )
+        archive_index = order_archive.load_index()
+        # index des commandes (users.json + archives), filtré et paginé côté serveur
+        order_index = get_order_index(aggregates_version())
 
-        if not rows:
+        if not len(order_index):
             st.info("Aucune commande enregistrée pour le moment.")
         else:
-            df_cmd = pd.DataFrame(rows)
-
-            st.subheader("Toutes les commandes")
-            st.dataframe(df_cmd, use_container_width=True)
-
-            # Bouton pour télécharger les commandes en CSV
-            csv_data = df_cmd.to_csv(index=False).encode("utf-8")
-            st.download_button(
-                label="Télécharger les commandes (CSV)",
-                data=csv_data,
-                file_name="commandes_clients.csv",
-                mime="text/csv",
+            st.subheader("Commandes clients")
+
+            col_client, col_parfum, col_dates = st.columns(3)
+            with col_client:
+                client = st.selectbox(
+                    "Client", ["(tous)"] + order_index.users(), key="admin_client"
+                )
+            with col_parfum:
+                parfum = st.selectbox(
+                    "Parfum", ["(tous)"] + order_index.parfums(), key="admin_parfum"
+                )
+            with col_dates:
+                period = st.date_input("Période", value=(), key="admin_period")
+
+            col_min, col_max, col_sort, col_desc = st.columns(4)
+            with col_min:
+                min_amount = st.number_input(
+                    "Montant ligne min (DH)", min_value=0.0, step=50.0, key="admin_min"
+                )
+            with col_max:
+                max_amount = st.number_input(
+                    "Montant ligne max (DH, 0 = sans limite)",
+                    min_value=0.0,
+                    step=50.0,
+                    key="admin_max",
+                )
+            with col_sort:
+                sort_label = st.selectbox("Trier par", list(ORDER_SORT_KEYS), key="admin_sort")
+            with col_desc:
+                descending = st.checkbox("Ordre décroissant", value=True, key="admin_desc")
+
+            # date_input renvoie 0, 1 ou 2 dates selon la sélection
+            period = list(period) if isinstance(period, (list, tuple)) else [period]
+            filters = {
+                "user": None if client == "(tous)" else client,
+                "parfum": None if parfum == "(tous)" else parfum,
+                "date_from": datetime.combine(period[0], datetime.min.time()) if period else None,
+                "date_to": (
+                    datetime.combine(period[1], datetime.min.time()) + timedelta(days=1)
+                    if len(period) > 1
+                    else None
+                ),
+                "min_amount": min_amount or None,
+                "max_amount": max_amount or None,
+                "sort": ORDER_SORT_KEYS[sort_label],
+                "descending": descending,
+            }
+
+            page_num = st.number_input("Page", min_value=1, step=1, key="admin_page")
+            page_rows, nb_rows = order_index.query(
+                **filters, page=page_num - 1, page_size=ADMIN_PAGE_SIZE
+            )
+            nb_pages = max(1, -(-nb_rows // ADMIN_PAGE_SIZE))
+            if page_num > nb_pages:
+                page_num = nb_pages
+                page_rows, nb_rows = order_index.query(
+                    **filters, page=page_num - 1, page_size=ADMIN_PAGE_SIZE
+                )
+            st.caption(
+                f"{nb_rows} ligne(s) de commande — page {page_num} / {nb_pages}"
+            )
+            st.dataframe(
+                pd.DataFrame(page_rows, columns=ORDER_COLUMNS),
+                use_container_width=True,
             )
 
+            # Export CSV du filtre courant (toutes les pages), à la demande
+            if st.button("Préparer l'export CSV (filtre courant)"):
+                all_rows, _ = order_index.query(**filters, page_size=max(1, nb_rows))
+                st.download_button(
+                    label="Télécharger les commandes (CSV)",
+                    data=pd.DataFrame(all_rows, columns=ORDER_COLUMNS)
+                    .to_csv(index=False)
+                    .encode("utf-8"),
+                    file_name="commandes_clients.csv",
+                    mime="text/csv",
+                )
+
+            if st.button("Recharger les commandes depuis le disque"):
+                get_order_index.clear()
+                do_rerun()
+
             # (optionnel) Petit résumé par client
             st.markdown("---")
             st.subheader("Résumé par client")
-            resume = (
-                df_cmd.groupby("user")["total_commande_DH"]
-                .max()
-                .reset_index()
-                .rename(columns={"total_commande_DH": "montant_max_commande_DH"})
+            st.dataframe(
+                pd.DataFrame(order_index.user_summary()),
+                use_container_width=True,
+            )
+
+        # Compaction : les vieilles commandes quittent users.json
+        st.markdown("---")
+        st.subheader("Archivage des anciennes commandes")
+        st.caption(
+            f"{len(archive_index['segments'])} segment(s) d'archive, "
+            f"{sum(b['count'] for u in archive_index['users'].values() for b in u['blocks'])} "
+            "commande(s) archivée(s)."
+        )
+        days = st.number_input(
+            "Archiver les commandes de plus de (jours)",
+            min_value=1,
+            step=1,
+            value=order_archive.ARCHIVE_AFTER_DAYS,
+            key="archive_days",
+        )
+        if st.button("Lancer la compaction"):
+            users = load_users()
+            result = order_archive.compact(users, int(days))
+            if result["orders"]:
+                save_users(users)
+                get_order_index.clear()  # colonne "archivee" à jour
+            st.success(
+                f"{result['orders']} commande(s) archivée(s) "
+                f"pour {result['users']} client(s)."
             )
-            st.dataframe(resume, use_container_width=True)
+
+        # Commandes prises sur Instagram / Botpress : import groupé (order_ingest.py)
+        st.markdown("---")
+        st.subheader("Importer des commandes (canaux de vente)")
+        st.caption(
+            "Fichier JSONL, une commande par ligne (order_id, user, channel, timestamp, items). "
+            "Une commande déjà importée (même order_id) est ignorée."
+        )
+        batch = st.file_uploader("Lot de commandes", type=["jsonl", "json", "txt"], key="ingest_file")
+        create_users = st.checkbox("Créer les comptes clients inconnus", key="ingest_create_users")
+        if batch is not None and st.button("Importer le lot"):
+            users = load_users()
+            result = order_ingest.ingest(
+                batch.getvalue().decode("utf-8").splitlines(),
+                users,
+                df_catalog,
+                get_name_resolver(CATALOG_VERSION),
+                create_users=create_users,
+            )
+            if result["accepted"] or result["archived"] or result["new_users"]:
+                # agrégats chargés avant l'écriture (comme à la validation d'un
+                # achat) : amorcés après, ils compteraient déjà le lot, puis
+                # update_aggregates l'ajouterait une seconde fois
+                version = aggregates_version()
+                order_index, copurchase = get_order_index(version), get_copurchase(version)
+                order_ingest.write_archived(result)  # commandes antidatées, avant users.json
+                save_users(users)  # une seule écriture pour tout le lot
+                order_ingest.update_aggregates(
+                    result["accepted"], order_index, copurchase, archived=result["archived"]
+                )
+            st.success(
+                f"{len(result['accepted']) + len(result['archived'])} commande(s) importée(s) "
+                f"sur {result['read']} (dont {len(result['archived'])} antidatée(s), archivée(s)), "
+                f"{result['duplicates']} déjà connue(s), {len(result['new_users'])} compte(s) créé(s)."
+            )
+            if result["errors"]:
+                st.warning(f"{len(result['errors'])} ligne(s) rejetée(s).")
+                st.dataframe(
+                    pd.DataFrame(result["errors"], columns=["ligne", "raison"]),
+                    use_container_width=True,
+                )
+
+        # Dépendances externes : disjoncteurs + messages de contact en attente
+        st.markdown("---")
+        st.subheader("Dépendances externes")
+        st.dataframe(pd.DataFrame(dependencies.DEPENDENCIES.stats()), use_container_width=True)
+        pending = dependencies.outbox_size()
+        if pending:
+            st.caption(
+                f"{pending} message(s) de contact en attente d'envoi "
+                "(python manage.py send-outbox)."
+            )
+
+        # Compteurs du rate limiting (login, signup, contact, achat)
+        st.markdown("---")
+        st.subheader("Limitation de débit")
+        limiter = get_rate_limiter()
+        st.dataframe(pd.DataFrame(limiter.stats()), use_container_width=True)
+        top = limiter.top_rejected()
+        if top:
+            st.caption("Clés les plus souvent bloquées")
+            st.dataframe(
+                pd.DataFrame(top, columns=["action", "cle", "rejets"]),
+                use_container_width=True,
+            )
+
+        # Métriques du process (même texte que l'endpoint / le fichier exporté)
+        with st.expander("Métriques (format Prometheus)"):
+            st.code(metrics.REGISTRY.render(), language="text")
+
+
+# ================== PANIER INVITÉ ==================
+
+# en fin de script : la copie du navigateur reflète les ajouts de ce rerun
+persist_guest_cart()
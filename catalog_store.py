@@ -0,0 +1,166 @@
+"""
+Instantané colonnaire du catalogue (Arrow IPC), partagé entre les process.
+
+Quand plusieurs process Streamlit tournent sur la même machine, chacun
+relisait le CSV et parfums_composition.txt et gardait sa propre copie du
+catalogue et de tout ce qui en dérive. Ici, une étape de build écrit une
+fois pour toutes, dans .cache/catalog/ :
+
+    catalog.arrow   une ligne par parfum (colonnes du CSV, image_path,
+                    composition)
+    facets.arrow    bitsets des facettes : (facette, valeur, bits)
+    views.arrow     vues catégorie : (page, tri, positions)
+
+Les fichiers ne sont pas compressés : chaque process les ouvre en
+memory-map (lecture seule), et les colonnes du DataFrame pointent
+directement dans les pages du fichier. La mémoire du catalogue est donc
+partagée par le cache disque de l'OS, et le démarrage se réduit à un mmap.
+
+Chaque fichier porte la version du catalogue (shop_data.catalog_version)
+qui l'a produit ; un instantané périmé est ignoré.
+"""
+import os
+from collections.abc import Mapping
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+
+from catalog_views import CategoryView
+from facets import FacetIndex
+
+SNAPSHOT_DIR = ".cache/catalog"
+CATALOG_FILE = "catalog.arrow"
+FACETS_FILE = "facets.arrow"
+VIEWS_FILE = "views.arrow"
+VERSION_KEY = b"catalog_version"
+
+
+def _write_table(table: pa.Table, path: Path, version: str):
+    table = table.replace_schema_metadata({VERSION_KEY: version.encode("utf-8")})
+    tmp = path.with_name(path.name + ".tmp")
+    with pa.OSFile(str(tmp), "wb") as sink:
+        with pa.ipc.new_file(sink, table.schema) as writer:
+            writer.write_table(table)
+    os.replace(tmp, path)
+
+
+def _map_table(path: Path, version: str):
+    """Table Arrow memory-mappée, ou None si absente / d'une autre version."""
+    try:
+        source = pa.memory_map(str(path), "r")
+        table = pa.ipc.open_file(source).read_all()
+    except (OSError, pa.ArrowInvalid):
+        return None
+    metadata = table.schema.metadata or {}
+    if metadata.get(VERSION_KEY, b"").decode("utf-8") != version:
+        return None
+    return table
+
+
+def write_snapshot(version: str, df, compositions_by_id: dict, facet_index, views: dict, directory=SNAPSHOT_DIR):
+    """Écrit les trois fichiers de l'instantané (remplacement atomique de chacun)."""
+    directory = Path(directory)
+    directory.mkdir(parents=True, exist_ok=True)
+
+    catalog = pa.Table.from_pandas(df, preserve_index=False)
+    compositions = [compositions_by_id.get(int(i)) for i in df["image_id"]] if len(df) else []
+    catalog = catalog.append_column("composition", pa.array(compositions, type=pa.string()))
+
+    facets = {"facet": [], "value": [], "bits": []}
+    for facet, values in facet_index.bits.items():
+        for value, bits in values.items():
+            facets["facet"].append(facet)
+            facets["value"].append(value)
+            facets["bits"].append(bits.to_bytes((facet_index.size + 7) // 8, "little"))
+    facets = pa.table({
+        "facet": pa.array(facets["facet"], type=pa.string()),
+        "value": pa.array(facets["value"], type=pa.string()),
+        "bits": pa.array(facets["bits"], type=pa.binary()),
+    })
+
+    rows = {"page": [], "sort": [], "positions": []}
+    for page, view in views.items():
+        for sort, order in view.orders.items():
+            rows["page"].append(page)
+            rows["sort"].append(sort)
+            rows["positions"].append(np.asarray(order, dtype=np.int32))
+    views_table = pa.table({
+        "page": pa.array(rows["page"], type=pa.string()),
+        "sort": pa.array(rows["sort"], type=pa.string()),
+        "positions": pa.array(rows["positions"], type=pa.list_(pa.int32())),
+    })
+
+    # le catalogue en dernier : il sert de témoin de fraîcheur à open_snapshot
+    _write_table(facets, directory / FACETS_FILE, version)
+    _write_table(views_table, directory / VIEWS_FILE, version)
+    _write_table(catalog, directory / CATALOG_FILE, version)
+
+
+class CompositionMap(Mapping):
+    """{parfum_id: composition} lu directement dans la colonne Arrow (pas de copie en dict)."""
+
+    def __init__(self, column: pa.ChunkedArray, image_ids):
+        self.column = column
+        self.positions = {int(i): pos for pos, i in enumerate(image_ids)}
+
+    def __getitem__(self, parfum_id):
+        value = self.column[self.positions[parfum_id]].as_py()
+        if value is None:
+            raise KeyError(parfum_id)
+        return value
+
+    def __iter__(self):
+        return (i for i, pos in self.positions.items() if self.column[pos].is_valid)
+
+    def __len__(self):
+        return len(self.positions) - self.column.null_count
+
+
+class CatalogSnapshot:
+    """Instantané ouvert : catalogue, compositions, facettes et vues catégorie."""
+
+    def __init__(self, catalog: pa.Table, facets: pa.Table, views: pa.Table):
+        self.table = catalog
+        self._facets = facets
+        self._views = views
+        # colonnes adossées à Arrow : pas de conversion vers des tableaux numpy / objets Python
+        self.catalog = catalog.drop_columns(["composition"]).to_pandas(types_mapper=pd.ArrowDtype)
+
+    @property
+    def compositions(self) -> CompositionMap:
+        return CompositionMap(self.table.column("composition"), self.catalog["image_id"].tolist())
+
+    def facet_index(self) -> FacetIndex:
+        index = FacetIndex(self.table.num_rows)
+        for facet, value, bits in zip(*(self._facets.column(c).to_pylist() for c in ("facet", "value", "bits"))):
+            index.bits.setdefault(facet, {})[value] = int.from_bytes(bits, "little")
+        return index
+
+    def views(self, facet_index, categories: dict) -> dict:
+        """
+        {page: CategoryView}, ou None si une page manque ; les positions
+        restent des vues sur le fichier.
+        """
+        orders = {}
+        pages = self._views.column("page").to_pylist()
+        sorts = self._views.column("sort").to_pylist()
+        positions = self._views.column("positions").combine_chunks()
+        for i, (page, sort) in enumerate(zip(pages, sorts)):
+            orders.setdefault(page, {})[sort] = positions[i].values.to_numpy(zero_copy_only=True)
+        if any(page not in orders for page in categories):
+            return None  # pages catégorie modifiées depuis le build
+        return {
+            page: CategoryView(facet_index.mask("category", values), orders.get(page, {}))
+            for page, values in categories.items()
+        }
+
+
+def open_snapshot(version: str, directory=SNAPSHOT_DIR):
+    """CatalogSnapshot memory-mappé, ou None si l'instantané manque ou est périmé."""
+    directory = Path(directory)
+    tables = [_map_table(directory / name, version) for name in (CATALOG_FILE, FACETS_FILE, VIEWS_FILE)]
+    if any(table is None for table in tables):
+        return None
+    return CatalogSnapshot(*tables)
@@ -0,0 +1,81 @@
+"""
+Vues matérialisées des pages catégorie (homme, femme, mixte / niche).
+
+Pour une version donnée du catalogue, on précalcule une fois pour chaque
+catégorie : son bitset de lignes et ses permutations de tri ("Nom A-Z",
+"Prix 10 ml croissant", "Prix 10 ml décroissant"). Afficher une page triée
+revient alors à prendre df.iloc[permutation] au lieu de filtrer puis trier
+le catalogue à chaque rerun.
+"""
+import unicodedata
+
+import numpy as np
+
+SORT_OPTIONS = ["Nom A-Z", "Prix 10 ml croissant", "Prix 10 ml décroissant"]
+
+
+def collation_key(name: str) -> tuple:
+    """
+    Clé de tri "à la française" : on compare d'abord sans accents ni casse
+    (É ~ E, œ ~ oe), puis sur le nom brut pour départager les égalités.
+    """
+    name = str(name)
+    plain = unicodedata.normalize("NFKD", name).replace("œ", "oe").replace("Œ", "OE")
+    plain = "".join(c for c in plain if not unicodedata.combining(c))
+    return (plain.casefold(), name)
+
+
+class CategoryView:
+    """Lignes d'une catégorie + leurs ordres de tri précalculés."""
+
+    __slots__ = ("mask", "orders")
+
+    def __init__(self, mask: int, orders: dict):
+        self.mask = mask
+        self.orders = orders
+
+    def __len__(self):
+        return self.mask.bit_count()
+
+    def ordered_positions(self, sort: str, selected=None):
+        """
+        Positions du catalogue dans l'ordre `sort`. Si `selected` (tableau de
+        booléens sur tout le catalogue, issu des filtres) est donné, on ne
+        garde que ces lignes, sans retrier.
+        """
+        order = self.orders.get(sort, self.orders[SORT_OPTIONS[0]])
+        if selected is None:
+            return order
+        return order[selected[order]]
+
+
+def build_views(df, facet_index, categories: dict) -> dict:
+    """
+    categories : {clé de page: [valeurs de la facette "category"]}
+    Retourne {clé de page: CategoryView}.
+    """
+    size = len(df)
+    names = df["name"].astype(str).tolist() if "name" in df else [""] * size
+    # rang de chaque ligne dans l'ordre alphabétique global (accent-aware)
+    name_rank = np.empty(size, dtype=np.int64)
+    name_rank[sorted(range(size), key=lambda i: collation_key(names[i]))] = np.arange(size)
+    price10 = (
+        df["price10"].fillna(0).to_numpy(dtype=float)
+        if "price10" in df
+        else np.zeros(size)
+    )
+
+    views = {}
+    for key, values in categories.items():
+        mask = facet_index.mask("category", values)
+        rows = facet_index.positions(mask)
+        by_name = rows[np.argsort(name_rank[rows], kind="stable")]
+        views[key] = CategoryView(
+            mask,
+            {
+                "Nom A-Z": by_name,
+                "Prix 10 ml croissant": rows[np.lexsort((name_rank[rows], price10[rows]))],
+                "Prix 10 ml décroissant": rows[np.lexsort((name_rank[rows], -price10[rows]))],
+            },
+        )
+    return views
@@ -0,0 +1,443 @@
+"""
+Contrôle de complexité : le coût d'une opération doit suivre ce qu'elle
+affiche ou modifie, pas la taille totale du catalogue ni de users.json.
+
+Chaque opération de la boutique (recherche par nom d'une ligne de panier,
+page Admin, sauvegarde d'un compte, import d'un lot...) est exécutée sur
+des jeux de données synthétiques de taille croissante (x10 à chaque
+palier : catalogue de N parfums, N comptes avec leur historique et leurs
+archives), pour une même quantité affichée. Pendant l'appel on compte :
+
+    pas       lignes Python exécutées dans le code de la boutique (les
+              lignes de données parcourues en Python y apparaissent
+              directement ; mesure déterministe, sans chronomètre)
+    lignes    lignes de données parcourues par les opérations pandas
+              vectorisées appelées depuis la boutique (comparaison de
+              colonne, isin, str.contains, apply, iterrows...) : un
+              df[df["image_id"] == x] ne coûte qu'un pas, mais N lignes
+    lus       octets lus sur disque
+    écrits    octets écrits sur disque
+    lectures  appels aux accès données (load_users, index des archives,
+              blocs d'archive, NameResolver)
+
+Une opération déclarée "constante" échoue si l'une de ces mesures est plus
+de GROWTH_TOLERANCE fois plus grande au dernier palier qu'au premier. Les
+opérations dont le coût suit encore les données (dette connue : users.json
+relu et réécrit en entier, index des archives lu en entier) sont déclarées
+"linéaire" : elles échouent si une mesure grandit plus vite que les données
+elles-mêmes (GROWTH_TOLERANCE x le rapport des paliers), pour qu'une
+régression vers un ordre pire se voie ; si l'une devient constante, le
+rapport le signale pour qu'on resserre sa déclaration.
+
+Les données sont générées dans un dossier temporaire : users.json, les
+archives et le catalogue du dépôt ne sont pas touchés.
+
+Usage :
+    python complexity.py [--sizes 100,1000,10000]
+    python manage.py complexity [--sizes ...]
+
+Code de sortie : 1 si une opération dépasse sa déclaration.
+"""
+import argparse
+import builtins
+import io
+import os
+import sys
+import tempfile
+from datetime import datetime
+from pathlib import Path
+
+import pandas as pd
+from pandas.core.strings.accessor import StringMethods
+from streamlit import logger as st_logger
+
+# hors serveur, Streamlit prévient à chaque cache que le runtime n'existe pas
+st_logger.set_log_level("error")
+
+import order_archive  # noqa: E402
+import order_ingest  # noqa: E402
+import recommendations  # noqa: E402
+import shop_data  # noqa: E402
+from models import CartLine, Order, UserRecord  # noqa: E402
+from product_grid import catalog_payload  # noqa: E402
+
+ROOT = Path(__file__).resolve().parent
+DEFAULT_SIZES = (100, 1_000, 10_000)
+GROWTH_TOLERANCE = 2.0   # marge sur toute la plage (x100 par défaut)
+MEASURES = ("pas", "lignes", "lus", "écrits", "lectures")
+
+# accès données comptés comme "lectures" : (objet, attribut)
+LOOKUPS = [
+    (shop_data, "load_users"),
+    (order_archive, "load_index"),
+    (order_archive, "_read_block"),
+    (shop_data.NameResolver, "__call__"),
+]
+
+# opérations pandas qui parcourent toute leur colonne / table : comptées en
+# "lignes" (taille de l'objet) quand le code de la boutique les appelle
+ROW_SCANS = [
+    *((pd.Series, op) for op in ("__eq__", "__ne__", "__lt__", "__le__", "__gt__", "__ge__")),
+    (pd.Series, "isin"),
+    (pd.Series, "apply"),
+    (pd.Series, "map"),
+    (pd.DataFrame, "apply"),
+    (pd.DataFrame, "iterrows"),
+    (pd.DataFrame, "itertuples"),
+    (pd.DataFrame, "query"),
+    *((StringMethods, op) for op in ("contains", "startswith", "match", "lower", "upper")),
+]
+
+NOW = datetime(2025, 6, 1, 12, 0)
+
+
+# ================== MESURE ==================
+
+class _CountingFile:
+    """Fichier ouvert dont les octets lus / écrits sont comptés par le CostMeter."""
+
+    def __init__(self, f, meter):
+        self._f = f
+        self._meter = meter
+
+    @staticmethod
+    def _size(data) -> int:
+        return len(data.encode("utf-8")) if isinstance(data, str) else len(data)
+
+    def read(self, *args):
+        data = self._f.read(*args)
+        self._meter.costs["lus"] += self._size(data)
+        return data
+
+    def readline(self, *args):
+        data = self._f.readline(*args)
+        self._meter.costs["lus"] += self._size(data)
+        return data
+
+    def __iter__(self):
+        for line in self._f:
+            self._meter.costs["lus"] += self._size(line)
+            yield line
+
+    def write(self, data):
+        self._meter.costs["écrits"] += self._size(data)
+        return self._f.write(data)
+
+    def __enter__(self):
+        self._f.__enter__()
+        return self
+
+    def __exit__(self, *exc):
+        return self._f.__exit__(*exc)
+
+    def __getattr__(self, name):
+        return getattr(self._f, name)
+
+
+class CostMeter:
+    """Compte pas, lignes parcourues, octets lus / écrits et lectures pendant un bloc `with`."""
+
+    def __init__(self, lookups=LOOKUPS, row_scans=ROW_SCANS):
+        self.lookups = lookups
+        self.row_scans = row_scans
+        self.costs = dict.fromkeys(MEASURES, 0)
+        self._tracked = {}
+
+    def _is_shop_code(self, filename: str) -> bool:
+        tracked = self._tracked.get(filename)
+        if tracked is None:
+            path = Path(filename).resolve()
+            tracked = self._tracked[filename] = path.parent == ROOT and path.name != Path(__file__).name
+        return tracked
+
+    def _trace(self, frame, event, arg):
+        if event == "call" and self._is_shop_code(frame.f_code.co_filename):
+            return self._trace_lines
+        return None
+
+    def _trace_lines(self, frame, event, arg):
+        if event == "line":
+            self.costs["pas"] += 1
+        return self._trace_lines
+
+    def _open(self, *args, **kwargs):
+        return _CountingFile(self._real_open(*args, **kwargs), self)
+
+    def _counted(self, fn):
+        def wrapper(*args, **kwargs):
+            self.costs["lectures"] += 1
+            return fn(*args, **kwargs)
+        return wrapper
+
+    def _scanned(self, fn):
+        def wrapper(obj, *args, **kwargs):
+            # seuls les appels faits par la boutique comptent (pas ceux internes à pandas)
+            if self._is_shop_code(sys._getframe(1).f_code.co_filename):
+                self.costs["lignes"] += len(obj._data if isinstance(obj, StringMethods) else obj)
+            return fn(obj, *args, **kwargs)
+        return wrapper
+
+    def _patch(self, owner, name, replacement):
+        # l'attribut peut être hérité : on retient s'il faut le remettre ou le retirer
+        self._saved.append((owner, name, owner.__dict__.get(name)))
+        setattr(owner, name, replacement)
+
+    def __enter__(self):
+        self._real_open = io.open
+        io.open = builtins.open = self._open
+        self._saved = []
+        for owner, name in self.lookups:
+            self._patch(owner, name, self._counted(getattr(owner, name)))
+        for owner, name in self.row_scans:
+            self._patch(owner, name, self._scanned(getattr(owner, name)))
+        sys.settrace(self._trace)
+        return self
+
+    def __exit__(self, *exc):
+        sys.settrace(None)
+        for owner, name, fn in reversed(self._saved):
+            if fn is None:
+                delattr(owner, name)
+            else:
+                setattr(owner, name, fn)
+        io.open = builtins.open = self._real_open
+        return False
+
+
+# ================== DONNÉES SYNTHÉTIQUES ==================
+
+def _username(i: int) -> str:
+    return f"u{i:06d}"  # largeur fixe : les octets ne grossissent pas avec les numéros
+
+
+def build_catalog(size: int):
+    ids = range(1, size + 1)
+    return pd.DataFrame({
+        "name": [f"PARFUM {i:06d}" for i in ids],
+        "category": [("Homme", "Femme", "Mixte / niche")[i % 3] for i in ids],
+        "price10": [100.0 + i % 50 for i in ids],
+        "price20": [180.0 + i % 50 for i in ids],
+        "price30": [250.0 + i % 50 for i in ids],
+        "image_id": list(ids),
+    })
+
+
+def _order(df, i: int, timestamp: str) -> Order:
+    lines = []
+    for k in (0, 1):
+        position = (i * 7 + k * 13) % len(df)
+        row = df.iloc[position]
+        lines.append(CartLine(
+            name=row["name"], price=float(row["price10"]), qte_ml=10, units=1, parfum_id=int(row["image_id"]),
+        ))
+    return Order(
+        items=lines,
+        total=sum(line.line_total for line in lines),
+        timestamp=timestamp,
+        order_id=f"o{i:06d}-{timestamp[:10]}",
+    )
+
+
+def build_users(df, size: int) -> dict:
+    """`size` comptes : panier de 2 lignes, 2 commandes anciennes (archivées) + 1 récente."""
+    users = {}
+    for i in range(size):
+        history = [
+            _order(df, i, "2024-01-15T10:00:00"),
+            _order(df, i + 1, "2024-09-15T10:00:00"),
+            _order(df, i + 2, "2025-05-20T10:00:00"),
+        ]
+        users[_username(i)] = UserRecord(
+            password="x", cart=list(history[-1].items), favorites={1, 2}, history=history,
+        ).to_dict()
+    return users
+
+
+def prepare(size: int) -> dict:
+    """Jeu de données de taille `size` dans le dossier courant, + objets construits une fois par process."""
+    df = build_catalog(size)
+    users = build_users(df, size)
+    order_archive.compact(users, now=NOW)
+    shop_data.save_users(users)
+    shop_data.get_order_index.clear()
+    index = shop_data.get_order_index()
+    index.query(page_size=1)  # ordres triés calculés hors mesure, comme au premier affichage Admin
+    return {
+        "df": df,
+        "resolver": shop_data.NameResolver(df),
+        "index": index,
+        "matrix": recommendations.build_matrix(
+            [[item["parfum_id"] for item in order["items"]] for data in users.values() for order in data["history"]]
+        ),
+    }
+
+
+# ================== OPÉRATIONS ==================
+
+def _names(df, count: int) -> list:
+    step = max(1, len(df) // count)
+    return list(df["name"].iloc[::step][:count])
+
+
+def _ids(df, count: int) -> list:
+    step = max(1, len(df) // count)
+    return [int(i) for i in df["image_id"].iloc[::step][:count]]
+
+
+# Chaque opération : entrée préparée hors mesure (setup), puis l'appel mesuré.
+
+def op_cart_names(data, names):
+    resolve = data["resolver"]
+    for name in names:
+        resolve(name)
+
+
+def op_detail_rows(data, parfum_ids):
+    # ce que lit la fiche parfum (render_parfum_detail) et chaque vignette
+    for parfum_id in parfum_ids:
+        shop_data.parfum_row(data["df"], parfum_id)
+
+
+def op_cart_prices(data, lines):
+    # lignes du panier au prix du catalogue (invité, recommander, grille)
+    shop_data.priced_lines(data["df"], lines)
+
+
+def op_admin_page(data, _):
+    data["index"].query(page=1, page_size=50)
+    data["index"].query(user=_username(1), page_size=50)
+
+
+def op_admin_add(data, order):
+    data["index"].add_order(_username(1), order)
+
+
+def op_grid_page(data, positions):
+    catalog_payload(data["df"], positions)
+
+
+def op_basket_suggestions(data, parfum_ids):
+    data["matrix"].for_basket(parfum_ids, k=4)
+
+
+def op_archived_history(data, _):
+    order_archive.read_user_orders(_username(1))
+
+
+def _session_state(data):
+    record = UserRecord.from_dict(shop_data.load_users()[_username(1)])
+    return {"password_plain": "x", "cart": record.cart, "favorites": record.favorites, "history": record.history}
+
+
+def op_store_user(data, state):
+    shop_data.store_user_state(_username(1), state)
+
+
+def _ingest_input(data):
+    lines = [
+        f'{{"order_id": "lot-{k}", "user": "{_username(k)}", "items": [{{"parfum_id": {k + 1}, "qte_ml": 10}}]}}'
+        for k in range(10)
+    ]
+    return shop_data.load_users(), lines
+
+
+def op_ingest_batch(data, batch):
+    users, lines = batch
+    order_ingest.ingest(lines, users, data["df"], data["resolver"])
+
+
+def _none(data):
+    return None
+
+
+# (libellé, déclaration, setup, fonction mesurée) ; "constante" = ne doit pas suivre la
+# taille des données, "linéaire" = dette connue, au plus proportionnelle aux données
+OPERATIONS = [
+    ("Ligne de panier : nom -> parfum_id (x20)", "constante", lambda d: _names(d["df"], 20), op_cart_names),
+    ("Fiche parfum : ligne du catalogue (x20)", "constante", lambda d: _ids(d["df"], 20), op_detail_rows),
+    ("Panier : 20 lignes au prix du catalogue", "constante",
+     lambda d: [(i, 20, 1) for i in _ids(d["df"], 20)], op_cart_prices),
+    ("Admin : page de 50 lignes (+ filtre client)", "constante", _none, op_admin_page),
+    ("Achat : ajout à l'index Admin", "constante", lambda d: _order(d["df"], 3, NOW.isoformat()), op_admin_add),
+    ("Grille : JSON d'une page (12 parfums)", "constante", lambda d: list(range(12)), op_grid_page),
+    ("Panier : suggestions de co-achats", "constante", lambda d: _ids(d["df"], 3), op_basket_suggestions),
+    ("Historique : commandes archivées d'un client", "linéaire", _none, op_archived_history),
+    ("Clic panier : sauvegarde du compte", "linéaire", _session_state, op_store_user),
+    ("Import d'un lot de 10 commandes", "linéaire", _ingest_input, op_ingest_batch),
+]
+
+
+def measure(setup, fn, data) -> dict:
+    """Coûts de fn(data, entrée), l'entrée étant préparée hors mesure."""
+    arg = setup(data)
+    with CostMeter() as meter:
+        fn(data, arg)
+    return meter.costs
+
+
+# ================== RAPPORT ==================
+
+def grows(costs_by_size: list, factor: float = 1.0) -> list:
+    """Mesures dont le dernier palier dépasse GROWTH_TOLERANCE x `factor` x le premier."""
+    first, last = costs_by_size[0], costs_by_size[-1]
+    return [m for m in MEASURES if last[m] > GROWTH_TOLERANCE * factor * max(first[m], 1)]
+
+
+def run(sizes=DEFAULT_SIZES, report=print) -> int:
+    results = {label: [] for label, _, _, _ in OPERATIONS}
+    cwd = os.getcwd()
+    with tempfile.TemporaryDirectory(prefix="djperfum-complexity-") as workdir:
+        try:
+            for size in sizes:
+                # un dossier par palier : users.json, archives/ et copurchase.json propres
+                os.chdir(Path(workdir))
+                Path(str(size)).mkdir()
+                os.chdir(str(size))
+                data = prepare(size)
+                for label, _, setup, fn in OPERATIONS:
+                    results[label].append(measure(setup, fn, data))
+        finally:
+            os.chdir(cwd)
+
+    failures = 0
+    data_growth = sizes[-1] / sizes[0]
+    report(f"Paliers : {', '.join(str(s) for s in sizes)} parfums / comptes")
+    for label, expected, _, _ in OPERATIONS:
+        costs = results[label]
+        grown = grows(costs)
+        if expected == "constante" and grown:
+            verdict = "ÉCHEC : suit la taille des données (" + ", ".join(grown) + ")"
+            failures += 1
+        elif expected == "constante":
+            verdict = "ok"
+        elif grows(costs, data_growth):
+            verdict = "ÉCHEC : plus que linéaire (" + ", ".join(grows(costs, data_growth)) + ")"
+            failures += 1
+        elif grown:
+            verdict = "dette connue, linéaire (" + ", ".join(grown) + ")"
+        else:
+            verdict = "devenue constante : passer la déclaration à \"constante\""
+        report(f"\n{label} [{expected}] : {verdict}")
+        for m in MEASURES:
+            values = " -> ".join(f"{c[m]:>9}" for c in costs)
+            report(f"  {m:<9} {values}")
+    report(f"\n{failures} opération(s) en échec.")
+    return 1 if failures else 0
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Le coût des opérations suit-il ce qu'elles affichent ?")
+    parser.add_argument(
+        "--sizes",
+        default=",".join(str(s) for s in DEFAULT_SIZES),
+        help="tailles des jeux de données, séparées par des virgules (défaut : %(default)s)",
+    )
+    args = parser.parse_args(argv)
+    sizes = sorted({int(s) for s in args.sizes.split(",") if s.strip()})
+    if len(sizes) < 2:
+        parser.error("au moins deux tailles")
+    return run(sizes)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,174 @@
+"""
+Composition de coffrets de décants sous budget ("les 3 à 5 meilleurs
+décants pour 600 DH").
+
+Chaque parfum candidat peut entrer au plus une fois dans le coffret, dans
+une seule taille (10, 20 ou 30 ml). Son intérêt est un score de
+préférence (familles / notes choisies, lues dans l'index des facettes)
+multiplié par la valeur de la taille, à rendements décroissants. On
+cherche, pour chaque nombre de décants demandé, le coffret d'intérêt total
+maximal dont le prix tient dans le budget, avec au plus `max_per_family`
+parfums d'une même famille olfactive (diversité).
+
+C'est un sac à dos à choix multiples avec cardinalité, résolu exactement
+par programmation dynamique vectorisée (numpy) sur une grille de prix en
+unités du PGCD des prix (10 DH pour le catalogue actuel) :
+
+1. dans chaque famille, tableau meilleur[j, b] (j parfums de la famille,
+   coût exact b), parfum par parfum ;
+2. les familles sont ensuite combinées (j, b) par (j, b), ce qui impose la
+   limite par famille sans explorer les combinaisons.
+
+Pour ~100 parfums, 5 décants et 600 DH : quelques dizaines de ms.
+"""
+from functools import reduce
+from math import gcd
+
+import numpy as np
+
+SIZES = (10, 20, 30)
+PRICE_COLUMNS = ("price10", "price20", "price30")
+# intérêt relatif d'un décant selon sa taille (un 30 ml ne vaut pas 3 découvertes)
+SIZE_VALUE = np.array([1.0, 1.5, 1.8])
+NOTE_FACETS = ("note_tete", "note_coeur", "note_fond")
+
+FAMILY_WEIGHT = 1.0
+NOTE_WEIGHT = 0.5
+MAX_NOTE_MATCHES = 3
+
+
+def preference_scores(facet_index, families=(), notes=()) -> np.ndarray:
+    """
+    Score de chaque ligne du catalogue : 1, plus FAMILY_WEIGHT si sa famille
+    est parmi `families`, plus NOTE_WEIGHT par note choisie présente (tête,
+    cœur ou fond ; au plus MAX_NOTE_MATCHES).
+    """
+    scores = np.ones(facet_index.size)
+    if families:
+        scores += FAMILY_WEIGHT * facet_index.to_bool(facet_index.mask("famille", families))
+    if notes:
+        matches = np.zeros(facet_index.size)
+        for note in notes:
+            mask = 0
+            for facet in NOTE_FACETS:
+                mask |= facet_index.mask(facet, [note])
+            matches += facet_index.to_bool(mask)
+        scores += NOTE_WEIGHT * np.minimum(matches, MAX_NOTE_MATCHES)
+    return scores
+
+
+def family_labels(facet_index) -> np.ndarray:
+    """Famille olfactive de chaque ligne ("" si inconnue)."""
+    labels = np.full(facet_index.size, "", dtype=object)
+    for family, bits in facet_index.bits.get("famille", {}).items():
+        labels[facet_index.to_bool(bits)] = family
+    return labels
+
+
+def _shift_max(target, choice, source, dj, db, gain, tag):
+    """target[j+dj, b+db] = max(target, source[j, b] + gain), en notant `tag` là où ça améliore."""
+    rows, cols = target.shape
+    if dj >= rows or db >= cols:
+        return
+    candidate = source[: rows - dj, : cols - db] + gain
+    region = target[dj:, db:]
+    better = candidate > region
+    region[better] = candidate[better]
+    choice[dj:, db:][better] = tag
+
+
+def _family_table(costs, gains, cap, width):
+    """
+    Meilleur intérêt table[j, b] avec j parfums de la famille (j <= cap) pour
+    un coût exact b, plus les choix (taille + 1, 0 = non pris) de chaque
+    parfum pour la reconstruction.
+    """
+    table = np.full((cap + 1, width), -np.inf)
+    table[0, 0] = 0.0
+    choices = []
+    for item_costs, item_gains in zip(costs, gains):
+        new = table.copy()
+        choice = np.zeros(table.shape, dtype=np.int8)
+        for s, (cost, gain) in enumerate(zip(item_costs, item_gains)):
+            if cost >= 0:
+                _shift_max(new, choice, table, 1, cost, gain, s + 1)
+        choices.append(choice)
+        table = new
+    return table, choices
+
+
+def _family_items(choices, costs, j, b):
+    """Remonte les choix d'une famille depuis l'état (j, b) : [(indice local, indice de taille)]."""
+    items = []
+    for t in range(len(choices) - 1, -1, -1):
+        s = choices[t][j, b]
+        if s:
+            items.append((t, s - 1))
+            j -= 1
+            b -= costs[t][s - 1]
+    return items
+
+
+def best_sets(prices, scores, families, budget, counts=(3, 4, 5), sizes=SIZES,
+              max_per_family=2, candidates=None) -> list:
+    """
+    prices : tableau (n, 3) des prix 10 / 20 / 30 ml ; scores, families :
+    un élément par ligne ; candidates : positions autorisées (None = toutes).
+
+    Retourne, pour chaque nombre de décants de `counts` réalisable, un dict
+    {"count", "total", "score", "items": [(position, taille en ml), ...]}.
+    """
+    prices = np.asarray(prices, dtype=float)
+    positions = np.arange(len(prices)) if candidates is None else np.asarray(candidates, dtype=np.int64)
+    counts = sorted({int(k) for k in counts if k > 0})
+    size_slots = [SIZES.index(s) for s in sizes]
+    if not len(positions) or not counts or not size_slots:
+        return []
+
+    # grille de coûts en unités du PGCD des prix
+    rounded = np.rint(np.nan_to_num(prices[positions][:, size_slots], nan=0.0)).astype(np.int64)
+    unit = reduce(gcd, (int(p) for p in np.unique(rounded) if p > 0), 0) or 1
+    width = int(budget // unit) + 1
+    costs = np.where(rounded > 0, rounded // unit, -1)
+    costs[costs >= width] = -1  # hors budget à elle seule : taille jamais prise
+    gains = np.asarray(scores, dtype=float)[positions][:, None] * SIZE_VALUE[size_slots][None, :]
+
+    max_count = counts[-1]
+    groups = {}
+    for local, family in enumerate(np.asarray(families, dtype=object)[positions]):
+        groups.setdefault(family or "", []).append(local)
+
+    # combinaison des familles : best[k, b] sur k parfums au total
+    best = np.full((max_count + 1, width), -np.inf)
+    best[0, 0] = 0.0
+    steps = []
+    for family, members in groups.items():
+        cap = min(len(members), max_count, max_per_family if family else max_count)
+        table, choices = _family_table(costs[members], gains[members], cap, width)
+        new = best.copy()
+        pick = np.full(best.shape, -1, dtype=np.int64)  # j * width + b retenu pour cette famille
+        for j in range(1, cap + 1):
+            for b in np.flatnonzero(np.isfinite(table[j])):
+                _shift_max(new, pick, best, j, int(b), table[j, b], j * width + int(b))
+        steps.append((members, table, choices, pick))
+        best = new
+
+    results = []
+    for k in counts:
+        if not np.isfinite(best[k]).any():
+            continue
+        b = int(np.argmax(best[k]))
+        score = float(best[k, b])
+        items, j = [], k
+        for members, table, choices, pick in reversed(steps):
+            tag = pick[j, b]
+            if tag < 0:
+                continue
+            fj, fb = divmod(int(tag), width)
+            for t, s in _family_items(choices, costs[members], fj, fb):
+                items.append((int(positions[members[t]]), sizes[s]))
+            j, b = j - fj, b - fb
+        items.sort()
+        total = float(sum(prices[pos, SIZES.index(ml)] for pos, ml in items))
+        results.append({"count": k, "total": total, "score": score, "items": items})
+    return results
@@ -0,0 +1,422 @@
+"""
+Dépendances externes de la boutique : budget de latence, disjoncteur et
+repli local pour chacune.
+
+    smtp       envoi du formulaire de contact (send_contact_email)
+    jsdelivr   script particles.js de l'animation d'accueil
+    botpress   webchat du chatbot (CHATBOT_URL)
+
+Sans garde-fou, une dépendance lente bloque la page qui l'appelle : un
+serveur SMTP qui ne répond pas fige le formulaire, et ainsi de suite.
+
+Chaque appel passe par Dependency.call() : il est exécuté dans un pool de
+threads et abandonné au bout de son budget (timeout). Après
+`failure_threshold` échecs consécutifs, le disjoncteur s'ouvre : la
+dépendance est sautée sans attendre pendant `reset_timeout` secondes, puis
+un seul appel d'essai est autorisé (semi-ouvert) ; s'il réussit, le
+disjoncteur se referme. Quand l'appel échoue ou est sauté, le repli local
+de la dépendance est utilisé :
+
+    smtp       message mis en file dans contact_outbox.jsonl, renvoyé par
+               `python manage.py send-outbox`
+    jsdelivr   copie locale du script (static/vendor/), récupérée en
+               arrière-plan ; à défaut, fond statique sans animation
+    botpress   état sondé en arrière-plan (probe) : si le webchat est
+               injoignable, la page affiche une recherche locale dans les
+               fiches parfums au lieu d'un iframe vide
+
+Pour tester sans serveur réel, SHOP_DEPENDENCY_FAULTS injecte des pannes
+dans les appels (exécutées dans le pool, donc soumises aux mêmes budgets) :
+
+    SHOP_DEPENDENCY_FAULTS="smtp=delay:8,botpress=fail" streamlit run app.py
+    SHOP_DEPENDENCY_FAULTS="jsdelivr=fail" python manage.py deps-check
+"""
+import json
+import os
+import smtplib
+import threading
+import time
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeout
+from datetime import datetime
+from email import message_from_string
+from pathlib import Path
+
+import metrics
+
+# dépendance -> (budget par appel en s, échecs avant ouverture, secondes avant un nouvel essai)
+DEPENDENCY_SETTINGS = {
+    "smtp": (5.0, 3, 120.0),
+    "jsdelivr": (2.0, 2, 300.0),
+    "botpress": (1.5, 2, 60.0),
+}
+FAULTS_ENV = "SHOP_DEPENDENCY_FAULTS"
+MAX_WORKERS = 8
+
+CLOSED, OPEN, HALF_OPEN = "fermé", "ouvert", "semi-ouvert"
+
+
+class DependencyUnavailable(RuntimeError):
+    """Dépendance en échec (timeout, erreur ou disjoncteur ouvert) et sans repli."""
+
+
+def parse_faults(text: str) -> dict:
+    """"smtp=delay:8,botpress=fail" -> {"smtp": ("delay", 8.0), "botpress": ("fail", 0.0)}."""
+    faults = {}
+    for part in (text or "").split(","):
+        name, _, spec = part.strip().partition("=")
+        kind, _, value = spec.partition(":")
+        if name and kind in ("delay", "fail"):
+            try:
+                faults[name] = (kind, float(value or 0))
+            except ValueError:
+                continue
+    return faults
+
+
+class CircuitBreaker:
+    """Disjoncteur classique fermé / ouvert / semi-ouvert, thread-safe."""
+
+    def __init__(self, failure_threshold: int, reset_timeout: float, clock=time.monotonic):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.clock = clock
+        self.state = CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        self._trial = False
+        self._lock = threading.Lock()
+
+    def allow(self) -> bool:
+        """Vrai si un appel peut partir ; en semi-ouvert, un seul essai à la fois."""
+        with self._lock:
+            if self.state == OPEN and self.clock() - self.opened_at >= self.reset_timeout:
+                self.state = HALF_OPEN
+                self._trial = False
+            if self.state == CLOSED:
+                return True
+            if self.state == HALF_OPEN and not self._trial:
+                self._trial = True
+                return True
+            return False
+
+    def record_success(self):
+        with self._lock:
+            self.state = CLOSED
+            self.failures = 0
+            self._trial = False
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            if self.state == HALF_OPEN or self.failures >= self.failure_threshold:
+                self.state = OPEN
+                self.opened_at = self.clock()
+            self._trial = False
+
+
+class Dependency:
+    """Une dépendance externe : budget par appel + disjoncteur + sonde en arrière-plan."""
+
+    def __init__(self, name: str, timeout: float, breaker: CircuitBreaker, executor, fault=None):
+        self.name = name
+        self.timeout = timeout
+        self.breaker = breaker
+        self.executor = executor
+        self.fault = fault
+        self.last_error = None
+        self._probe = None          # (horodatage, résultat) de la dernière sonde
+        self._probing = False
+        self._lock = threading.Lock()
+
+    def _run(self, fn, args, kwargs):
+        # panne injectée (SHOP_DEPENDENCY_FAULTS) : dans le thread de l'appel, soumise au budget
+        if self.fault is not None:
+            kind, value = self.fault
+            if kind == "delay":
+                time.sleep(value)
+            else:
+                raise ConnectionError(f"panne simulée ({self.name})")
+        return fn(*args, **kwargs)
+
+    def call(self, fn, *args, fallback=None, **kwargs):
+        """
+        fn(*args, **kwargs) en au plus `timeout` secondes. En cas d'échec ou
+        de disjoncteur ouvert : fallback() si fourni, sinon DependencyUnavailable.
+        """
+        if not self.breaker.allow():
+            metrics.DEPENDENCY_CALLS.inc(dependency=self.name, result="skipped")
+            return self._fallback(fallback, "disjoncteur ouvert")
+
+        start = time.perf_counter()
+        future = self.executor.submit(self._run, fn, args, kwargs)
+        try:
+            # l'appel abandonné finit dans son thread (timeouts socket passés à fn)
+            result = future.result(timeout=self.timeout)
+        except FutureTimeout:
+            outcome, error = "timeout", f"pas de réponse en {self.timeout:g} s"
+        except Exception as exc:
+            outcome, error = "error", f"{type(exc).__name__} : {exc}"
+        else:
+            self.breaker.record_success()
+            self.last_error = None
+            metrics.DEPENDENCY_CALLS.inc(dependency=self.name, result="ok")
+            metrics.DEPENDENCY_SECONDS.observe(time.perf_counter() - start, dependency=self.name)
+            return result
+
+        self.breaker.record_failure()
+        self.last_error = error
+        metrics.DEPENDENCY_CALLS.inc(dependency=self.name, result=outcome)
+        metrics.DEPENDENCY_SECONDS.observe(time.perf_counter() - start, dependency=self.name)
+        return self._fallback(fallback, error)
+
+    def _fallback(self, fallback, reason):
+        if fallback is None:
+            raise DependencyUnavailable(f"{self.name} indisponible : {reason}")
+        metrics.DEPENDENCY_CALLS.inc(dependency=self.name, result="fallback")
+        return fallback()
+
+    def probe(self, check, max_age: float) -> bool:
+        """
+        État de la dépendance sans attendre : dernier résultat de check()
+        (vrai si joignable ; inconnu = vrai). Si ce résultat a plus de
+        `max_age` secondes, une nouvelle sonde part en arrière-plan.
+        """
+        with self._lock:
+            known = self._probe
+            stale = known is None or time.monotonic() - known[0] > max_age
+            if stale and not self._probing:
+                self._probing = True
+                threading.Thread(target=self._run_probe, args=(check,), daemon=True).start()
+        return True if known is None else known[1]
+
+    def _run_probe(self, check):
+        ok = False
+        try:
+            ok = bool(self.call(check, fallback=lambda: False))
+        finally:
+            with self._lock:
+                self._probe = (time.monotonic(), ok)
+                self._probing = False
+
+    def stats(self) -> dict:
+        fault = ""
+        if self.fault is not None:
+            kind, value = self.fault
+            fault = f"{kind}:{value:g}" if kind == "delay" else kind
+        return {
+            "dependance": self.name,
+            "etat": self.breaker.state,
+            "echecs": self.breaker.failures,
+            "budget_s": self.timeout,
+            "panne_simulee": fault,
+            "derniere_erreur": self.last_error or "",
+        }
+
+
+class Dependencies:
+    """Les dépendances du process, partagées par toutes les sessions."""
+
+    def __init__(self, settings=None, faults=None, clock=time.monotonic, max_workers=MAX_WORKERS):
+        settings = DEPENDENCY_SETTINGS if settings is None else settings
+        faults = parse_faults(os.environ.get(FAULTS_ENV, "")) if faults is None else faults
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="dependency")
+        self._deps = {
+            name: Dependency(
+                name, timeout, CircuitBreaker(threshold, reset, clock), self.executor, faults.get(name)
+            )
+            for name, (timeout, threshold, reset) in settings.items()
+        }
+
+    def __getitem__(self, name: str) -> Dependency:
+        return self._deps[name]
+
+    def stats(self) -> list:
+        return [dep.stats() for dep in self._deps.values()]
+
+
+DEPENDENCIES = Dependencies()
+
+
+# ================== SMTP (formulaire de contact) ==================
+
+OUTBOX_FILE = "contact_outbox.jsonl"
+SECRETS_FILE = ".streamlit/secrets.toml"
+_outbox_lock = threading.Lock()
+
+
+def load_smtp_config(path=SECRETS_FILE) -> dict:
+    """Section [email] de secrets.toml, pour les scripts hors Streamlit (manage.py)."""
+    import tomllib
+
+    with open(path, "rb") as f:
+        return tomllib.load(f)["email"]
+
+
+def _smtp_send(config: dict, msg, timeout: float) -> str:
+    with smtplib.SMTP(config["host"], int(config["port"]), timeout=timeout) as server:
+        server.starttls()
+        server.login(config["username"], config["password"])
+        server.send_message(msg)
+    return "sent"
+
+
+def queue_message(msg, outbox=OUTBOX_FILE):
+    """Ajoute le message à la file locale (une ligne JSON par message)."""
+    entry = {"queued_at": datetime.now().isoformat(timespec="seconds"), "message": msg.as_string()}
+    with _outbox_lock, open(outbox, "a", encoding="utf-8") as f:
+        f.write(json.dumps(entry, ensure_ascii=False) + "\n")
+
+
+def outbox_size(outbox=OUTBOX_FILE) -> int:
+    try:
+        with open(outbox, "r", encoding="utf-8") as f:
+            return sum(1 for line in f if line.strip())
+    except OSError:
+        return 0
+
+
+def send_mail(config: dict, msg, deps=None) -> str:
+    """Envoie `msg` ("sent"), ou le met en file si le SMTP est lent ou en panne ("queued")."""
+    dep = (deps or DEPENDENCIES)["smtp"]
+
+    def fallback():
+        # après un timeout, l'envoi abandonné peut encore aboutir : au pire
+        # un doublon à la relance, jamais un message perdu
+        queue_message(msg)
+        return "queued"
+
+    return dep.call(_smtp_send, config, msg, dep.timeout, fallback=fallback)
+
+
+def flush_outbox(config: dict, outbox=OUTBOX_FILE, deps=None) -> tuple:
+    """
+    Renvoie les messages en file, dans l'ordre ; s'arrête au premier échec
+    (les suivants restent en file). Retourne (envoyés, restants).
+    """
+    dep = (deps or DEPENDENCIES)["smtp"]
+    path = Path(outbox)
+    with _outbox_lock:
+        entries = _read_lines(path)
+    sent, left = 0, len(entries)
+    for line in entries:
+        msg = message_from_string(json.loads(line)["message"])
+        try:
+            dep.call(_smtp_send, config, msg, dep.timeout)
+        except DependencyUnavailable:
+            break
+        sent += 1
+    if sent:
+        with _outbox_lock:
+            # relu : l'app a pu mettre d'autres messages en file pendant l'envoi
+            remaining = _read_lines(path)[sent:]
+            tmp = path.with_name(path.name + ".tmp")
+            tmp.write_text("".join(line + "\n" for line in remaining), encoding="utf-8")
+            os.replace(tmp, path)
+            left = len(remaining)
+    return sent, left
+
+
+def _read_lines(path: Path) -> list:
+    try:
+        return [line for line in path.read_text(encoding="utf-8").splitlines() if line.strip()]
+    except OSError:
+        return []
+
+
+# ================== JSDELIVR (particles.js) ==================
+
+PARTICLES_CDN_URL = "https://cdn.jsdelivr.net/particles.js/2.0.0/particles.min.js"
+VENDOR_DIR = Path("static") / "vendor"       # servi sous /app/static/vendor/
+PARTICLES_FILE = VENDOR_DIR / "particles.min.js"
+PARTICLES_STATIC_URL = "/app/static/vendor/particles.min.js"
+
+
+def _fetch(url: str, timeout: float) -> bytes:
+    with urllib.request.urlopen(url, timeout=timeout) as response:
+        return response.read()
+
+
+def _download_particles(timeout: float) -> bool:
+    script = _fetch(PARTICLES_CDN_URL, timeout)
+    VENDOR_DIR.mkdir(parents=True, exist_ok=True)
+    tmp = PARTICLES_FILE.with_name(PARTICLES_FILE.name + ".tmp")
+    tmp.write_bytes(script)
+    os.replace(tmp, PARTICLES_FILE)
+    return True
+
+
+def fetch_particles_script(deps=None) -> bool:
+    """Télécharge particles.js dans static/vendor/ (une fois) ; vrai si la copie locale existe."""
+    if PARTICLES_FILE.exists():
+        return True
+    dep = (deps or DEPENDENCIES)["jsdelivr"]
+    return dep.call(_download_particles, dep.timeout, fallback=lambda: False)
+
+
+def particles_script_available(deps=None) -> bool:
+    """
+    Vrai si la copie locale est prête ; sinon lance sa récupération en
+    arrière-plan (sonde) et répond tout de suite : la page n'attend jamais le CDN.
+    """
+    if PARTICLES_FILE.exists():
+        return True
+    dep = (deps or DEPENDENCIES)["jsdelivr"]
+    dep.probe(lambda: _download_particles(dep.timeout), max_age=60)
+    return False
+
+
+# ================== BOTPRESS (webchat) ==================
+
+# Lien shareable Botpress
+CHATBOT_URL = (
+    "https://cdn.botpress.cloud/webchat/v3.3/shareable.html"
+    "?configUrl=https://files.bpcontent.cloud/2025/10/06/14/20251006143331-TLGNO0TS.json"
+)
+
+
+def _reachable(url: str, timeout: float) -> bool:
+    request = urllib.request.Request(url, method="HEAD")
+    with urllib.request.urlopen(request, timeout=timeout) as response:
+        return response.status < 500
+
+
+def chatbot_available(url=CHATBOT_URL, deps=None, max_age=60.0) -> bool:
+    """Dernier état connu du webchat (sonde en arrière-plan, jamais bloquante)."""
+    dep = (deps or DEPENDENCIES)["botpress"]
+    return dep.probe(lambda: _reachable(url, dep.timeout), max_age=max_age)
+
+
+# ================== VÉRIFICATION (manage.py deps-check) ==================
+
+def _smtp_noop(config: dict, timeout: float) -> bool:
+    with smtplib.SMTP(config["host"], int(config["port"]), timeout=timeout) as server:
+        server.noop()
+    return True
+
+
+def check_all(smtp_config=None, deps=None) -> list:
+    """
+    Un appel réel (pannes simulées comprises) par dépendance :
+    [(nom, "ok" | raison de l'échec, secondes, état du disjoncteur)].
+    """
+    deps = deps or DEPENDENCIES
+    checks = {
+        "smtp": (lambda t: _smtp_noop(smtp_config, t)) if smtp_config else None,
+        "jsdelivr": lambda t: _reachable(PARTICLES_CDN_URL, t),
+        "botpress": lambda t: _reachable(CHATBOT_URL, t),
+    }
+    results = []
+    for name, check in checks.items():
+        dep = deps[name]
+        if check is None:
+            results.append((name, "non configuré (secrets.toml [email])", 0.0, dep.breaker.state))
+            continue
+        start = time.perf_counter()
+        try:
+            dep.call(check, dep.timeout)
+            outcome = "ok"
+        except DependencyUnavailable as exc:
+            outcome = str(exc)
+        results.append((name, outcome, time.perf_counter() - start, dep.breaker.state))
+    return results
@@ -0,0 +1,202 @@
+"""
+Filtres à facettes par bitsets : catégorie, tranche de prix (10/20/30 ml),
+famille olfactive, notes de tête / cœur / fond et couleur du flacon
+(calculée hors ligne par image_features.py).
+
+Au chargement du catalogue, on construit pour chaque valeur de facette un
+bitset (un int Python) dont le bit i vaut 1 si la ligne i du catalogue
+porte cette valeur. Un filtre combiné se résout alors par des OU (valeurs
+d'une même facette) et des ET (entre facettes), et les compteurs affichés
+à côté de chaque valeur sont de simples popcounts.
+"""
+import re
+import unicodedata
+
+import numpy as np
+
+# facette -> libellé affiché dans les filtres
+FACETS = {
+    "category": "Catégorie",
+    "prix10": "Prix 10 ml",
+    "prix20": "Prix 20 ml",
+    "prix30": "Prix 30 ml",
+    "famille": "Famille olfactive",
+    "note_tete": "Notes de tête",
+    "note_coeur": "Notes de cœur",
+    "note_fond": "Notes de fond",
+    "couleur": "Couleur du flacon",
+}
+
+# Tranches de prix par taille de décant : (borne basse incluse, libellé)
+PRICE_BANDS = {
+    "prix10": [(0, "moins de 150 DH"), (150, "150 à 249 DH"), (250, "250 à 349 DH"), (350, "350 DH et plus")],
+    "prix20": [(0, "moins de 300 DH"), (300, "300 à 499 DH"), (500, "500 à 699 DH"), (700, "700 DH et plus")],
+    "prix30": [(0, "moins de 450 DH"), (450, "450 à 749 DH"), (750, "750 à 999 DH"), (1000, "1000 DH et plus")],
+}
+
+PRICE_COLUMNS = {"prix10": "price10", "prix20": "price20", "prix30": "price30"}
+
+# Libellés de parfums_composition.txt (sans accents, minuscules) -> champ
+COMPO_FIELDS = {
+    "famille olfactive": "famille",
+    "notes de tete": "note_tete",
+    "notes de coeur": "note_coeur",
+    "notes de fond": "note_fond",
+}
+
+
+def _plain(text: str) -> str:
+    """Minuscules, sans accents ni espaces multiples ("Notes  de cœur" -> "notes de coeur")."""
+    text = unicodedata.normalize("NFKD", str(text)).replace("œ", "oe")
+    text = "".join(c for c in text if not unicodedata.combining(c))
+    return " ".join(text.lower().split())
+
+
+def parse_composition(text: str) -> dict:
+    """
+    Extrait d'un bloc de parfums_composition.txt :
+    {"famille": "Oriental", "note_tete": [...], "note_coeur": [...], "note_fond": [...]}
+
+    La famille retenue est la famille principale (premier mot de
+    "Oriental boisé"), pour garder un nombre de valeurs lisible.
+    """
+    fields = {"famille": None, "note_tete": [], "note_coeur": [], "note_fond": []}
+    for line in str(text or "").splitlines():
+        if ":" not in line:
+            continue
+        label, value = line.split(":", 1)
+        field = COMPO_FIELDS.get(_plain(label))
+        if field is None:
+            continue
+        value = value.strip().rstrip(";.").strip()
+        if field == "famille":
+            fields["famille"] = value.split()[0].capitalize() if value else None
+        else:
+            fields[field] = [
+                note.strip().lower()
+                for note in re.split(r"[,;]", value)
+                if note.strip()
+            ]
+    return fields
+
+
+def price_band(facet: str, price) -> str:
+    """Libellé de la tranche de prix contenant `price` pour une facette prix."""
+    try:
+        price = float(price)
+    except (TypeError, ValueError):
+        return None
+    label = None
+    for low, band_label in PRICE_BANDS[facet]:
+        if price >= low:
+            label = band_label
+    return label
+
+
+class FacetIndex:
+    """
+    Bitsets par (facette, valeur) sur les lignes du catalogue.
+
+    Les positions sont celles du DataFrame du catalogue (ligne 0 = bit 0),
+    donc df.iloc[index.positions(mask)] redonne les lignes sélectionnées.
+    """
+
+    def __init__(self, size: int):
+        self.size = size
+        self.all = (1 << size) - 1
+        self.bits = {facet: {} for facet in FACETS}
+
+    @classmethod
+    def build(cls, df, compo_fields_by_name: dict, colours_by_id: dict = None):
+        """
+        Construit l'index à partir du DataFrame du catalogue, d'un dict
+        {NOM EN MAJUSCULES: parse_composition(...)} et, si les caractéristiques
+        visuelles ont été calculées, d'un dict {image_id: couleur du flacon}.
+        """
+        index = cls(len(df))
+
+        def column(name):
+            return df[name].tolist() if name in df else [None] * len(df)
+
+        names = [str(n) for n in column("name")]
+        categories = [str(c) for c in column("category")]
+        image_ids = column("image_id")
+        colours_by_id = colours_by_id or {}
+        prices = {facet: column(col) for facet, col in PRICE_COLUMNS.items()}
+
+        for pos in range(len(df)):
+            bit = 1 << pos
+            # "Mixte / Niche" -> tokens "Mixte", "Niche" (même logique que str.contains)
+            for token in re.findall(r"\w+", categories[pos]):
+                index._add("category", token.capitalize(), bit)
+            for facet in PRICE_BANDS:
+                band = price_band(facet, prices[facet][pos])
+                if band:
+                    index._add(facet, band, bit)
+            colour = colours_by_id.get(image_ids[pos])
+            if colour:
+                index._add("couleur", colour, bit)
+
+            fields = compo_fields_by_name.get(names[pos].upper())
+            if not fields:
+                continue
+            if fields.get("famille"):
+                index._add("famille", fields["famille"], bit)
+            for facet in ("note_tete", "note_coeur", "note_fond"):
+                for note in fields.get(facet, []):
+                    index._add(facet, note, bit)
+        return index
+
+    def _add(self, facet: str, value: str, bit: int):
+        values = self.bits[facet]
+        values[value] = values.get(value, 0) | bit
+
+    def values(self, facet: str):
+        """Valeurs d'une facette, dans l'ordre d'affichage (tranches de prix triées)."""
+        if facet in PRICE_BANDS:
+            return [label for _, label in PRICE_BANDS[facet] if label in self.bits[facet]]
+        return sorted(self.bits[facet], key=_plain)
+
+    def mask(self, facet: str, values) -> int:
+        """OU des bitsets des valeurs choisies pour une facette."""
+        bits = self.bits[facet]
+        mask = 0
+        for value in values:
+            mask |= bits.get(value, 0)
+        return mask
+
+    def query(self, selection: dict, base: int = None) -> int:
+        """ET entre facettes (facettes sans valeur choisie ignorées)."""
+        mask = self.all if base is None else base
+        for facet, values in selection.items():
+            if values:
+                mask &= self.mask(facet, values)
+        return mask
+
+    def counts(self, selection: dict, base: int = None) -> dict:
+        """
+        Compteurs "live" {facette: {valeur: nb}} : pour chaque facette, on
+        applique les filtres des *autres* facettes, pour que cocher une valeur
+        n'écrase pas les compteurs de ses voisines.
+        """
+        result = {}
+        for facet, values in self.bits.items():
+            others = {f: v for f, v in selection.items() if f != facet}
+            mask = self.query(others, base)
+            result[facet] = {value: (bits & mask).bit_count() for value, bits in values.items()}
+        return result
+
+    def to_bool(self, mask: int):
+        """Bitset -> tableau numpy de booléens (un par ligne du catalogue)."""
+        raw = np.frombuffer(mask.to_bytes((self.size + 7) // 8, "little"), dtype=np.uint8)
+        return np.unpackbits(raw, bitorder="little", count=self.size).astype(bool)
+
+    def positions(self, mask: int):
+        """Positions (croissantes) des bits à 1."""
+        if not mask:
+            return np.empty(0, dtype=np.int64)
+        return np.flatnonzero(self.to_bool(mask))
+
+    @staticmethod
+    def count(mask: int) -> int:
+        return mask.bit_count()
@@ -0,0 +1,90 @@
+"""
+Panier des visiteurs non connectés, gardé dans le navigateur.
+
+Le panier d'un compte est écrit dans users.json à chaque clic. Un visiteur
+anonyme, lui, garde son panier dans st.session_state (aucune écriture
+serveur) et une copie compacte dans le localStorage du navigateur, via un
+petit composant invisible (frontend/guest_cart/index.html) : le panier
+survit ainsi à un rechargement, à un lien de fiche ou à une nouvelle visite.
+
+La copie ne contient que [parfum_id, taille en ml, flacons] par ligne : les
+noms et prix sont relus dans le catalogue au retour, le navigateur n'est
+jamais cru sur un prix.
+
+À la connexion ou à la création de compte, le panier invité est fusionné
+dans celui du compte (merge_carts) et écrit en une seule fois ; la copie
+du navigateur est alors vidée.
+"""
+from pathlib import Path
+
+import streamlit.components.v1 as components
+
+from models import CartLine
+
+FRONTEND_DIR = Path(__file__).resolve().parent / "frontend" / "guest_cart"
+MAX_LINES = 50
+SIZES = (10, 20, 30)
+
+_component = None
+
+
+def encode_cart(cart) -> list:
+    """Copie compacte du panier pour le navigateur : [[parfum_id, ml, flacons], ...]."""
+    return [
+        [int(line.parfum_id), int(line.qte_ml), int(line.units)]
+        for line in cart
+        if line.parfum_id is not None
+    ][:MAX_LINES]
+
+
+def decode_lines(value) -> list:
+    """
+    Lignes (parfum_id, ml, flacons) lues depuis le navigateur ; les entrées
+    mal formées sont ignorées (contenu modifiable par le visiteur).
+    """
+    if not isinstance(value, list):
+        return []
+    lines = []
+    for entry in value[:MAX_LINES]:
+        try:
+            parfum_id, qte_ml, units = (int(v) for v in entry)
+        except (TypeError, ValueError):
+            continue
+        if parfum_id > 0 and qte_ml in SIZES and 1 <= units <= 50:
+            lines.append((parfum_id, qte_ml, units))
+    return lines
+
+
+def merge_carts(account, guest) -> list:
+    """
+    Panier du compte + panier invité : une ligne du même parfum dans la même
+    taille voit ses flacons additionnés (prix du compte conservé), les
+    autres sont ajoutées à la suite.
+    """
+    merged = list(account)
+    by_key = {(line.parfum_id, line.qte_ml): line for line in merged}
+    for line in guest:
+        existing = by_key.get((line.parfum_id, line.qte_ml))
+        if existing is not None and line.parfum_id is not None:
+            existing.units += line.units
+        else:
+            line = CartLine.from_dict(line.to_dict())  # copie : pas de ligne partagée entre paniers
+            merged.append(line)
+            by_key[(line.parfum_id, line.qte_ml)] = line
+    return merged
+
+
+def guest_cart_store(lines, restored: bool, key=None):
+    """
+    Composant invisible de synchronisation avec le localStorage.
+
+    Au montage, il renvoie une fois le panier enregistré ({"lines": [...]},
+    [] si aucun). Tant que `restored` est faux, il n'écrit rien (pour ne
+    pas écraser la copie avant de l'avoir relue) ; ensuite il enregistre
+    `lines` à chaque rerun, ou efface la copie si `lines` est vide.
+    """
+    global _component
+    if _component is None:
+        # déclaré au premier affichage, comme product_grid
+        _component = components.declare_component("guest_cart", path=str(FRONTEND_DIR))
+    return _component(lines=lines, restored=restored, key=key, default=None)
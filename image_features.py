@@ -0,0 +1,236 @@
+"""
+Caractéristiques visuelles des flacons (images/), calculées en batch.
+
+Le job lit chaque image une seule fois, en parallèle, et calcule avec NumPy
+un petit vecteur par flacon :
+
+    - histogramme couleur 4x4x4 (64 valeurs) du flacon, fond exclu,
+    - 3 couleurs dominantes (RGB 0-1) + leur poids,
+    - ratio largeur / hauteur et taux de remplissage du flacon.
+
+Les vecteurs sont rangés dans un tableau float32 (ligne = image_id) sauvé
+au format .npy, que l'app ouvre en memory-map : aucune image n'est relue
+pendant une requête. Un manifeste garde le hash de chaque fichier, donc
+relancer le job ne recalcule que les images modifiées.
+
+Usage :
+    python image_features.py            # (re)calcule ce qui a changé
+    python image_features.py --force    # recalcule tout
+"""
+import argparse
+import colorsys
+import hashlib
+import io
+import json
+import os
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Optional
+
+import numpy as np
+
+IMAGES_DIR = "images"
+CACHE_DIR = ".cache"
+FEATURES_FILE = f"{CACHE_DIR}/image_features.npy"
+MANIFEST_FILE = f"{CACHE_DIR}/image_features.json"
+FEATURE_VERSION = 1
+
+HIST_BINS = 4                      # par canal -> 64 cases
+N_DOMINANT = 3
+HIST = slice(0, HIST_BINS ** 3)
+DOMINANT = slice(HIST.stop, HIST.stop + 3 * N_DOMINANT)
+WEIGHTS = slice(DOMINANT.stop, DOMINANT.stop + N_DOMINANT)
+ASPECT = WEIGHTS.stop
+FILL = ASPECT + 1
+DIMS = FILL + 1
+
+# écart (0-255, distance RGB) au-delà duquel un pixel n'est plus du fond
+BACKGROUND_THRESHOLD = 40
+
+
+def file_hash(data: bytes) -> str:
+    return hashlib.sha1(data).hexdigest()
+
+
+def compute_features(data: bytes) -> np.ndarray:
+    """Vecteur de DIMS float32 pour une image PNG/JPEG (octets bruts)."""
+    from PIL import Image
+
+    with Image.open(io.BytesIO(data)) as img:
+        rgba = np.asarray(img.convert("RGBA"), dtype=np.float32)
+    height, width = rgba.shape[:2]
+    rgb = rgba[..., :3]
+
+    # fond = couleur médiane du bord de l'image (fond gris clair des photos)
+    border = np.concatenate([rgb[0], rgb[-1], rgb[:, 0], rgb[:, -1]])
+    background = np.median(border, axis=0)
+    mask = (rgba[..., 3] > 0) & (np.linalg.norm(rgb - background, axis=-1) > BACKGROUND_THRESHOLD)
+    pixels = rgb[mask] if mask.any() else rgb.reshape(-1, 3)
+
+    bins = np.minimum((pixels / 256 * HIST_BINS).astype(np.int64), HIST_BINS - 1)
+    codes = (bins[:, 0] * HIST_BINS + bins[:, 1]) * HIST_BINS + bins[:, 2]
+    hist = np.bincount(codes, minlength=HIST_BINS ** 3).astype(np.float32)
+    hist /= hist.sum()
+
+    # couleurs dominantes = moyenne des pixels des cases les plus remplies
+    features = np.zeros(DIMS, dtype=np.float32)
+    features[HIST] = hist
+    top = np.argsort(hist)[::-1][:N_DOMINANT]
+    for i, code in enumerate(top):
+        if hist[code] == 0:
+            break
+        features[DOMINANT.start + 3 * i: DOMINANT.start + 3 * i + 3] = pixels[codes == code].mean(axis=0) / 255
+        features[WEIGHTS.start + i] = hist[code]
+    features[ASPECT] = width / height if height else 0.0
+    features[FILL] = mask.mean()
+    return features
+
+
+def colour_name(rgb) -> str:
+    """Nom de couleur simple (pour "parcourir par couleur de flacon")."""
+    r, g, b = (float(c) for c in rgb)
+    h, s, v = colorsys.rgb_to_hsv(r, g, b)
+    if v < 0.2:
+        return "Noir"
+    if s < 0.15:
+        return "Blanc / transparent" if v > 0.75 else "Gris / argent"
+    hue = h * 360
+    if hue < 15 or hue >= 340:
+        return "Rouge"
+    if hue < 40:
+        return "Orange / ambré"
+    if hue < 70:
+        return "Jaune / doré"
+    if hue < 170:
+        return "Vert"
+    if hue < 255:
+        return "Bleu"
+    if hue < 290:
+        return "Violet"
+    return "Rose"
+
+
+def _image_ids(images_dir):
+    ids = []
+    for path in Path(images_dir).glob("*.png"):
+        if path.stem.isdigit():
+            ids.append(int(path.stem))
+    return sorted(ids)
+
+
+def build_features(images_dir=IMAGES_DIR, force=False, workers=None) -> dict:
+    """
+    (Re)calcule les caractéristiques des images de `images_dir`.
+    Retourne {"images": nb total, "computed": nb recalculées}.
+    """
+    ids = _image_ids(images_dir)
+    manifest = {} if force else _load_manifest()
+    old = None
+    if manifest.get("version") == FEATURE_VERSION and manifest.get("dims") == DIMS and Path(FEATURES_FILE).exists():
+        old = np.load(FEATURES_FILE, mmap_mode="r")
+    old_hashes = manifest.get("files", {}) if old is not None else {}
+
+    def work(image_id):
+        data = (Path(images_dir) / f"{image_id}.png").read_bytes()
+        digest = file_hash(data)
+        if old_hashes.get(str(image_id)) == digest and image_id < len(old):
+            return image_id, digest, np.array(old[image_id]), False
+        return image_id, digest, compute_features(data), True
+
+    with ThreadPoolExecutor(max_workers=workers or min(8, (os.cpu_count() or 2))) as pool:
+        results = list(pool.map(work, ids))
+
+    features = np.zeros((max(ids, default=0) + 1, DIMS), dtype=np.float32)
+    hashes = {}
+    computed = 0
+    for image_id, digest, vector, fresh in results:
+        features[image_id] = vector
+        hashes[str(image_id)] = digest
+        computed += fresh
+    unchanged = old is not None and not computed and hashes == old_hashes and len(old) == len(features)
+    old = None  # libère le memmap avant de remplacer le fichier
+    if unchanged:
+        # rien à réécrire : le manifeste garde sa date, donc la version du catalogue
+        return {"images": len(ids), "computed": 0}
+
+    Path(CACHE_DIR).mkdir(exist_ok=True)
+    tmp = Path(f"{FEATURES_FILE}.tmp.npy")
+    np.save(tmp, features)
+    os.replace(tmp, FEATURES_FILE)
+    _save_manifest({"version": FEATURE_VERSION, "dims": DIMS, "files": hashes})
+    return {"images": len(ids), "computed": computed}
+
+
+def _load_manifest() -> dict:
+    try:
+        with open(MANIFEST_FILE, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def _save_manifest(manifest: dict):
+    tmp = Path(f"{MANIFEST_FILE}.tmp")
+    with tmp.open("w", encoding="utf-8") as f:
+        json.dump(manifest, f, indent=2)
+    os.replace(tmp, MANIFEST_FILE)
+
+
+class FeatureStore:
+    """Accès en lecture (memory-map) aux caractéristiques calculées."""
+
+    def __init__(self, features: np.ndarray, known_ids):
+        self.features = features
+        self.known = np.zeros(len(features), dtype=bool)
+        self.known[[i for i in known_ids if i < len(features)]] = True
+
+    @classmethod
+    def load(cls):
+        """FeatureStore, ou None si le job n'a pas encore été lancé."""
+        manifest = _load_manifest()
+        if manifest.get("version") != FEATURE_VERSION or not Path(FEATURES_FILE).exists():
+            return None
+        features = np.load(FEATURES_FILE, mmap_mode="r")
+        return cls(features, [int(i) for i in manifest.get("files", {})])
+
+    def __contains__(self, image_id):
+        return 0 <= image_id < len(self.known) and bool(self.known[image_id])
+
+    def colour(self, image_id: int) -> Optional[str]:
+        """Nom de la couleur dominante du flacon (None si image inconnue)."""
+        if image_id not in self:
+            return None
+        return colour_name(self.features[image_id, DOMINANT.start: DOMINANT.start + 3])
+
+    def colours(self) -> dict:
+        """{image_id: nom de couleur} pour toutes les images connues."""
+        return {int(i): self.colour(int(i)) for i in np.flatnonzero(self.known)}
+
+    def nearest(self, image_id: int, k: int = 4):
+        """
+        Flacons visuellement les plus proches : intersection d'histogrammes
+        (calcul vectorisé sur toutes les lignes), puis ratio d'aspect.
+        """
+        if image_id not in self:
+            return []
+        hists = self.features[:, HIST]
+        score = np.minimum(hists, hists[image_id]).sum(axis=1)
+        score -= 0.1 * np.abs(self.features[:, ASPECT] - self.features[image_id, ASPECT])
+        score[~self.known] = -np.inf
+        score[image_id] = -np.inf
+        best = np.argsort(score)[::-1][:k]
+        return [int(i) for i in best if np.isfinite(score[i])]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Calcule les caractéristiques visuelles des flacons.")
+    parser.add_argument("--images-dir", default=IMAGES_DIR)
+    parser.add_argument("--force", action="store_true", help="ignorer le cache et tout recalculer")
+    parser.add_argument("--workers", type=int, default=None)
+    args = parser.parse_args(argv)
+    result = build_features(args.images_dir, args.force, args.workers)
+    print(f"{result['images']} image(s), {result['computed']} recalculée(s) -> {FEATURES_FILE}")
+
+
+if __name__ == "__main__":
+    main()
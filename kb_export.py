@@ -0,0 +1,215 @@
+"""
+Export incrémental de la base de connaissances du chatbot Botpress.
+
+La base (CHATBOTBOTPRESSEXPORTER.bpz) était tenue à la main, à côté de
+Catalogue_Parfums_Complet.csv et parfums_composition.txt : chaque
+changement de catalogue imposait de tout reconstruire et tout recharger.
+
+Ici, un document Markdown par parfum est généré depuis le catalogue et
+les compositions, avec un hash de son contenu. Le manifeste de l'export
+précédent permet de n'émettre que les documents nouveaux ou modifiés :
+changer un prix ou une note donne un petit delta, pas une réindexation.
+
+    kb/docs/        tous les documents courants (<id>-<nom>.md)
+    kb/delta/       les documents changés depuis le dernier chargement +
+                    changes.json (ajoutés / modifiés / supprimés) : c'est
+                    ce qu'on charge
+    kb/manifest.json  {id: {"name", "file", "hash"}} du dernier export
+
+Tant que le delta n'a pas été chargé dans Botpress, les exports suivants
+s'y cumulent (un parfum ajouté puis supprimé en sort, un parfum modifié
+deux fois n'y est qu'une fois) ; une fois chargé, on le vide avec
+--consumed.
+
+Usage : python manage.py kb-export [--out kb] [--full] [--consumed]
+"""
+import hashlib
+import json
+import os
+import re
+import shutil
+import unicodedata
+from datetime import datetime
+from pathlib import Path
+
+KB_DIR = "kb"
+KB_FORMAT = 1
+MANIFEST_NAME = "manifest.json"
+CHANGES_NAME = "changes.json"
+
+
+def _slug(name: str) -> str:
+    text = unicodedata.normalize("NFKD", str(name)).encode("ascii", "ignore").decode("ascii")
+    return re.sub(r"[^a-z0-9]+", "-", text.lower()).strip("-") or "parfum"
+
+
+def _composition_lines(text) -> list:
+    """Lignes utiles d'un bloc de parfums_composition.txt (sans vides ni ';' final)."""
+    lines = []
+    for line in str(text or "").splitlines():
+        line = " ".join(line.split()).rstrip(";").strip()
+        # "### NOM" est le titre de section ; " : Homme" une étiquette perdue
+        if line and not line.startswith(("###", ":")):
+            lines.append(line)
+    return lines
+
+
+def render_document(parfum_id: int, row, composition) -> str:
+    """Document Markdown d'un parfum (le contenu hashé)."""
+    name = str(row["name"])
+    prices = " ; ".join(
+        f"{ml} ml = {float(row[f'price{ml}'] or 0):.0f} DH" for ml in (10, 20, 30)
+    )
+    lines = [
+        f"# {name}",
+        "",
+        f"Référence DJERIPERFUM : {parfum_id}",
+        f"Catégorie : {row['category']}",
+        f"Prix des décants : {prices}",
+    ]
+    details = [line for line in _composition_lines(composition) if not line.lower().startswith("catégorie")]
+    if details:
+        lines += ["", *details]
+    return "\n".join(lines) + "\n"
+
+
+def content_hash(text: str) -> str:
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+def build_documents(df, compositions_by_id) -> dict:
+    """{parfum_id: (nom, texte)} pour tout le catalogue."""
+    documents = {}
+    for _, row in df.iterrows():
+        parfum_id = int(row["image_id"])
+        documents[parfum_id] = (
+            str(row["name"]),
+            render_document(parfum_id, row, compositions_by_id.get(parfum_id)),
+        )
+    return documents
+
+
+def _load_manifest(out_dir: Path) -> dict:
+    try:
+        with (out_dir / MANIFEST_NAME).open("r", encoding="utf-8") as f:
+            manifest = json.load(f)
+    except (OSError, ValueError):
+        return {}
+    return manifest.get("documents", {}) if manifest.get("version") == KB_FORMAT else {}
+
+
+def _write(path: Path, text: str):
+    tmp = path.with_name(path.name + ".tmp")
+    tmp.write_text(text, encoding="utf-8")
+    os.replace(tmp, path)
+
+
+def _load_pending(delta_dir: Path) -> dict:
+    """Changements du delta pas encore chargé : {"exported_at", "added", "updated", "removed"}."""
+    try:
+        with (delta_dir / CHANGES_NAME).open("r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def _merge_changes(pending: dict, added, updated, removed) -> dict:
+    """
+    Cumule les changements d'un export ({id: entrée} par type) avec ceux du
+    delta en attente : ce qui compte est l'écart avec ce que Botpress a
+    déjà chargé.
+    """
+    state = {}
+    for kind in ("added", "updated", "removed"):
+        for entry in pending.get(kind, []):
+            state[int(entry["id"])] = (kind, entry)
+    for parfum_id, entry in added.items():
+        # supprimé puis recréé avant chargement : Botpress l'a déjà, c'est une modification
+        state[parfum_id] = ("updated" if state.get(parfum_id, ("",))[0] == "removed" else "added", entry)
+    for parfum_id, entry in updated.items():
+        kind = state.get(parfum_id, ("updated",))[0]
+        state[parfum_id] = ("added" if kind == "added" else "updated", entry)
+    for parfum_id, entry in removed.items():
+        if state.get(parfum_id, ("",))[0] == "added":
+            del state[parfum_id]  # ajouté puis supprimé : Botpress ne l'a jamais vu
+        else:
+            state[parfum_id] = ("removed", entry)
+    return {
+        kind: [entry | {"id": i} for i, (k, entry) in sorted(state.items()) if k == kind]
+        for kind in ("added", "updated", "removed")
+    }
+
+
+def consume_delta(out_dir=KB_DIR):
+    """Le delta a été chargé dans Botpress : on le vide."""
+    shutil.rmtree(Path(out_dir) / "delta", ignore_errors=True)
+
+
+def export(documents: dict, out_dir=KB_DIR, full=False) -> dict:
+    """
+    Écrit les documents nouveaux ou modifiés depuis le dernier export (tous
+    si `full`) dans docs/, supprime ceux des parfums disparus, et les cumule
+    dans delta/ avec les changements pas encore chargés.
+    Retourne {"documents", "added", "updated", "removed"} (listes d'ids de
+    cet export pour les trois derniers) et "pending" (nb de changements
+    dans le delta).
+    """
+    out_dir = Path(out_dir)
+    docs_dir = out_dir / "docs"
+    delta_dir = out_dir / "delta"
+    if full:
+        # tout est réémis : l'ancien delta est entièrement couvert
+        shutil.rmtree(docs_dir, ignore_errors=True)
+        consume_delta(out_dir)
+    docs_dir.mkdir(parents=True, exist_ok=True)
+    delta_dir.mkdir(exist_ok=True)
+    pending = _load_pending(delta_dir)
+
+    previous = {} if full else _load_manifest(out_dir)
+    manifest = {}
+    added, updated = [], []
+    for parfum_id, (name, text) in sorted(documents.items()):
+        key = str(parfum_id)
+        entry = {"name": name, "file": f"{parfum_id:04d}-{_slug(name)}.md", "hash": content_hash(text)}
+        manifest[key] = entry
+        old = previous.get(key)
+        if old == entry and (docs_dir / old["file"]).exists():
+            continue
+        if old is not None and old["file"] != entry["file"]:
+            (docs_dir / old["file"]).unlink(missing_ok=True)  # parfum renommé
+        _write(docs_dir / entry["file"], text)
+        shutil.copyfile(docs_dir / entry["file"], delta_dir / entry["file"])
+        (updated if old is not None else added).append(parfum_id)
+
+    removed = []
+    for key, old in previous.items():
+        if key not in manifest:
+            (docs_dir / old["file"]).unlink(missing_ok=True)
+            removed.append(int(key))
+
+    now = datetime.now().isoformat(timespec="seconds")
+    changes = {
+        "since": pending.get("since") or now,  # premier export pas encore chargé
+        "exported_at": now,
+        **_merge_changes(
+            pending,
+            {i: manifest[str(i)] for i in added},
+            {i: manifest[str(i)] for i in updated},
+            {i: previous[str(i)] for i in removed},
+        ),
+    }
+    # le delta ne garde que les documents des parfums ajoutés ou modifiés
+    keep = {entry["file"] for kind in ("added", "updated") for entry in changes[kind]}
+    for path in delta_dir.glob("*.md"):
+        if path.name not in keep:
+            path.unlink()
+    _write(delta_dir / CHANGES_NAME, json.dumps(changes, ensure_ascii=False, indent=2))
+    # le manifeste en dernier : un export interrompu sera refait au prochain lancement
+    _write(out_dir / MANIFEST_NAME, json.dumps({"version": KB_FORMAT, "documents": manifest}, ensure_ascii=False, indent=2))
+    return {
+        "documents": len(manifest),
+        "added": added,
+        "updated": updated,
+        "removed": sorted(removed),
+        "pending": sum(len(changes[kind]) for kind in ("added", "updated", "removed")),
+    }
@@ -0,0 +1,325 @@
+"""
+Test de charge : N sessions simultanées qui font de vrais parcours d'achat.
+
+Chaque session virtuelle pilote le vrai app.py via streamlit.testing
+(AppTest), dans un même process, comme le ferait le serveur Streamlit :
+les caches (st.cache_data / st.cache_resource) sont donc partagés et
+users.json est réellement lu / réécrit par chaque action.
+
+Parcours d'une session : inscription, puis pour chaque tour
+    page catégorie -> recherche -> fiche ?parfum_id= -> ajout au panier
+    -> modification du nombre de flacons -> validation de l'achat
+
+Le test tourne dans une copie temporaire du dépôt (users.json n'est pas
+touché). À la fin, on compare ce que chaque session croit avoir fait avec
+ce qui est réellement dans users.json (+ archives) : paniers et commandes
+perdus ou corrompus par des écritures concurrentes.
+
+Usage :
+    python loadtest.py --sessions 8 --rounds 3
+"""
+import argparse
+import json
+import random
+import shutil
+import tempfile
+import threading
+import time
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent
+CATEGORY_PAGES = {
+    "homme": "Parfums homme",
+    "femme": "Parfums femme",
+    "mixte": "Parfums mixte / niche",
+}
+THROTTLED = "Trop de tentatives"
+
+
+def prepare_workdir(users_file=None) -> Path:
+    """Copie app.py, ses modules et ses données dans un dossier temporaire."""
+    workdir = Path(tempfile.mkdtemp(prefix="djperfum-load-"))
+    for path in ROOT.iterdir():
+        if path.suffix in (".py", ".csv", ".txt") and path.name != "requirements.txt":
+            shutil.copy(path, workdir / path.name)
+    (workdir / "images").symlink_to(ROOT / "images", target_is_directory=True)
+    if users_file:
+        shutil.copy(users_file, workdir / "users.json")
+    else:
+        (workdir / "users.json").write_text("{}", encoding="utf-8")
+    return workdir
+
+
+def patch_apptest_for_threads():
+    """
+    AppTest est prévu pour une session à la fois :
+
+    - il installe un Runtime factice au début de chaque run et le retire à
+      la fin (Runtime._instance = None) : une session qui termine retirerait
+      le Runtime d'une autre en plein run. On garde donc le dernier Runtime
+      vu, partagé par toutes les sessions, comme sur le vrai serveur ;
+    - il crée un ScriptCache neuf, donc recompile app.py, à chaque run (et
+      ast.parse n'aime pas être appelé depuis plusieurs threads à la fois
+      en 3.11) : on partage un seul ScriptCache, comme le vrai serveur, qui
+      compile le script une fois ;
+    - il active l'option "global.appTest" le temps d'un run puis la remet à
+      sa valeur précédente : on l'active pour toute la durée du test, sinon
+      un run qui se termine la désactive sous les pieds des autres.
+    """
+    from streamlit import config
+    from streamlit.runtime import Runtime
+    from streamlit.runtime.scriptrunner.script_cache import ScriptCache
+
+    last = {}
+    shared_cache = ScriptCache()
+    get_bytecode = ScriptCache.get_bytecode
+
+    def instance(cls):
+        if cls._instance is not None:
+            last["runtime"] = cls._instance
+        if "runtime" not in last:
+            raise RuntimeError("Runtime hasn't been created!")
+        return last["runtime"]
+
+    def exists(cls):
+        return cls._instance is not None or "runtime" in last
+
+    config.set_option("global.appTest", True)
+    Runtime.instance = classmethod(instance)
+    Runtime.exists = classmethod(exists)
+    ScriptCache.get_bytecode = lambda self, script_path: get_bytecode(shared_cache, script_path)
+
+
+def percentile(values, p):
+    if not values:
+        return 0.0
+    values = sorted(values)
+    k = (len(values) - 1) * p / 100
+    low, high = int(k), min(int(k) + 1, len(values) - 1)
+    return values[low] + (values[high] - values[low]) * (k - low)
+
+
+class Shopper:
+    """Une session navigateur simulée + ce qu'elle est censée avoir enregistré."""
+
+    def __init__(self, app_path: Path, username: str, catalog: list, rng: random.Random, timeout: float):
+        from streamlit.testing.v1 import AppTest
+
+        self.at = AppTest.from_file(str(app_path), default_timeout=timeout)
+        self.username = username
+        self.catalog = catalog
+        self.rng = rng
+        self.latencies = []
+        self.errors = []
+        self.throttled = 0
+        self.expected_cart = []
+        self.expected_orders = []
+
+    # ---------- helpers ----------
+
+    def run(self, widget=None):
+        start = time.perf_counter()
+        (widget or self.at).run()
+        self.latencies.append(time.perf_counter() - start)
+        if self.at.exception:
+            self.errors.append(str(self.at.exception[0].value))
+
+    def nav(self, page):
+        self.run(self.at.sidebar.radio(key="nav_radio").set_value(page))
+
+    def button(self, label=None, key=None):
+        if key is not None:
+            return self.at.button(key=key)
+        return next(b for b in self.at.button if b.label == label)
+
+    def messages(self, kind):
+        return [str(m.value) for m in getattr(self.at, kind)]
+
+    # ---------- parcours ----------
+
+    def signup(self):
+        self.run()
+        self.nav("Login / Signup")
+        self.at.text_input(key="signup_user").input(self.username)
+        self.at.text_input(key="signup_pass").input("load")
+        self.run(self.button("Créer le compte").click())
+
+    def browse_and_search(self):
+        key, page = self.rng.choice(list(CATEGORY_PAGES.items()))
+        self.nav(page)
+        term = self.rng.choice(self.catalog)["name"].split()[0]
+        self.run(self.at.text_input(key=f"search_{key}").input(term))
+        self.run(self.at.text_input(key=f"search_{key}").input(""))
+
+    def add_from_detail(self):
+        parfum = self.rng.choice(self.catalog)
+        pid = parfum["image_id"]
+        self.at.query_params["parfum_id"] = str(pid)
+        self.run()
+        qte = self.rng.choice([10, 20, 30])
+        self.at.selectbox(key=f"detail_qty_{pid}").set_value(qte)
+        self.run(self.button(key=f"detail_add_cart_{pid}").click())
+        if any("Ajouté au panier" in m for m in self.messages("success")):
+            self.expected_cart.append({"name": parfum["name"], "qte_ml": qte, "units": 1})
+        self.at.query_params.pop("parfum_id", None)
+        self.run()
+
+    def edit_quantities_and_checkout(self):
+        self.nav("Panier")
+        if self.expected_cart:
+            units = self.rng.randint(2, 4)
+            self.run(self.at.number_input(key="cart_units_0").set_value(units))
+            self.expected_cart[0]["units"] = units
+        self.run(self.button("Valider l'achat").click())
+        if any("Achat validé" in m for m in self.messages("success")):
+            self.expected_orders.append(self.expected_cart)
+            self.expected_cart = []
+        elif any(THROTTLED in m for m in self.messages("error")):
+            self.throttled += 1
+
+    def flow(self, rounds: int):
+        try:
+            self.signup()
+            for _ in range(rounds):
+                self.browse_and_search()
+                self.add_from_detail()
+                self.add_from_detail()
+                self.edit_quantities_and_checkout()
+        except Exception as e:  # une session plantée ne doit pas arrêter les autres
+            self.errors.append(f"{type(e).__name__}: {e}")
+
+
+def _lines(items):
+    return sorted(
+        (str(i.get("name")), int(i.get("qte_ml", 0)), int(i.get("units", 1)))
+        for i in items
+    )
+
+
+def verify(workdir: Path, shoppers) -> dict:
+    """Compare l'état attendu de chaque session avec users.json + archives."""
+    import sys
+
+    sys.path.insert(0, str(workdir))
+    import order_archive
+
+    result = {"users_file_corrupted": False, "missing_users": 0, "lost_cart_updates": 0, "lost_orders": 0, "corrupted_orders": 0}
+    try:
+        users = json.loads((workdir / "users.json").read_text(encoding="utf-8"))
+    except ValueError:
+        result["users_file_corrupted"] = True
+        users = {}
+
+    archive_dir = workdir / order_archive.ARCHIVE_DIR
+    for shopper in shoppers:
+        record = users.get(shopper.username)
+        if record is None:
+            result["missing_users"] += 1
+            result["lost_orders"] += len(shopper.expected_orders)
+            continue
+        if _lines(record.get("cart", [])) != _lines(shopper.expected_cart):
+            result["lost_cart_updates"] += 1
+        stored = order_archive.read_user_orders(shopper.username, archive_dir) + record.get("history", [])
+        stored = [_lines(o.get("items", [])) for o in stored]
+        for expected in shopper.expected_orders:
+            expected = _lines(expected)
+            if expected in stored:
+                stored.remove(expected)
+            elif any({l[:2] for l in s} == {l[:2] for l in expected} for s in stored):
+                result["corrupted_orders"] += 1
+            else:
+                result["lost_orders"] += 1
+    return result
+
+
+def run_load_test(sessions: int = 8, rounds: int = 3, seed: int = 0, users_file=None, timeout: float = 60.0, keep=False) -> dict:
+    import os
+
+    import pandas as pd
+
+    workdir = prepare_workdir(users_file)
+    previous_cwd = os.getcwd()
+    os.chdir(workdir)  # app.py lit ses fichiers en chemins relatifs
+    try:
+        df = pd.read_csv("Catalogue_Parfums_Complet.csv").reset_index(drop=True)
+        catalog = [{"image_id": i + 1, "name": str(n)} for i, n in enumerate(df["name"])]
+
+        patch_apptest_for_threads()
+
+        # Une première session "à froid" remplit les caches, comme un premier visiteur
+        warm = Shopper(workdir / "app.py", "load_warmup", catalog, random.Random(seed), timeout)
+        warm.run()
+
+        shoppers = [
+            Shopper(workdir / "app.py", f"load_{i}", catalog, random.Random(seed + i + 1), timeout)
+            for i in range(sessions)
+        ]
+        threads = [threading.Thread(target=s.flow, args=(rounds,)) for s in shoppers]
+        start = time.perf_counter()
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        elapsed = time.perf_counter() - start
+
+        latencies = [lat for s in shoppers for lat in s.latencies]
+        report = {
+            "sessions": sessions,
+            "rounds": rounds,
+            "duration_s": elapsed,
+            "reruns": len(latencies),
+            "reruns_per_s": len(latencies) / elapsed if elapsed else 0.0,
+            "checkouts": sum(len(s.expected_orders) for s in shoppers),
+            "throttled_checkouts": sum(s.throttled for s in shoppers),
+            "p50_ms": percentile(latencies, 50) * 1000,
+            "p95_ms": percentile(latencies, 95) * 1000,
+            "p99_ms": percentile(latencies, 99) * 1000,
+            "errors": [e for s in shoppers for e in s.errors],
+        }
+        report.update(verify(workdir, shoppers))
+        return report
+    finally:
+        os.chdir(previous_cwd)
+        if not keep:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+
+def print_report(report: dict):
+    print(f"Sessions : {report['sessions']} x {report['rounds']} tour(s) en {report['duration_s']:.1f} s")
+    print(f"Reruns : {report['reruns']} ({report['reruns_per_s']:.1f}/s)")
+    print(f"Latence rerun : p50 {report['p50_ms']:.0f} ms | p95 {report['p95_ms']:.0f} ms | p99 {report['p99_ms']:.0f} ms")
+    print(f"Achats validés : {report['checkouts']} (dont bloqués par le rate limiting : {report['throttled_checkouts']})")
+    print(
+        "Intégrité : "
+        f"users.json corrompu={report['users_file_corrupted']} | "
+        f"comptes perdus={report['missing_users']} | "
+        f"paniers perdus={report['lost_cart_updates']} | "
+        f"commandes perdues={report['lost_orders']} | "
+        f"commandes corrompues={report['corrupted_orders']}"
+    )
+    if report["errors"]:
+        print(f"{len(report['errors'])} erreur(s), ex : {report['errors'][0]}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Test de charge des parcours boutique (AppTest).")
+    parser.add_argument("--sessions", type=int, default=8, help="nombre de sessions simultanées")
+    parser.add_argument("--rounds", type=int, default=3, help="parcours d'achat par session")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--users-file", help="users.json de départ (défaut : vide)")
+    parser.add_argument("--timeout", type=float, default=60.0, help="timeout d'un rerun (s)")
+    parser.add_argument("--keep", action="store_true", help="garder le dossier de travail")
+    parser.add_argument("--json", action="store_true", help="rapport en JSON")
+    args = parser.parse_args(argv)
+
+    report = run_load_test(args.sessions, args.rounds, args.seed, args.users_file, args.timeout, args.keep)
+    if args.json:
+        print(json.dumps(report, indent=2, ensure_ascii=False))
+    else:
+        print_report(report)
+    lost = report["lost_orders"] + report["lost_cart_updates"] + report["missing_users"] + report["corrupted_orders"]
+    return 1 if lost or report["users_file_corrupted"] else 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
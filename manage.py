@@ -0,0 +1,382 @@
+"""
+Commandes de maintenance hors ligne, sans passer par la page Admin.
+
+Elles utilisent la même couche données que app.py (shop_data.py), mais
+tournent dans leur propre process : les gros traitements ne ralentissent
+plus les reruns des clients.
+
+Usage :
+    python manage.py validate                       # CSV <-> images/ <-> compositions
+    python manage.py rebuild [--force]              # caractéristiques, vignettes, co-achats, instantané Arrow, index
+    python manage.py export-orders [-o fichier.csv] [--user X] [--from 2025-01-01] [--to ...]
+    python manage.py compact [--days 90]            # archivage + users.json migré et compacté
+    python manage.py migrate                        # users.json migré au schéma courant (models.py)
+    python manage.py ingest-orders lot.jsonl [...] [--create-users] [--dry-run]  # commandes des canaux
+    python manage.py kb-export [--out kb] [--full]  # documents du chatbot modifiés depuis le dernier export
+    python manage.py deps-check [--rounds 1]        # SMTP, jsdelivr, Botpress : latence + disjoncteurs
+    python manage.py send-outbox                    # renvoyer les messages de contact mis en file
+    python manage.py bench [options de loadtest.py] # préchauffage chronométré + test de charge
+    python manage.py complexity [--sizes 100,1000,10000]  # coût des opérations vs taille des données
+
+Code de sortie : 1 si `validate` ou `ingest-orders` trouve une erreur, si
+`deps-check` trouve une dépendance en échec, si `send-outbox` laisse des
+messages en file ou si `complexity` trouve une opération dont le coût
+dépasse sa déclaration (constante, ou au plus linéaire) ; 0 sinon.
+"""
+import argparse
+import sys
+from datetime import datetime, timedelta
+from pathlib import Path
+
+import pandas as pd
+from streamlit import logger as st_logger
+
+# hors serveur, Streamlit prévient à chaque cache que le runtime n'existe pas
+st_logger.set_log_level("error")
+
+import dependencies  # noqa: E402
+import image_features  # noqa: E402
+import kb_export  # noqa: E402
+import order_archive  # noqa: E402
+import order_ingest  # noqa: E402
+import product_grid  # noqa: E402
+import shop_data  # noqa: E402
+import static_images  # noqa: E402
+from catalog_store import SNAPSHOT_DIR  # noqa: E402
+from facets import parse_composition  # noqa: E402
+from models import SCHEMA_VERSION, UserRecord  # noqa: E402
+from order_index import COLUMNS as ORDER_COLUMNS  # noqa: E402
+from recommendations import COPURCHASE_FILE, load_matrix  # noqa: E402
+
+CATALOG_COLUMNS = ["category", "name", "price10", "price20", "price30"]
+
+
+# ================== VALIDATE ==================
+
+def validate_catalog() -> tuple:
+    """Retourne (erreurs, avertissements) : deux listes de messages."""
+    errors, warnings = [], []
+    try:
+        df = pd.read_csv(shop_data.CATALOG_CSV)
+    except Exception as exc:
+        return [f"{shop_data.CATALOG_CSV} illisible : {exc}"], warnings
+
+    missing = [col for col in CATALOG_COLUMNS if col not in df.columns]
+    if missing:
+        errors.append(f"colonnes manquantes dans le CSV : {', '.join(missing)}")
+        return errors, warnings
+
+    df = df.reset_index(drop=True)
+    df["image_id"] = df.index + 1  # même règle que load_catalog
+
+    names = df["name"].astype(str).str.strip()
+    for name in sorted(names[names.str.upper().duplicated()].unique()):
+        errors.append(f"nom en double : {name}")
+    for pos in df.index[names.eq("") | df["name"].isna()]:
+        errors.append(f"ligne {pos + 2} : nom vide")
+
+    for col in ("price10", "price20", "price30"):
+        prices = pd.to_numeric(df[col], errors="coerce")
+        for pos in df.index[prices.isna() | (prices <= 0)]:
+            errors.append(f"ligne {pos + 2} ({names[pos]}) : {col} invalide ({df.at[pos, col]!r})")
+
+    images_dir = Path(image_features.IMAGES_DIR)
+    expected = {f"{i}.png" for i in df["image_id"]}
+    for image_id, name in zip(df["image_id"], names):
+        if not (images_dir / f"{image_id}.png").exists():
+            errors.append(f"image manquante : {images_dir}/{image_id}.png ({name})")
+    for path in sorted(images_dir.glob("*.png")):
+        if path.name not in expected:
+            warnings.append(f"image sans ligne au catalogue : {path}")
+
+    compositions = {n.upper(): text for n, text in shop_data.load_compositions().items()}
+    catalog_names = set(names.str.upper())
+    for name in names:
+        text = compositions.get(name.upper())
+        if text is None:
+            warnings.append(f"composition absente : {name}")
+        elif not parse_composition(text)["famille"]:
+            warnings.append(f"composition sans famille olfactive : {name}")
+    for name in sorted(set(compositions) - catalog_names):
+        warnings.append(f"composition sans parfum au catalogue : {name}")
+
+    return errors, warnings
+
+
+def cmd_validate(args) -> int:
+    errors, warnings = validate_catalog()
+    for message in errors:
+        print(f"ERREUR  {message}")
+    for message in warnings:
+        print(f"ATTENTION  {message}")
+    print(f"{len(errors)} erreur(s), {len(warnings)} avertissement(s).")
+    return 1 if errors else 0
+
+
+# ================== REBUILD ==================
+
+def cmd_rebuild(args) -> int:
+    result = image_features.build_features(force=args.force)
+    print(f"Caractéristiques des flacons : {result['images']} image(s), {result['computed']} recalculée(s).")
+
+    # la matrice de co-achats est réamorcée depuis tout l'historique
+    Path(COPURCHASE_FILE).unlink(missing_ok=True)
+    matrix = shop_data.get_copurchase()
+    shop_data.mark_aggregates_changed()  # le serveur relira la nouvelle matrice
+    print(f"Co-achats : {matrix.orders} commande(s), {len(matrix.top)} parfum(s).")
+
+    result = product_grid.build_thumbnails()
+    print(f"Vignettes de la grille : {result['images']} image(s), {result['built']} générée(s).")
+    result = static_images.publish_images()
+    print(f"Images statiques : {result['images']} fichier(s) dans {static_images.PUBLISH_DIR}, {result['copied']} copié(s).")
+
+    version = shop_data.build_snapshot()
+    print(f"Instantané Arrow du catalogue : {SNAPSHOT_DIR} (version {version}).")
+
+    # le reste vit en mémoire du serveur : on vérifie juste qu'il se construit
+    import warmup
+
+    print("Index en mémoire :")
+    warmup.warm_up()
+    return 0
+
+
+# ================== EXPORT ==================
+
+def _parse_date(value: str) -> datetime:
+    return datetime.fromisoformat(value)
+
+
+def cmd_export_orders(args) -> int:
+    index = shop_data.get_order_index()
+    rows, total = index.query(
+        user=args.user,
+        parfum=args.parfum,
+        date_from=args.date_from,
+        date_to=args.date_to + timedelta(days=1) if args.date_to else None,
+        descending=False,
+        page_size=max(1, len(index)),
+    )
+    df = pd.DataFrame(rows, columns=ORDER_COLUMNS)
+    if args.output:
+        df.to_csv(args.output, index=False)
+        print(f"{total} ligne(s) de commande -> {args.output}")
+    else:
+        df.to_csv(sys.stdout, index=False)
+    return 0
+
+
+# ================== COMPACT / MIGRATE ==================
+
+def migrate_users(users: dict) -> int:
+    """
+    Migre en place chaque compte au schéma courant (models.py). Les noms de
+    parfums des anciens comptes sont résolus en parfum_id ici, une seule fois.
+    Retourne le nombre de comptes qui n'étaient pas à jour.
+    """
+    resolve = shop_data.get_name_resolver(shop_data.catalog_version())
+    outdated = 0
+    for username, data in users.items():
+        outdated += data.get("schema_version") != SCHEMA_VERSION
+        users[username] = UserRecord.from_dict(data, resolve=resolve).to_dict()
+    return outdated
+
+
+def cmd_migrate(args) -> int:
+    users = shop_data.load_users()
+    outdated = migrate_users(users)
+    shop_data.save_users(users)
+    print(f"{outdated} compte(s) migré(s) vers le schéma v{SCHEMA_VERSION} sur {len(users)}.")
+    return 0
+
+
+def cmd_compact(args) -> int:
+    users = shop_data.load_users()
+    result = order_archive.compact(users, args.days)
+    # chaque compte est migré au schéma courant puis réécrit compact
+    migrate_users(users)
+    shop_data.save_users(users)
+    print(
+        f"{result['orders']} commande(s) archivée(s) pour {result['users']} client(s), "
+        f"{len(users)} compte(s) réécrit(s) dans {shop_data.USERS_FILE}."
+    )
+    return 0
+
+
+# ================== IMPORT DES COMMANDES ==================
+
+def cmd_ingest_orders(args) -> int:
+    df = shop_data.read_catalog_csv()
+    resolve = shop_data.NameResolver(df)
+    users = shop_data.load_users()
+    seen = order_ingest.known_order_ids(users)  # partagé : pas de doublon d'un lot à l'autre
+    batch = {"accepted": [], "archived": []}
+    errors = 0
+    for path in args.files:
+        with open(path, "r", encoding="utf-8") as f:
+            result = order_ingest.ingest(f, users, df, resolve, create_users=args.create_users, seen=seen)
+        batch["accepted"] += result["accepted"]
+        batch["archived"] += result["archived"]
+        errors += len(result["errors"])
+        for number, reason in result["errors"]:
+            print(f"ERREUR  {path}:{number} : {reason}")
+        print(
+            f"{path} : {len(result['accepted']) + len(result['archived'])} commande(s) importée(s) "
+            f"sur {result['read']} (dont {len(result['archived'])} antidatée(s), archivée(s)), "
+            f"{result['duplicates']} déjà connue(s), {len(result['new_users'])} compte(s) créé(s)."
+        )
+
+    if args.dry_run:
+        print("--dry-run : rien n'est écrit.")
+    elif batch["accepted"] or batch["archived"]:
+        # archives d'abord : un arrêt avant users.json laisse des commandes
+        # déjà connues (ignorées au prochain import), jamais perdues
+        archived = order_ingest.write_archived(batch)
+        shop_data.save_users(users)  # une seule écriture pour tous les lots
+        # co-achats : mis à jour une fois (si la matrice n'existe pas encore,
+        # elle sera amorcée depuis l'historique, commandes importées comprises)
+        order_ingest.update_aggregates(batch["accepted"], copurchase=load_matrix(), archived=batch["archived"])
+        # un serveur en marche relit index et co-achats au lieu de les écraser
+        shop_data.mark_aggregates_changed()
+        print(
+            f"{len(batch['accepted'])} commande(s) écrite(s) dans {shop_data.USERS_FILE}, "
+            f"{archived} dans les archives."
+        )
+    return 1 if errors else 0
+
+
+# ================== BASE DE CONNAISSANCES ==================
+
+def cmd_kb_export(args) -> int:
+    if args.consumed:
+        kb_export.consume_delta(args.out)
+        print(f"Delta vidé : {Path(args.out) / 'delta'}")
+        return 0
+    version = shop_data.catalog_version()
+    df = shop_data.read_catalog_csv()
+    documents = kb_export.build_documents(
+        df, shop_data.compositions_by_id(df, shop_data.load_compositions(version))
+    )
+    result = kb_export.export(documents, args.out, full=args.full)
+    print(
+        f"{result['documents']} document(s) : {len(result['added'])} ajouté(s), "
+        f"{len(result['updated'])} modifié(s), {len(result['removed'])} supprimé(s)."
+    )
+    print(
+        f"À charger dans Botpress : {Path(args.out) / 'delta'} ({result['pending']} changement(s)), "
+        "puis : python manage.py kb-export --consumed"
+    )
+    return 0
+
+
+# ================== DÉPENDANCES EXTERNES ==================
+
+def _smtp_config():
+    try:
+        return dependencies.load_smtp_config()
+    except (OSError, KeyError, ValueError):
+        return None
+
+
+def cmd_deps_check(args) -> int:
+    failed = False
+    for round_number in range(1, args.rounds + 1):
+        if args.rounds > 1:
+            print(f"Tour {round_number} :")
+        failed = False
+        for name, outcome, seconds, state in dependencies.check_all(_smtp_config()):
+            failed |= outcome != "ok" and not outcome.startswith("non configuré")
+            print(f"  {name:<10} {seconds * 1000:8.1f} ms  disjoncteur {state:<12} {outcome}")
+    return 1 if failed else 0
+
+
+def cmd_send_outbox(args) -> int:
+    config = _smtp_config()
+    if config is None:
+        print(f"Configuration email manquante dans {dependencies.SECRETS_FILE} ([email]).")
+        return 1
+    sent, left = dependencies.flush_outbox(config)
+    print(f"{sent} message(s) envoyé(s), {left} encore en file ({dependencies.OUTBOX_FILE}).")
+    return 1 if left else 0
+
+
+# ================== BENCH ==================
+
+def cmd_bench(args) -> int:
+    import loadtest
+    import warmup
+
+    print("Préchauffage :")
+    warmup.warm_up()
+    print()
+    print("Test de charge :")
+    return loadtest.main(args.extra) or 0
+
+
+def cmd_complexity(args) -> int:
+    import complexity
+
+    return complexity.main(["--sizes", args.sizes])
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Maintenance hors ligne de la boutique.")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    p = commands.add_parser("validate", help="vérifier le CSV contre images/ et les compositions")
+    p.set_defaults(func=cmd_validate)
+
+    p = commands.add_parser("rebuild", help="reconstruire caractéristiques, co-achats, instantané et index")
+    p.add_argument("--force", action="store_true", help="recalculer toutes les images")
+    p.set_defaults(func=cmd_rebuild)
+
+    p = commands.add_parser("export-orders", help="exporter les lignes de commande en CSV")
+    p.add_argument("-o", "--output", help="fichier CSV (défaut : sortie standard)")
+    p.add_argument("--user")
+    p.add_argument("--parfum")
+    p.add_argument("--from", dest="date_from", type=_parse_date, help="AAAA-MM-JJ (inclus)")
+    p.add_argument("--to", dest="date_to", type=_parse_date, help="AAAA-MM-JJ (inclus)")
+    p.set_defaults(func=cmd_export_orders)
+
+    p = commands.add_parser("compact", help="archiver les vieilles commandes et compacter users.json")
+    p.add_argument("--days", type=int, default=order_archive.ARCHIVE_AFTER_DAYS)
+    p.set_defaults(func=cmd_compact)
+
+    p = commands.add_parser("migrate", help="migrer users.json au schéma courant")
+    p.set_defaults(func=cmd_migrate)
+
+    p = commands.add_parser("ingest-orders", help="importer des lots JSONL de commandes (Instagram, Botpress...)")
+    p.add_argument("files", nargs="+", help="fichiers JSONL, une commande par ligne")
+    p.add_argument("--create-users", action="store_true", help="créer les comptes clients inconnus")
+    p.add_argument("--dry-run", action="store_true", help="valider sans rien écrire")
+    p.set_defaults(func=cmd_ingest_orders)
+
+    p = commands.add_parser("kb-export", help="exporter la base de connaissances du chatbot (delta)")
+    p.add_argument("--out", default=kb_export.KB_DIR, help=f"dossier d'export (défaut : {kb_export.KB_DIR})")
+    p.add_argument("--full", action="store_true", help="réémettre tous les documents")
+    p.add_argument("--consumed", action="store_true", help="le delta a été chargé dans Botpress : le vider")
+    p.set_defaults(func=cmd_kb_export)
+
+    p = commands.add_parser("deps-check", help="tester SMTP, jsdelivr et Botpress (budgets, disjoncteurs)")
+    p.add_argument("--rounds", type=int, default=1, help="nombre de tours (montre l'ouverture des disjoncteurs)")
+    p.set_defaults(func=cmd_deps_check)
+
+    p = commands.add_parser("send-outbox", help="renvoyer les messages de contact mis en file")
+    p.set_defaults(func=cmd_send_outbox)
+
+    p = commands.add_parser("bench", help="préchauffage chronométré + test de charge (loadtest.py)")
+    p.set_defaults(func=cmd_bench)
+
+    p = commands.add_parser("complexity", help="coût des opérations sur des données x10 (complexity.py)")
+    p.add_argument("--sizes", default="100,1000,10000", help="tailles des jeux de données (défaut : %(default)s)")
+    p.set_defaults(func=cmd_complexity)
+
+    # les options inconnues de `bench` sont transmises à loadtest.py
+    args, args.extra = parser.parse_known_args(argv)
+    if args.extra and args.command != "bench":
+        parser.error(f"arguments non reconnus : {' '.join(args.extra)}")
+    return args.func(args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
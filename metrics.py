@@ -0,0 +1,242 @@
+"""
+Métriques de fonctionnement de la boutique, au format texte Prometheus.
+
+Compteurs et histogrammes en mémoire, partagés par toutes les sessions du
+process. Incrémenter coûte un accès dict + une addition sous un verrou :
+négligeable devant un rerun Streamlit.
+
+Export (optionnel, choisi par variables d'environnement) :
+
+    SHOP_METRICS_PORT=9108          endpoint http://127.0.0.1:9108/metrics
+    SHOP_METRICS_FILE=shop.prom     fichier réécrit toutes les 15 s
+                                    (textfile collector de node_exporter)
+
+Sans variable, les métriques sont juste tenues en mémoire (render()).
+"""
+import logging
+import os
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+
+# bornes par défaut (secondes) des histogrammes de durée
+DURATION_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+BYTES_BUCKETS = (1_000, 10_000, 100_000, 1_000_000, 10_000_000)
+EXPORT_INTERVAL = 15.0
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(names, values, extra="") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _number(value) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Counter:
+    def __init__(self, name: str, doc: str, labelnames=()):
+        self.name = name
+        self.doc = doc
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1, **labels):
+        key = tuple(labels.get(n, "") for n in self.labelnames)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels):
+        return self._values.get(tuple(labels.get(n, "") for n in self.labelnames), 0)
+
+    def render(self):
+        yield f"# HELP {self.name} {self.doc}"
+        yield f"# TYPE {self.name} counter"
+        with self._lock:
+            items = sorted(self._values.items())
+        for key, value in items:
+            yield f"{self.name}{_labels(self.labelnames, key)} {_number(value)}"
+
+
+class Histogram:
+    def __init__(self, name: str, doc: str, labelnames=(), buckets=DURATION_BUCKETS):
+        self.name = name
+        self.doc = doc
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(sorted(buckets)) + (float("inf"),)
+        self._series = {}  # labels -> [comptes par case (non cumulés), somme, nombre]
+        self._lock = threading.Lock()
+
+    def observe(self, value, **labels):
+        key = tuple(labels.get(n, "") for n in self.labelnames)
+        slot = bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [[0] * len(self.buckets), 0.0, 0]
+            series[0][slot] += 1
+            series[1] += value
+            series[2] += 1
+
+    @contextmanager
+    def time(self, **labels):
+        """with HISTO.time(page="Panier"): ... -> observe la durée en secondes."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def count(self, **labels):
+        series = self._series.get(tuple(labels.get(n, "") for n in self.labelnames))
+        return series[2] if series else 0
+
+    def render(self):
+        yield f"# HELP {self.name} {self.doc}"
+        yield f"# TYPE {self.name} histogram"
+        with self._lock:
+            items = sorted((key, (list(s[0]), s[1], s[2])) for key, s in self._series.items())
+        for key, (counts, total, count) in items:
+            cumulative = 0
+            for bound, n in zip(self.buckets, counts):
+                cumulative += n
+                le = f'le="{_number(bound)}"'
+                yield f"{self.name}_bucket{_labels(self.labelnames, key, le)} {cumulative}"
+            yield f"{self.name}_sum{_labels(self.labelnames, key)} {_number(total)}"
+            yield f"{self.name}_count{_labels(self.labelnames, key)} {count}"
+
+
+class Registry:
+    def __init__(self):
+        self.metrics = []
+
+    def counter(self, name, doc, labelnames=()) -> Counter:
+        metric = Counter(name, doc, labelnames)
+        self.metrics.append(metric)
+        return metric
+
+    def histogram(self, name, doc, labelnames=(), buckets=DURATION_BUCKETS) -> Histogram:
+        metric = Histogram(name, doc, labelnames, buckets)
+        self.metrics.append(metric)
+        return metric
+
+    def render(self) -> str:
+        lines = []
+        for metric in self.metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+
+# ================== MÉTRIQUES DE LA BOUTIQUE ==================
+
+RERUNS = REGISTRY.counter("shop_reruns_total", "Reruns du script, par page.", ["page"])
+ADD_TO_CART = REGISTRY.counter("shop_add_to_cart_total", "Ajouts au panier.")
+CHECKOUTS = REGISTRY.counter("shop_checkouts_total", "Validations d'achat, par résultat.", ["result"])
+CHECKOUT_SECONDS = REGISTRY.histogram("shop_checkout_seconds", "Durée d'une validation d'achat.")
+LOGINS = REGISTRY.counter("shop_login_attempts_total", "Tentatives de connexion, par résultat.", ["result"])
+SIGNUPS = REGISTRY.counter("shop_signups_total", "Créations de compte, par résultat.", ["result"])
+SAVE_USERS_SECONDS = REGISTRY.histogram("shop_save_users_seconds", "Durée d'écriture de users.json.")
+SAVE_USERS_BYTES = REGISTRY.histogram(
+    "shop_save_users_bytes", "Taille de users.json écrite.", buckets=BYTES_BUCKETS
+)
+CACHE_REQUESTS = REGISTRY.counter("shop_cache_requests_total", "Appels d'un loader en cache.", ["cache"])
+CACHE_MISSES = REGISTRY.counter(
+    "shop_cache_misses_total", "Appels d'un loader en cache qui ont dû recalculer.", ["cache"]
+)
+CONTACT_EMAILS = REGISTRY.counter("shop_contact_emails_total", "E-mails de contact, par résultat.", ["result"])
+SESSIONS_OFFLOADED = REGISTRY.counter(
+    "shop_sessions_offloaded_total", "Sessions inactives libérées de la mémoire (état déjà dans users.json)."
+)
+SESSIONS_REHYDRATED = REGISTRY.counter(
+    "shop_sessions_rehydrated_total", "Sessions déchargées relues depuis users.json au retour du client."
+)
+DEPENDENCY_CALLS = REGISTRY.counter(
+    "shop_dependency_calls_total",
+    "Appels aux dépendances externes, par résultat (ok, timeout, error, skipped, fallback).",
+    ["dependency", "result"],
+)
+DEPENDENCY_SECONDS = REGISTRY.histogram(
+    "shop_dependency_seconds", "Durée des appels aux dépendances externes (budget compris).", ["dependency"]
+)
+GUEST_CARTS_MERGED = REGISTRY.counter(
+    "shop_guest_carts_merged_total", "Paniers invités repris dans un compte à la connexion ou à l'inscription."
+)
+
+
+# ================== EXPORT ==================
+
+_exporter_lock = threading.Lock()
+_exporter_started = False
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split("?")[0] not in ("/", "/metrics"):
+            self.send_error(404)
+            return
+        body = REGISTRY.render().encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass  # pas de ligne de log par scrape
+
+
+def write_file(path):
+    """Écrit les métriques dans `path` (remplacement atomique)."""
+    path = Path(path)
+    tmp = path.with_name(path.name + ".tmp")
+    tmp.write_text(REGISTRY.render(), encoding="utf-8")
+    os.replace(tmp, path)
+
+
+def _file_loop(path, interval):
+    while True:
+        try:
+            write_file(path)
+        except OSError:
+            pass
+        time.sleep(interval)
+
+
+def start_exporter(port=None, path=None, interval=EXPORT_INTERVAL):
+    """
+    Démarre (une seule fois par process) l'endpoint HTTP local et/ou
+    l'écriture périodique du fichier. Par défaut : SHOP_METRICS_PORT /
+    SHOP_METRICS_FILE. Ne fait rien si aucun des deux n'est configuré.
+    """
+    global _exporter_started
+    port = port or os.environ.get("SHOP_METRICS_PORT")
+    path = path or os.environ.get("SHOP_METRICS_FILE")
+    with _exporter_lock:
+        if _exporter_started or not (port or path):
+            return
+        _exporter_started = True
+        if port:
+            try:
+                server = ThreadingHTTPServer(("127.0.0.1", int(port)), _MetricsHandler)
+            except (OSError, ValueError) as exc:
+                # port déjà pris (autre worker, redémarrage en TIME_WAIT) : pas
+                # d'endpoint ici, mais ni erreur au visiteur ni fichier perdu
+                logging.getLogger(__name__).warning("métriques : port %s indisponible (%s)", port, exc)
+            else:
+                threading.Thread(target=server.serve_forever, name="metrics-http", daemon=True).start()
+        if path:
+            threading.Thread(target=_file_loop, args=(path, interval), name="metrics-file", daemon=True).start()
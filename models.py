@@ -0,0 +1,179 @@
+"""
+Modèles typés des données client : lignes de panier, commandes, comptes.
+
+users.json reste un simple JSON, mais chaque enregistrement est validé et
+converti *une seule fois* au chargement (login, page Admin...) en objets
+compacts (dataclasses à __slots__). Les pages n'ont plus à refaire
+float(item["price"]) / int(item.get("units", 1)) à chaque rerun.
+
+Chaque compte porte un "schema_version" ; migrate_user() met à niveau les
+anciens enregistrements (ex : paniers sans champ "units").
+
+Depuis la v3, les parfums sont référencés par leur identifiant catalogue
+(parfum_id = image_id) : lignes de panier / commande (le nom y reste comme
+libellé figé au moment de l'achat) et favoris. La correspondance nom -> id
+n'est faite qu'aux bords (migration, import), via un `resolve(nom)` fourni
+par l'appelant (voir shop_data.get_name_resolver).
+"""
+from dataclasses import dataclass, field
+
+SCHEMA_VERSION = 3
+
+
+def _to_float(value, default=0.0) -> float:
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return default
+
+
+def _to_int(value, default=0) -> int:
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return default
+
+
+@dataclass(slots=True)
+class CartLine:
+    """Une ligne de panier / de commande : un décant, une taille, n flacons."""
+
+    name: str
+    price: float
+    qte_ml: int
+    units: int = 1
+    parfum_id: int = None  # None : parfum retiré du catalogue
+
+    @classmethod
+    def from_dict(cls, data: dict) -> "CartLine":
+        return cls(
+            name=str(data.get("name", "")),
+            price=_to_float(data.get("price")),
+            qte_ml=_to_int(data.get("qte_ml")),
+            units=max(1, _to_int(data.get("units"), 1)),
+            parfum_id=_to_int(data.get("parfum_id"), None),
+        )
+
+    def to_dict(self) -> dict:
+        return {
+            "parfum_id": self.parfum_id,
+            "name": self.name,
+            "price": self.price,
+            "qte_ml": self.qte_ml,
+            "units": self.units,
+        }
+
+    @property
+    def line_total(self) -> float:
+        return self.price * self.units
+
+
+@dataclass(slots=True)
+class Order:
+    """Une commande validée."""
+
+    items: list
+    total: float
+    timestamp: str = None
+    order_id: str = None  # identifiant unique (site : uuid ; canaux : celui du canal)
+    channel: str = None   # None : site ; "instagram", "botpress"... (order_ingest.py)
+
+    @classmethod
+    def from_dict(cls, data: dict) -> "Order":
+        return cls(
+            items=[CartLine.from_dict(i) for i in data.get("items", [])],
+            total=_to_float(data.get("total")),
+            timestamp=data.get("timestamp") or None,
+            order_id=data.get("order_id") or None,
+            channel=data.get("channel") or None,
+        )
+
+    def to_dict(self) -> dict:
+        data = {"items": [i.to_dict() for i in self.items], "total": self.total}
+        if self.timestamp:
+            data["timestamp"] = self.timestamp
+        if self.order_id:
+            data["order_id"] = self.order_id
+        if self.channel:
+            data["channel"] = self.channel
+        return data
+
+
+@dataclass(slots=True)
+class UserRecord:
+    """Un compte client tel que stocké dans users.json."""
+
+    password: str = ""
+    cart: list = field(default_factory=list)
+    favorites: set = field(default_factory=set)  # parfum_id
+    history: list = field(default_factory=list)
+
+    @classmethod
+    def from_dict(cls, data: dict, resolve=None) -> "UserRecord":
+        """`resolve(nom) -> parfum_id | None` : requis pour migrer un compte < v3."""
+        data = migrate_user(data, resolve)
+        return cls(
+            password=str(data.get("password", "")),
+            cart=[CartLine.from_dict(i) for i in data.get("cart", [])],
+            favorites={
+                parfum_id
+                for parfum_id in (_to_int(f, None) for f in data.get("favorites", []))
+                if parfum_id is not None
+            },
+            history=[Order.from_dict(o) for o in data.get("history", [])],
+        )
+
+    def to_dict(self) -> dict:
+        return {
+            "schema_version": SCHEMA_VERSION,
+            "password": self.password,
+            "cart": [i.to_dict() for i in self.cart],
+            "favorites": sorted(self.favorites),
+            "history": [o.to_dict() for o in self.history],
+        }
+
+
+# ================== MIGRATIONS ==================
+
+def _migrate_v1_to_v2(data: dict, resolve) -> dict:
+    """v1 (sans schema_version) : lignes de panier / commande sans "units"."""
+    for item in data.get("cart", []):
+        item.setdefault("units", 1)
+    for order in data.get("history", []):
+        for item in order.get("items", []):
+            item.setdefault("units", 1)
+    return data
+
+
+def _migrate_v2_to_v3(data: dict, resolve) -> dict:
+    """
+    v2 : parfums référencés par leur nom. On ajoute parfum_id aux lignes et
+    les favoris deviennent des ids (favoris dont le parfum n'existe plus :
+    abandonnés ; lignes : gardées, avec parfum_id None).
+    """
+    if resolve is None:
+        raise ValueError("migration v2 -> v3 : resolve(nom) requis")
+    for item in data.get("cart", []):
+        item.setdefault("parfum_id", resolve(item.get("name", "")))
+    for order in data.get("history", []):
+        for item in order.get("items", []):
+            item.setdefault("parfum_id", resolve(item.get("name", "")))
+    favorites = (resolve(name) for name in data.get("favorites", []))
+    data["favorites"] = sorted({f for f in favorites if f is not None})
+    return data
+
+
+MIGRATIONS = {
+    1: _migrate_v1_to_v2,
+    2: _migrate_v2_to_v3,
+}
+
+
+def migrate_user(data: dict, resolve=None) -> dict:
+    """Applique les migrations nécessaires, de la version stockée à SCHEMA_VERSION."""
+    version = _to_int(data.get("schema_version"), 1)
+    while version < SCHEMA_VERSION:
+        data = MIGRATIONS[version](data, resolve)
+        version += 1
+    data["schema_version"] = version
+    return data
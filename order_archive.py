@@ -0,0 +1,235 @@
+"""
+Archivage des anciennes commandes hors de users.json.
+
+Le champ "history" de chaque utilisateur grossit sans fin, et users.json est
+relu / réécrit en entier à chaque login, ajout au panier ou scan Admin.
+La compaction déplace les commandes plus anciennes qu'un âge donné vers
+des segments compressés, en ajout seul :
+
+    archives/
+        index.json                      petit index par utilisateur et date
+        orders-20250101T120000.jsonl.gz un segment par compaction
+
+Dans un segment, les commandes de chaque utilisateur forment un membre gzip
+séparé ; l'index garde son offset et sa taille, donc lire l'historique
+archivé d'un client ne décompresse que ses propres blocs.
+
+Invariant : pour un utilisateur, toutes les commandes datées avant son
+"archived_before" sont dans les archives. Une commande de ce type encore
+présente dans users.json (session ouverte pendant la compaction, crash
+entre l'écriture du segment et celle de users.json) est donc un doublon
+et est ignorée (voir hot_orders). Une commande antidatée arrivée après la
+compaction (import des canaux) va donc directement dans un segment
+(append_orders), sans passer par users.json.
+
+Usage en ligne de commande :
+    python order_archive.py --days 90
+"""
+import argparse
+import gzip
+import json
+import os
+from datetime import datetime, timedelta
+from pathlib import Path
+
+ARCHIVE_DIR = "archives"
+INDEX_FILE = "index.json"
+ARCHIVE_AFTER_DAYS = 90
+
+
+def _parse_ts(ts):
+    try:
+        return datetime.fromisoformat(ts) if ts else None
+    except (TypeError, ValueError):
+        return None
+
+
+def load_index(archive_dir=ARCHIVE_DIR) -> dict:
+    path = Path(archive_dir) / INDEX_FILE
+    if not path.exists():
+        return {"segments": [], "users": {}}
+    with path.open("r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def _save_index(index: dict, archive_dir=ARCHIVE_DIR):
+    """Écriture atomique (fichier temporaire + rename) : l'index n'est jamais à moitié écrit."""
+    path = Path(archive_dir) / INDEX_FILE
+    tmp = path.with_suffix(".tmp")
+    with tmp.open("w", encoding="utf-8") as f:
+        json.dump(index, f, ensure_ascii=False, indent=2)
+    os.replace(tmp, path)
+
+
+def archive_version(archive_dir=ARCHIVE_DIR) -> str:
+    """Change à chaque compaction (sert de clé de cache côté app)."""
+    try:
+        return str((Path(archive_dir) / INDEX_FILE).stat().st_mtime_ns)
+    except OSError:
+        return "absent"
+
+
+def is_archived(order, archived_before) -> bool:
+    """`order` : dict de users.json ou models.Order de la session."""
+    ts = order.get("timestamp") if isinstance(order, dict) else order.timestamp
+    dt = _parse_ts(ts)
+    return dt is not None and archived_before is not None and dt < archived_before
+
+
+def watermark(user_entry):
+    """"archived_before" d'une entrée d'index, en datetime (None : jamais compacté)."""
+    return _parse_ts((user_entry or {}).get("archived_before"))
+
+
+def hot_orders(history, user_entry) -> list:
+    """Retire de `history` les commandes déjà couvertes par les archives."""
+    archived_before = watermark(user_entry)
+    if archived_before is None:
+        return list(history)
+    return [o for o in history if not is_archived(o, archived_before)]
+
+
+def compact(users: dict, max_age_days: int = ARCHIVE_AFTER_DAYS, archive_dir=ARCHIVE_DIR, now=None) -> dict:
+    """
+    Déplace dans un nouveau segment les commandes de plus de `max_age_days`
+    jours (commandes sans date : laissées dans users.json). Modifie `users`
+    en place ; c'est à l'appelant de sauvegarder users.json ensuite.
+
+    Retourne {"orders": nb archivées, "users": nb clients touchés, "segment": nom}.
+    """
+    now = now or datetime.now()
+    cutoff = now - timedelta(days=max_age_days)
+    index = load_index(archive_dir)
+
+    to_archive = {}
+    for username, data in users.items():
+        old = [o for o in data.get("history", []) if is_archived(o, cutoff)]
+        if old:
+            to_archive[username] = old
+
+    if not to_archive:
+        return {"orders": 0, "users": 0, "segment": None}
+
+    segment, entries = _write_segment(to_archive, archive_dir, now)
+    index["segments"].append({"file": segment, "created": now.isoformat()})
+    for username, entry in entries.items():
+        user_index = index["users"].setdefault(username, {"archived_before": None, "blocks": []})
+        user_index["blocks"].append(entry)
+        previous = _parse_ts(user_index.get("archived_before"))
+        if previous is None or cutoff > previous:
+            user_index["archived_before"] = cutoff.isoformat()
+        users[username]["history"] = hot_orders(users[username].get("history", []), user_index)
+    _save_index(index, archive_dir)
+
+    return {
+        "orders": sum(e["count"] for e in entries.values()),
+        "users": len(entries),
+        "segment": segment,
+    }
+
+
+def append_orders(orders_by_user: dict, archive_dir=ARCHIVE_DIR, now=None) -> str:
+    """
+    Range dans un nouveau segment des commandes {client: [commande, ...]}
+    déjà sous le "archived_before" de leur client (commandes antidatées
+    importées après la compaction) ; les seuils ne bougent pas.
+    Retourne le nom du segment (None si rien à écrire).
+    """
+    orders_by_user = {u: orders for u, orders in orders_by_user.items() if orders}
+    if not orders_by_user:
+        return None
+    now = now or datetime.now()
+    index = load_index(archive_dir)
+    segment, entries = _write_segment(orders_by_user, archive_dir, now)
+    index["segments"].append({"file": segment, "created": now.isoformat()})
+    for username, entry in entries.items():
+        index["users"].setdefault(username, {"archived_before": None, "blocks": []})["blocks"].append(entry)
+    _save_index(index, archive_dir)
+    return segment
+
+
+def _write_segment(to_archive: dict, archive_dir, now):
+    """Écrit un segment (un membre gzip par client) ; retourne (nom, {client: bloc d'index})."""
+    Path(archive_dir).mkdir(parents=True, exist_ok=True)
+    segment = f"orders-{now.strftime('%Y%m%dT%H%M%S%f')}.jsonl.gz"
+    entries = {}
+    with (Path(archive_dir) / segment).open("xb") as f:
+        for username, orders in to_archive.items():
+            orders = sorted(orders, key=lambda o: o.get("timestamp", ""))
+            lines = "".join(json.dumps(o, ensure_ascii=False) + "\n" for o in orders)
+            blob = gzip.compress(lines.encode("utf-8"))
+            entries[username] = {
+                "segment": segment,
+                "offset": f.tell(),
+                "length": len(blob),
+                "count": len(orders),
+                "first": orders[0].get("timestamp"),
+                "last": orders[-1].get("timestamp"),
+            }
+            f.write(blob)
+        f.flush()
+        os.fsync(f.fileno())
+    return segment, entries
+
+
+def _read_block(archive_dir, block) -> list:
+    with (Path(archive_dir) / block["segment"]).open("rb") as f:
+        f.seek(block["offset"])
+        blob = f.read(block["length"])
+    text = gzip.decompress(blob).decode("utf-8")
+    return [json.loads(line) for line in text.splitlines() if line]
+
+
+def read_user_orders(username: str, archive_dir=ARCHIVE_DIR, index=None, since=None, until=None) -> list:
+    """
+    Commandes archivées d'un client, triées par date. `since` / `until`
+    (datetime) permettent de ne lire que les blocs qui recoupent la période.
+    """
+    index = index or load_index(archive_dir)
+    user_index = index["users"].get(username)
+    if not user_index:
+        return []
+    orders = []
+    for block in user_index["blocks"]:
+        if since and (_parse_ts(block["last"]) or since) < since:
+            continue
+        if until and (_parse_ts(block["first"]) or until) > until:
+            continue
+        orders.extend(_read_block(archive_dir, block))
+    orders.sort(key=lambda o: o.get("timestamp", ""))
+    return orders
+
+
+def iter_archived_orders(archive_dir=ARCHIVE_DIR):
+    """Toutes les commandes archivées : (username, commande). Pour la page Admin."""
+    index = load_index(archive_dir)
+    for username in index["users"]:
+        for order in read_user_orders(username, archive_dir, index):
+            yield username, order
+
+
+def archive_entry(username: str, archive_dir=ARCHIVE_DIR, index=None) -> dict:
+    """Entrée d'index d'un client (ou {}), à passer à hot_orders."""
+    index = index or load_index(archive_dir)
+    return index["users"].get(username, {})
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Archive les anciennes commandes de users.json.")
+    parser.add_argument("--users-file", default="users.json")
+    parser.add_argument("--archive-dir", default=ARCHIVE_DIR)
+    parser.add_argument("--days", type=int, default=ARCHIVE_AFTER_DAYS, help="âge minimum (jours) des commandes archivées")
+    args = parser.parse_args(argv)
+
+    path = Path(args.users_file)
+    with path.open("r", encoding="utf-8") as f:
+        users = json.load(f)
+    result = compact(users, args.days, args.archive_dir)
+    if result["orders"]:
+        with path.open("w", encoding="utf-8") as f:
+            json.dump(users, f, ensure_ascii=False, indent=2)
+    print(f"{result['orders']} commande(s) archivée(s) pour {result['users']} client(s).")
+
+
+if __name__ == "__main__":
+    main()
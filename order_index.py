@@ -0,0 +1,215 @@
+"""
+Index des lignes de commande pour le navigateur de commandes de l'Admin.
+
+Les lignes (un parfum d'une commande) sont stockées en colonnes, avec :
+- un index par client et un index par parfum (listes de lignes),
+- des ordres triés par date et par montant, pour les filtres de plage
+  (np.searchsorted) et les tris sans re-trier toute la table.
+
+Une requête renvoie une seule page de lignes + le nombre total de
+résultats : "toutes les commandes du client X le mois dernier" ne lit que
+les lignes de X, jamais tout users.json.
+
+L'index est construit une fois par process (voir get_order_index dans
+app.py), puis mis à jour à chaque achat avec add_order().
+"""
+import threading
+from datetime import datetime
+
+import numpy as np
+
+COLUMNS = [
+    "user",
+    "timestamp",
+    "parfum",
+    "qte_ml",
+    "nb_flacons",
+    "prix_unitaire_DH",
+    "total_ligne_DH",
+    "total_commande_DH",
+    "archivee",
+]
+
+SORT_KEYS = {
+    "Date": "date",
+    "Montant de la ligne": "amount",
+    "Montant de la commande": "order_amount",
+}
+
+
+def _epoch(ts) -> float:
+    """Timestamp ISO -> secondes ; commandes sans date rangées tout au début."""
+    try:
+        return datetime.fromisoformat(ts).timestamp()
+    except (TypeError, ValueError):
+        return float("-inf")
+
+
+class OrderIndex:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.rows = {name: [] for name in COLUMNS}
+        self.dates = []
+        self.by_user = {}
+        self.by_parfum = {}
+        self.user_totals = {}  # client -> [nb commandes, montant max]
+        self._order_keys = set()
+        self._sorted = {}
+
+    def __len__(self):
+        return len(self.dates)
+
+    # ---------- écriture ----------
+
+    def add_order(self, username: str, order, archived: bool = False) -> bool:
+        """
+        Ajoute les lignes d'une commande (models.Order). Une commande déjà
+        indexée est ignorée (pas de doublon si l'index est construit juste
+        après l'enregistrement de la commande) : reconnue par son order_id,
+        ou, pour les anciennes commandes sans identifiant, par client + date.
+        """
+        with self._lock:
+            if order.order_id:
+                key = ("id", order.order_id)
+            elif order.timestamp:
+                key = (username, order.timestamp)
+            else:
+                key = None
+            if key is not None:
+                if key in self._order_keys:
+                    return False
+                self._order_keys.add(key)
+
+            totals = self.user_totals.setdefault(username, [0, 0.0])
+            totals[0] += 1
+            totals[1] = max(totals[1], order.total)
+
+            date = _epoch(order.timestamp)
+            for item in order.items:
+                row = len(self.dates)
+                values = (
+                    username,
+                    order.timestamp,
+                    item.name,
+                    item.qte_ml,
+                    item.units,
+                    item.price,
+                    item.line_total,
+                    order.total,
+                    archived,
+                )
+                for name, value in zip(COLUMNS, values):
+                    self.rows[name].append(value)
+                self.dates.append(date)
+                self.by_user.setdefault(username, []).append(row)
+                self.by_parfum.setdefault(item.name, []).append(row)
+            self._sorted = {}  # ordres triés recalculés à la prochaine requête
+            return True
+
+    # ---------- lecture ----------
+
+    def _orders(self):
+        """Tableaux triés (calculés paresseusement après des ajouts)."""
+        if not self._sorted:
+            dates = np.asarray(self.dates, dtype=float)
+            amounts = np.asarray(self.rows["total_ligne_DH"], dtype=float)
+            order_amounts = np.asarray(self.rows["total_commande_DH"], dtype=float)
+            keys = {"date": dates, "amount": amounts, "order_amount": order_amounts}
+            self._sorted = {"values": keys}
+            for name, values in keys.items():
+                order = np.argsort(values, kind="stable")
+                rank = np.empty(len(order), dtype=np.int64)
+                rank[order] = np.arange(len(order))
+                self._sorted[name] = (order, values[order], rank)
+        return self._sorted
+
+    def users(self):
+        return sorted(self.by_user)
+
+    def parfums(self):
+        return sorted(self.by_parfum)
+
+    def query(
+        self,
+        user=None,
+        parfum=None,
+        date_from: datetime = None,
+        date_to: datetime = None,
+        min_amount: float = None,
+        max_amount: float = None,
+        sort: str = "date",
+        descending: bool = True,
+        page: int = 0,
+        page_size: int = 50,
+    ):
+        """
+        Retourne (lignes de la page [dict], nombre total de lignes filtrées).
+        `date_to` est exclu ; les montants portent sur le total de la ligne.
+        """
+        with self._lock:
+            sorted_ = self._orders()
+            candidates = None
+
+            # 1) index client / parfum : on part de la liste la plus courte
+            for mapping, key in ((self.by_user, user), (self.by_parfum, parfum)):
+                if key is None:
+                    continue
+                rows = np.asarray(mapping.get(key, []), dtype=np.int64)
+                candidates = rows if candidates is None else np.intersect1d(candidates, rows)
+
+            # 2) plage de dates : searchsorted sur l'ordre par date
+            if date_from is not None or date_to is not None:
+                order, values, _ = sorted_["date"]
+                lo = np.searchsorted(values, date_from.timestamp()) if date_from else 0
+                hi = np.searchsorted(values, date_to.timestamp()) if date_to else len(values)
+                if candidates is None:
+                    candidates = order[lo:hi]
+                else:
+                    dates = sorted_["values"]["date"][candidates]
+                    keep = np.ones(len(candidates), dtype=bool)
+                    if date_from:
+                        keep &= dates >= date_from.timestamp()
+                    if date_to:
+                        keep &= dates < date_to.timestamp()
+                    candidates = candidates[keep]
+
+            # 3) plage de montants
+            if min_amount is not None or max_amount is not None:
+                order, values, _ = sorted_["amount"]
+                if candidates is None:
+                    lo = np.searchsorted(values, min_amount) if min_amount is not None else 0
+                    hi = np.searchsorted(values, max_amount, side="right") if max_amount is not None else len(values)
+                    candidates = order[lo:hi]
+                else:
+                    amounts = sorted_["values"]["amount"][candidates]
+                    keep = np.ones(len(candidates), dtype=bool)
+                    if min_amount is not None:
+                        keep &= amounts >= min_amount
+                    if max_amount is not None:
+                        keep &= amounts <= max_amount
+                    candidates = candidates[keep]
+
+            # 4) tri puis découpe de la page
+            order, _, rank = sorted_[sort]
+            if candidates is None:
+                ordered = order[::-1] if descending else order
+            else:
+                ordered = candidates[np.argsort(rank[candidates], kind="stable")]
+                if descending:
+                    ordered = ordered[::-1]
+
+            total = len(ordered)
+            start = max(0, page) * page_size
+            page_rows = [
+                {name: self.rows[name][int(row)] for name in COLUMNS}
+                for row in ordered[start:start + page_size]
+            ]
+            return page_rows, total
+
+    def user_summary(self):
+        """[{"user", "nb_commandes", "montant_max_commande_DH"}] pour le résumé par client."""
+        with self._lock:
+            return [
+                {"user": username, "nb_commandes": count, "montant_max_commande_DH": best}
+                for username, (count, best) in sorted(self.user_totals.items())
+            ]
@@ -0,0 +1,189 @@
+"""
+Import groupé des commandes prises sur les autres canaux de vente (DM
+Instagram, bot Botpress) dans l'historique des clients (users.json).
+
+Un lot est un fichier JSONL, une commande par ligne :
+
+    {"order_id": "ig-2025-0042", "user": "sara", "channel": "instagram",
+     "timestamp": "2025-03-01T14:30:00",
+     "items": [{"parfum_id": 3, "qte_ml": 20, "units": 2},
+               {"name": "DIOR SAUVAGE", "qte_ml": 10, "price": 150}]}
+
+- chaque ligne est validée contre le catalogue : parfum par parfum_id ou
+  par nom, taille 10 / 20 / 30 ml, nombre de flacons ; le prix est celui du
+  catalogue sauf s'il est donné (prix négocié sur le canal) ;
+- l'import est idempotent : une commande dont l'order_id est déjà connu
+  (users.json, archives, ou plus haut dans le lot) est ignorée, on peut
+  donc rejouer un lot sans doublons ;
+- le lot entier est appliqué en mémoire puis écrit en une fois par
+  l'appelant (une écriture de users.json), et les agrégats de ventes
+  (index Admin, co-achats) sont mis à jour une fois par lot (update_aggregates) ;
+- une commande datée d'avant la dernière compaction de son client (commande
+  antidatée) n'entre pas dans users.json, où hot_orders l'effacerait : elle
+  est rangée dans un segment d'archive (write_archived, avant users.json).
+
+Une ligne invalide est signalée (numéro + raison) sans bloquer le reste du lot.
+
+Usage : python manage.py ingest-orders lot.jsonl [...] [--create-users] [--dry-run]
+ou page Admin > "Importer des commandes".
+"""
+import json
+import secrets
+from datetime import datetime
+
+import order_archive
+from models import CartLine, Order, UserRecord
+
+SIZES = (10, 20, 30)
+
+
+def known_order_ids(users: dict) -> set:
+    """order_id déjà enregistrés : users.json + archives."""
+    ids = {
+        order.get("order_id")
+        for data in users.values()
+        for order in data.get("history", [])
+    }
+    ids.update(order.get("order_id") for _, order in order_archive.iter_archived_orders())
+    ids.discard(None)
+    return ids
+
+
+def _catalog_row(df, parfum_id):
+    # image_id = position + 1 (voir shop_data.read_catalog_csv)
+    if parfum_id is None or not 1 <= parfum_id <= len(df):
+        return None
+    return df.iloc[parfum_id - 1]
+
+
+def parse_order(record: dict, df, resolve) -> Order:
+    """Commande validée depuis une ligne du lot ; ValueError sinon."""
+    order_id = str(record.get("order_id") or "").strip()
+    if not order_id:
+        raise ValueError("order_id manquant")
+    timestamp = record.get("timestamp") or datetime.now().isoformat(timespec="seconds")
+    try:
+        datetime.fromisoformat(timestamp)
+    except (TypeError, ValueError):
+        raise ValueError(f"timestamp invalide : {timestamp!r}") from None
+
+    items = record.get("items")
+    if not isinstance(items, list) or not items:
+        raise ValueError("aucun article")
+    lines = []
+    for n, item in enumerate(items, start=1):
+        if not isinstance(item, dict):
+            raise ValueError(f"article {n} : objet attendu")
+        parfum_id = item.get("parfum_id")
+        if parfum_id is None and item.get("name"):
+            parfum_id = resolve(item["name"])
+        try:
+            parfum_id = int(parfum_id) if parfum_id is not None else None
+        except (TypeError, ValueError):
+            parfum_id = None
+        row = _catalog_row(df, parfum_id)
+        if row is None:
+            raise ValueError(f"article {n} : parfum inconnu ({item.get('parfum_id') or item.get('name')!r})")
+        try:
+            qte_ml = int(item.get("qte_ml"))
+            units = int(item.get("units", 1))
+        except (TypeError, ValueError):
+            raise ValueError(f"article {n} : taille ou nombre de flacons invalide") from None
+        if qte_ml not in SIZES:
+            raise ValueError(f"article {n} : taille {qte_ml} ml non vendue")
+        if units < 1:
+            raise ValueError(f"article {n} : nombre de flacons invalide ({units})")
+        price = item.get("price")
+        price = float(row[f"price{qte_ml}"] or 0) if price is None else float(price)
+        if price <= 0:
+            raise ValueError(f"article {n} : prix invalide")
+        lines.append(CartLine(
+            name=str(row["name"]), price=price, qte_ml=qte_ml, units=units, parfum_id=parfum_id,
+        ))
+
+    return Order(
+        items=lines,
+        total=sum(line.line_total for line in lines),
+        timestamp=timestamp,
+        order_id=order_id,
+        channel=str(record.get("channel") or "") or None,
+    )
+
+
+def ingest(lines, users: dict, df, resolve, create_users=False, seen=None) -> dict:
+    """
+    Applique un lot (itérable de lignes JSONL) à `users` (modifié en place,
+    à sauver ensuite en une fois). Retourne :
+    {"read", "accepted": [(client, Order)], "archived": [(client, Order)],
+     "duplicates", "new_users", "errors": [(n° de ligne, raison)]}
+    "archived" : commandes antidatées, à écrire avec write_archived.
+    `seen` (order_id connus, complété ici) se partage entre plusieurs lots.
+    """
+    seen = known_order_ids(users) if seen is None else seen
+    archive_index = order_archive.load_index()
+    result = {"read": 0, "accepted": [], "archived": [], "duplicates": 0, "new_users": [], "errors": []}
+    for number, line in enumerate(lines, start=1):
+        line = line.strip()
+        if not line:
+            continue
+        result["read"] += 1
+        try:
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError as exc:
+                raise ValueError(f"JSON invalide ({exc.msg}, colonne {exc.colno})") from None
+            if not isinstance(record, dict):
+                raise ValueError("objet JSON attendu")
+            username = str(record.get("user") or "").strip()
+            if not username:
+                raise ValueError("client (user) manquant")
+            order = parse_order(record, df, resolve)
+        except ValueError as exc:
+            result["errors"].append((number, str(exc)))
+            continue
+
+        if order.order_id in seen:
+            result["duplicates"] += 1
+            continue
+        if username not in users:
+            if not create_users:
+                result["errors"].append((number, f"client inconnu : {username}"))
+                continue
+            # compte créé pour le client du canal ; mot de passe aléatoire, à réinitialiser
+            users[username] = UserRecord(password=secrets.token_urlsafe(16)).to_dict()
+            result["new_users"].append(username)
+
+        seen.add(order.order_id)
+        archived_before = order_archive.watermark(archive_index["users"].get(username))
+        if order_archive.is_archived(order, archived_before):
+            result["archived"].append((username, order))
+            continue
+        users[username].setdefault("history", []).append(order.to_dict())
+        result["accepted"].append((username, order))
+    return result
+
+
+def write_archived(result) -> int:
+    """Écrit les commandes antidatées d'un lot dans un segment d'archive ; retourne leur nombre."""
+    by_user = {}
+    for username, order in result["archived"]:
+        by_user.setdefault(username, []).append(order.to_dict())
+    order_archive.append_orders(by_user)
+    return len(result["archived"])
+
+
+def update_aggregates(accepted, order_index=None, copurchase=None, archived=()):
+    """
+    Agrégats de ventes mis à jour pour tout le lot (commandes `archived`
+    comprises, marquées archivées dans l'index) ; paniers ajoutés au journal
+    des co-achats en une écriture.
+    """
+    if order_index is not None:
+        for username, order in accepted:
+            order_index.add_order(username, order)
+        for username, order in archived:
+            order_index.add_order(username, order, archived=True)
+    if copurchase is not None:
+        copurchase.record(
+            [item.parfum_id for item in order.items] for _, order in [*accepted, *archived]
+        )
@@ -0,0 +1,101 @@
+"""
+Grille produits côté navigateur (composant Streamlit en HTML/JS simple).
+
+render_product_list crée, pour chaque parfum, colonnes + image + prix +
+lien + selectbox + number_input + deux boutons : tout repasse par le
+websocket à chaque rerun, et une recherche ou un tri = un rerun serveur.
+
+Ici, le composant reçoit une fois la tranche du catalogue de la page en
+JSON compact ({"fields": [...], "rows": [[...], ...]}) ; recherche, tri et
+pagination se font dans le navigateur, les vignettes sont chargées à
+l'affichage (IntersectionObserver). Seuls les événements reviennent à
+Python : ajout au panier, favori, ouverture d'une fiche.
+
+Le frontend est dans frontend/product_grid/index.html ; il parle le
+protocole des composants Streamlit directement (postMessage), sans build
+npm. Les vignettes (96 px) sont générées par build_thumbnails() dans
+frontend/product_grid/thumbs/, servies avec le composant.
+"""
+import json
+from pathlib import Path
+
+import streamlit.components.v1 as components
+
+FRONTEND_DIR = Path(__file__).resolve().parent / "frontend" / "product_grid"
+THUMBS_DIR = FRONTEND_DIR / "thumbs"
+THUMB_SIZE = 96
+PAGE_SIZE = 12
+
+FIELDS = ["id", "name", "price10", "price20", "price30"]
+
+_component = None
+
+
+def build_thumbnails(images_dir="images", size=THUMB_SIZE) -> dict:
+    """
+    Vignettes PNG de `size` px (plus grand côté) pour chaque images/<id>.png.
+    Une vignette plus récente que son image n'est pas refaite.
+    Retourne {"images": nb total, "built": nb générées}.
+    """
+    from PIL import Image
+
+    THUMBS_DIR.mkdir(parents=True, exist_ok=True)
+    total = built = 0
+    for source in Path(images_dir).glob("*.png"):
+        total += 1
+        target = THUMBS_DIR / source.name
+        if target.exists() and target.stat().st_mtime >= source.stat().st_mtime:
+            continue
+        with Image.open(source) as img:
+            img.thumbnail((size, size))
+            tmp = target.with_name(target.name + ".tmp")
+            img.save(tmp, format="PNG", optimize=True)
+        tmp.replace(target)
+        built += 1
+    return {"images": total, "built": built}
+
+
+def catalog_payload(df, positions, thumb_url=None) -> str:
+    """
+    JSON compact des lignes `positions` du catalogue, dans cet ordre.
+    `thumb_url(id)` (optionnel) ajoute le champ "thumb" : URL de la vignette
+    à utiliser au lieu de thumbs/<id>.png (images statiques hashées).
+    """
+    rows = []
+    for image_id, name, p10, p20, p30 in zip(
+        df["image_id"].take(positions),
+        df["name"].take(positions),
+        df["price10"].take(positions),
+        df["price20"].take(positions),
+        df["price30"].take(positions),
+    ):
+        rows.append([int(image_id), str(name), float(p10 or 0), float(p20 or 0), float(p30 or 0)])
+    fields = FIELDS
+    if thumb_url is not None:
+        fields = [*FIELDS, "thumb"]
+        for row in rows:
+            row.append(thumb_url(row[0]))
+    return json.dumps({"fields": fields, "rows": rows}, ensure_ascii=False, separators=(",", ":"))
+
+
+def product_grid(payload: str, visible_ids=None, logged_in: bool = False, page_size: int = PAGE_SIZE, key=None):
+    """
+    Affiche la grille. `visible_ids` (liste d'ids ou None = tout) restreint
+    les lignes affichées sans renvoyer le catalogue (filtres à facettes).
+
+    Retourne le dernier événement du navigateur, ou None :
+    {"event": "cart" | "fav" | "open", "id": int, "qte_ml": int, "units": int, "seq": int}
+    `seq` croît à chaque clic : l'appelant ne traite qu'une fois chaque valeur.
+    """
+    global _component
+    if _component is None:
+        # déclaré au premier affichage : les scripts hors ligne n'en ont pas besoin
+        _component = components.declare_component("product_grid", path=str(FRONTEND_DIR))
+    return _component(
+        products=payload,
+        visible=visible_ids,
+        logged_in=logged_in,
+        page_size=page_size,
+        key=key,
+        default=None,
+    )
@@ -0,0 +1,136 @@
+"""
+Limitation de débit en mémoire (token buckets) pour les actions coûteuses
+de la boutique : login, signup, formulaire de contact, validation d'achat.
+
+Chaque action a sa politique (capacité + vitesse de recharge). Une requête
+est identifiée par plusieurs clés (ex : "session:<id>", "user:<nom>") :
+elle passe seulement si *tous* ses buckets ont encore un jeton, sinon elle
+est rejetée tout de suite, sans toucher users.json ni le serveur SMTP.
+
+Le limiteur est partagé par toutes les sessions du process Streamlit
+(voir get_rate_limiter dans app.py).
+"""
+import threading
+import time
+from collections import Counter, OrderedDict
+
+# action -> (capacité du bucket, jetons rechargés par seconde)
+RATE_LIMITS = {
+    "login": (5, 1 / 12),      # 5 essais d'affilée, puis 1 toutes les 12 s
+    "signup": (3, 1 / 60),     # 3 comptes, puis 1 par minute
+    "contact": (2, 1 / 120),   # 2 emails, puis 1 toutes les 2 min
+    "checkout": (5, 1 / 30),   # 5 validations, puis 1 toutes les 30 s
+}
+
+# Au-delà de ce nombre de buckets suivis, on oublie les moins récemment
+# utilisés (LRU) : coût constant par requête, même pendant une rafale.
+MAX_BUCKETS = 10_000
+
+# Clés bloquées gardées pour le tableau Admin : au-delà de MAX_REJECTED_KEYS,
+# on ne conserve que les KEEP_REJECTED_KEYS plus fréquentes.
+MAX_REJECTED_KEYS = 2_000
+KEEP_REJECTED_KEYS = 500
+
+
+class TokenBucket:
+    """Bucket classique : `capacity` jetons max, rechargé de `rate` jetons/s."""
+
+    __slots__ = ("capacity", "rate", "tokens", "updated_at")
+
+    def __init__(self, capacity: float, rate: float, now: float):
+        self.capacity = float(capacity)
+        self.rate = float(rate)
+        self.tokens = float(capacity)
+        self.updated_at = now
+
+    def refill(self, now: float):
+        elapsed = now - self.updated_at
+        if elapsed > 0:
+            self.tokens = min(self.capacity, self.tokens + elapsed * self.rate)
+            self.updated_at = now
+
+    def wait_time(self) -> float:
+        """Secondes avant qu'un jeton soit disponible (0 si déjà dispo)."""
+        if self.tokens >= 1:
+            return 0.0
+        return (1 - self.tokens) / self.rate if self.rate > 0 else float("inf")
+
+
+class RateLimiter:
+    """
+    Ensemble de token buckets indexés par (action, clé), thread-safe.
+
+    hit(action, keys) consomme un jeton dans chaque bucket et retourne 0.0,
+    ou retourne le délai d'attente (en secondes) si l'un d'eux est vide ;
+    dans ce cas aucun jeton n'est consommé.
+    """
+
+    def __init__(self, limits=None, clock=time.monotonic, max_buckets=MAX_BUCKETS):
+        self.limits = dict(RATE_LIMITS if limits is None else limits)
+        self.clock = clock
+        self.max_buckets = max_buckets
+        self._buckets = OrderedDict()  # du moins au plus récemment utilisé
+        self._lock = threading.Lock()
+        self.allowed = Counter()
+        self.rejected = Counter()
+        self.rejected_keys = Counter()
+
+    def hit(self, action: str, keys) -> float:
+        if action not in self.limits:
+            return 0.0
+        capacity, rate = self.limits[action]
+        keys = [k for k in keys if k]
+
+        with self._lock:
+            now = self.clock()
+            buckets = []
+            for key in keys:
+                bucket = self._buckets.get((action, key))
+                if bucket is None:
+                    bucket = TokenBucket(capacity, rate, now)
+                    self._buckets[(action, key)] = bucket
+                else:
+                    bucket.refill(now)
+                    self._buckets.move_to_end((action, key))
+                buckets.append(bucket)
+            while len(self._buckets) > self.max_buckets:
+                self._buckets.popitem(last=False)
+
+            wait = max((b.wait_time() for b in buckets), default=0.0)
+            if wait > 0:
+                self.rejected[action] += 1
+                for key, bucket in zip(keys, buckets):
+                    if bucket.wait_time() > 0:
+                        self.rejected_keys[(action, key)] += 1
+                if len(self.rejected_keys) > MAX_REJECTED_KEYS:
+                    self.rejected_keys = Counter(
+                        dict(self.rejected_keys.most_common(KEEP_REJECTED_KEYS))
+                    )
+                return wait
+
+            for bucket in buckets:
+                bucket.tokens -= 1
+            self.allowed[action] += 1
+            return 0.0
+
+    def stats(self):
+        """Compteurs par action, pour la page Admin."""
+        with self._lock:
+            tracked = Counter(action for action, _ in self._buckets)
+            return [
+                {
+                    "action": action,
+                    "autorisees": self.allowed[action],
+                    "rejetees": self.rejected[action],
+                    "cles_suivies": tracked[action],
+                }
+                for action in self.limits
+            ]
+
+    def top_rejected(self, n: int = 10):
+        """Clés les plus souvent bloquées : [(action, clé, nb_rejets), ...]."""
+        with self._lock:
+            return [
+                (action, key, count)
+                for (action, key), count in self.rejected_keys.most_common(n)
+            ]
@@ -0,0 +1,195 @@
+"""
+Recommandations "les clients ont aussi acheté", à partir des commandes.
+
+On tient une matrice creuse de co-achats : counts[a][b] = nombre de
+commandes contenant à la fois les parfums a et b (parfum_id, comme les
+lignes de commande : pas de résolution de nom à l'affichage, et un parfum
+renommé garde ses co-achats). Elle est mise à jour à chaque achat
+(add_order), jamais reconstruite, et chaque parfum garde sa liste top-k
+précalculée : une lecture de recommandations est un simple accès dict.
+
+Comme les compteurs ne font qu'augmenter, le top-k d'un parfum ne peut
+changer que pour les voisins touchés par la nouvelle commande : il suffit
+de fusionner l'ancien top-k avec ces voisins.
+
+Sur disque, la matrice complète (copurchase.json) n'est réécrite qu'à
+l'amorçage et au compactage (warm-up, rebuild) ; un achat n'ajoute qu'une
+ligne au journal des paniers (copurchase.baskets.jsonl, record()), rejoué
+au chargement puis replié dans la matrice par compact_matrix().
+"""
+import json
+import os
+import threading
+from collections import Counter
+from pathlib import Path
+
+COPURCHASE_FILE = "copurchase.json"
+BASKETS_FILE = "copurchase.baskets.jsonl"  # une commande par ligne : [parfum_id, ...]
+TOP_K = 5
+# v1 : matrice indexée par nom ; un fichier v1 est ignoré, donc réamorcé une fois
+MATRIX_FORMAT = 2
+
+
+class CoPurchaseMatrix:
+    def __init__(self, top_k: int = TOP_K):
+        self.top_k = top_k
+        self.counts = {}
+        self.top = {}
+        self.orders = 0
+        self._lock = threading.Lock()
+
+    def add_order(self, items):
+        """Ajoute une commande (liste de parfum_id, doublons et None ignorés)."""
+        items = sorted({int(i) for i in items if i is not None})
+        with self._lock:
+            self.orders += 1
+            if len(items) < 2:
+                return
+            for a in items:
+                row = self.counts.setdefault(a, Counter())
+                others = [b for b in items if b != a]
+                for b in others:
+                    row[b] += 1
+                # fusion de l'ancien top-k avec les voisins qui viennent de bouger
+                candidates = {name for name, _ in self.top.get(a, [])} | set(others)
+                ranked = sorted(candidates, key=lambda b: (-row[b], b))[: self.top_k]
+                self.top[a] = [(b, row[b]) for b in ranked]
+
+    def record(self, baskets, log_path=BASKETS_FILE):
+        """
+        Ajoute des commandes (listes de parfum_id) et les note en fin de
+        journal, en une écriture : la matrice elle-même n'est pas réécrite.
+        """
+        baskets = [sorted({int(i) for i in items if i is not None}) for items in baskets]
+        for items in baskets:
+            self.add_order(items)
+        if baskets:
+            lines = "".join(json.dumps(items) + "\n" for items in baskets)
+            with self._lock, open(log_path, "a", encoding="utf-8") as f:
+                f.write(lines)
+
+    def also_bought(self, item: int, k: int = None):
+        """[(parfum_id, nb de commandes communes), ...] pour un parfum, en O(1)."""
+        return self.top.get(item, [])[: k or self.top_k]
+
+    def for_basket(self, items, k: int = None):
+        """
+        Suggestions pour un panier : on additionne les top-k de ses parfums
+        (hors parfums déjà dans le panier). Coût : taille du panier x k.
+        """
+        items = set(items)
+        scores = Counter()
+        for item in items:
+            for other, count in self.top.get(item, []):
+                if other not in items:
+                    scores[other] += count
+        return sorted(scores.items(), key=lambda x: (-x[1], x[0]))[: k or self.top_k]
+
+    # ---------- persistance ----------
+
+    def to_dict(self) -> dict:
+        with self._lock:
+            return {
+                "version": MATRIX_FORMAT,
+                "top_k": self.top_k,
+                "orders": self.orders,
+                "counts": {str(a): {str(b): n for b, n in row.items()} for a, row in self.counts.items()},
+            }
+
+    @classmethod
+    def from_dict(cls, data: dict) -> "CoPurchaseMatrix":
+        matrix = cls(data.get("top_k", TOP_K))
+        matrix.orders = data.get("orders", 0)
+        for a, row in data.get("counts", {}).items():
+            a = int(a)  # clés JSON : chaînes
+            row = matrix.counts[a] = Counter({int(b): n for b, n in row.items()})
+            ranked = sorted(row, key=lambda b: (-row[b], b))[: matrix.top_k]
+            matrix.top[a] = [(b, row[b]) for b in ranked]
+        return matrix
+
+    def save(self, path=COPURCHASE_FILE):
+        """Instantané complet (amorçage, compactage) ; les achats passent par record()."""
+        tmp = Path(f"{path}.tmp")
+        with tmp.open("w", encoding="utf-8") as f:
+            json.dump(self.to_dict(), f, ensure_ascii=False, separators=(",", ":"))
+        os.replace(tmp, path)
+
+
+def _pending_log(log_path) -> Path:
+    # journal mis de côté par un compactage en cours (ou interrompu)
+    return Path(f"{log_path}.compacting")
+
+
+def _replay(matrix: CoPurchaseMatrix, log_path):
+    try:
+        with open(log_path, "r", encoding="utf-8") as f:
+            lines = f.readlines()
+    except OSError:
+        return
+    for line in lines:
+        try:
+            items = json.loads(line)
+        except ValueError:
+            continue  # ligne tronquée par un arrêt pendant l'écriture
+        if isinstance(items, list):
+            matrix.add_order(items)
+
+
+def _load_snapshot(path):
+    path = Path(path)
+    if not path.exists():
+        return None
+    try:
+        with path.open("r", encoding="utf-8") as f:
+            data = json.load(f)
+        if data.get("version") != MATRIX_FORMAT:
+            return None
+        return CoPurchaseMatrix.from_dict(data)
+    except (OSError, ValueError, AttributeError):
+        return None
+
+
+def load_matrix(path=COPURCHASE_FILE, log_path=BASKETS_FILE):
+    """
+    Matrice sauvegardée + paniers du journal, ou None si elle n'a jamais
+    été construite (ou dans un ancien format).
+    """
+    matrix = _load_snapshot(path)
+    if matrix is not None:
+        _replay(matrix, _pending_log(log_path))
+        _replay(matrix, log_path)
+    return matrix
+
+
+def compact_matrix(path=COPURCHASE_FILE, log_path=BASKETS_FILE):
+    """
+    Replie le journal des paniers dans copurchase.json et retourne la
+    matrice à jour (None si elle n'a jamais été construite). Le journal est
+    d'abord renommé : les achats enregistrés pendant le compactage partent
+    dans un journal neuf, rejoué ensuite.
+    """
+    matrix = _load_snapshot(path)
+    if matrix is None:
+        return None
+    log_path, pending = Path(log_path), _pending_log(log_path)
+    if log_path.exists() and not pending.exists():
+        os.replace(log_path, pending)
+    _replay(matrix, pending)
+    matrix.save(path)
+    pending.unlink(missing_ok=True)
+    _replay(matrix, log_path)
+    return matrix
+
+
+def discard_baskets(log_path=BASKETS_FILE):
+    """Oublie le journal (matrice réamorcée depuis l'historique, qui l'inclut déjà)."""
+    Path(log_path).unlink(missing_ok=True)
+    _pending_log(log_path).unlink(missing_ok=True)
+
+
+def build_matrix(orders, top_k: int = TOP_K) -> CoPurchaseMatrix:
+    """Amorçage (une seule fois) depuis l'historique : `orders` = listes de parfum_id."""
+    matrix = CoPurchaseMatrix(top_k)
+    for items in orders:
+        matrix.add_order(items)
+    return matrix
@@ -0,0 +1,17 @@
+"""
+Point d'entrée ASGI de la boutique : app.py + en-têtes de cache immuables
+sur les images publiées en statique (voir static_images.py).
+
+    streamlit run server.py        (python warmup.py l'utilise s'il est disponible)
+    uvicorn server:app
+
+Nécessite une version de Streamlit qui fournit st.App ; sinon, lancer
+directement `streamlit run app.py` (les images statiques restent servies,
+sans l'en-tête immutable).
+"""
+import streamlit as st
+from starlette.middleware import Middleware
+
+from static_images import ImmutableImageCache
+
+app = st.App("app.py", middleware=[Middleware(ImmutableImageCache)])
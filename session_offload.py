@@ -0,0 +1,107 @@
+"""
+Déchargement des sessions inactives.
+
+Chaque onglet ouvert garde dans st.session_state le panier, les favoris et
+tout l'historique de commandes du client connecté, aussi longtemps que la
+session vit. Un onglet oublié occupe donc de la mémoire indéfiniment.
+
+IdleSessionManager suit la dernière activité de chaque session du process.
+Un thread de fond passe régulièrement : une session connectée inactive
+depuis plus de IDLE_TIMEOUT secondes voit ses clés lourdes retirées de la
+mémoire. Rien n'est écrit : app.py recopie déjà l'état dans users.json à
+chaque modification, et une copie prise par ce thread pourrait écraser ce
+qu'un autre onglet du même client vient d'enregistrer. Au prochain rerun,
+app.py voit les clés manquantes et relit l'état depuis users.json
+(rehydratation) sans que le client ne voie rien.
+
+La mémoire résidente suit ainsi les clients actifs, pas les onglets ouverts.
+
+    SHOP_SESSION_IDLE_SECONDS=900   délai d'inactivité (défaut : 15 min, 0 = désactivé)
+"""
+import os
+import threading
+import time
+
+import metrics
+
+IDLE_TIMEOUT = float(os.environ.get("SHOP_SESSION_IDLE_SECONDS", 15 * 60))
+OFFLOADED_KEYS = ("cart", "favorites", "history")
+
+
+def is_offloaded(state) -> bool:
+    """Vrai si une des clés lourdes a été libérée (session à rehydrater)."""
+    return any(key not in state for key in OFFLOADED_KEYS)
+
+
+class IdleSessionManager:
+    """
+    Registre {session_id: [dernière activité, session_state, utilisateur]},
+    thread-safe.
+
+    touch() et la libération des clés dans sweep() se font sous le même
+    verrou : une session qui revient pendant un passage est laissée
+    intacte.
+    """
+
+    def __init__(self, timeout=IDLE_TIMEOUT, clock=time.monotonic):
+        self.timeout = timeout
+        self.clock = clock
+        self._sessions = {}
+        self._lock = threading.Lock()
+        self._thread = None
+
+    def __len__(self):
+        return len(self._sessions)
+
+    def touch(self, session_id: str, state, username=None):
+        """Note l'activité d'une session (à appeler à chaque rerun)."""
+        with self._lock:
+            self._sessions[session_id] = [self.clock(), state, username]
+
+    def sweep(self) -> int:
+        """
+        Décharge les sessions connectées inactives et oublie toutes les
+        sessions inactives (le registre ne garde pas les onglets fermés en
+        vie). Retourne le nombre de sessions déchargées.
+        """
+        now = self.clock()
+        with self._lock:
+            idle = [
+                (session_id, entry) for session_id, entry in self._sessions.items()
+                if now - entry[0] > self.timeout
+            ]
+        offloaded = 0
+        for session_id, (seen, state, username) in idle:
+            with self._lock:
+                # la session a pu revenir entre-temps : on n'y touche que si elle est restée inactive
+                if self._sessions.get(session_id, [None])[0] != seen:
+                    continue
+                del self._sessions[session_id]
+                if username:
+                    for key in OFFLOADED_KEYS:
+                        if key in state:
+                            del state[key]
+                    offloaded += 1
+                    metrics.SESSIONS_OFFLOADED.inc()
+        return offloaded
+
+    def start(self, interval=None):
+        """Démarre (une fois) le thread de fond qui appelle sweep()."""
+        if self.timeout <= 0:
+            return
+        with self._lock:
+            if self._thread is not None:
+                return
+            interval = interval or min(60.0, self.timeout / 2)
+            self._thread = threading.Thread(
+                target=self._loop, args=(interval,), name="idle-sessions", daemon=True
+            )
+            self._thread.start()
+
+    def _loop(self, interval):
+        while True:
+            time.sleep(interval)
+            try:
+                self.sweep()
+            except Exception:
+                pass
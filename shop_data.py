@@ -0,0 +1,467 @@
+"""
+Couche données de la boutique, partagée par app.py, warmup.py et les
+scripts hors ligne : catalogue, compositions, index (facettes, vues
+catégorie, commandes, co-achats) et accès à users.json.
+
+Les fonctions de chargement sont des caches Streamlit (st.cache_data /
+st.cache_resource). Ces caches sont globaux au process : les appeler avant
+le démarrage du serveur (voir warmup.py) les remplit pour toutes les
+sessions qui suivront.
+
+Si l'instantané Arrow du catalogue (build_snapshot, catalog_store.py) est à
+jour, catalogue, compositions, facettes et vues catégorie en sont lus par
+memory-map au lieu d'être recalculés dans chaque process.
+"""
+import json
+from datetime import datetime
+from pathlib import Path
+
+import pandas as pd
+import streamlit as st
+
+import metrics
+import order_archive
+from catalog_store import open_snapshot, write_snapshot
+from catalog_views import SORT_OPTIONS, build_views
+from facets import FacetIndex, parse_composition
+from image_features import MANIFEST_FILE as FEATURES_MANIFEST, FeatureStore
+from models import CartLine, Order, UserRecord
+from order_index import OrderIndex
+from product_grid import build_thumbnails, catalog_payload
+from recommendations import build_matrix, compact_matrix, discard_baskets
+from static_images import ImageUrls, publish_images
+
+# ================== CONSTANTES ======================
+
+CATALOG_CSV = "Catalogue_Parfums_Complet.csv"   # ton CSV actuel
+USERS_FILE = "users.json"
+# touché par les commandes manage.py qui modifient les agrégats de ventes
+AGGREGATES_STAMP = Path(".cache") / "aggregates.stamp"
+COMPO_FILE = "parfums_composition.txt"          # nouveau fichier texte
+
+# Pages catégorie : clé -> valeurs de la colonne "category" affichées
+CATEGORY_PAGES = {
+    "homme": ["Homme"],
+    "femme": ["Femme"],
+    "mixte": ["Niche", "Mixte"],
+}
+
+# ================== CATALOGUE ==================
+
+def catalog_version() -> str:
+    """
+    Version du catalogue = taille + date de modification du CSV, du fichier
+    de compositions et du manifeste des caractéristiques visuelles. Elle sert
+    de clé aux caches ci-dessous : modifier un de ces fichiers reconstruit le
+    catalogue et tout ce qui en dérive.
+    """
+    parts = []
+    for name in (CATALOG_CSV, COMPO_FILE, FEATURES_MANIFEST):
+        try:
+            stat = Path(name).stat()
+            parts.append(f"{stat.st_size}-{stat.st_mtime_ns}")
+        except OSError:
+            parts.append("absent")
+    return "/".join(parts)
+
+
+@st.cache_resource
+def get_snapshot(version: str = ""):
+    """
+    Instantané Arrow memory-mappé du catalogue (catalog_store.py), ou None
+    s'il n'a pas été construit pour cette version : on lit alors les sources.
+    """
+    return open_snapshot(version)
+
+
+def load_catalog(version: str = ""):
+    """
+    Catalogue de la version donnée : colonnes memory-mappées de l'instantané
+    s'il est à jour, sinon lecture du CSV. Le DataFrame est partagé par
+    toutes les sessions, sans copie : il ne doit pas être modifié en place.
+    """
+    metrics.CACHE_REQUESTS.inc(cache="load_catalog")
+    return _load_catalog(version)
+
+
+@st.cache_resource
+def _load_catalog(version: str = ""):
+    # n'est exécuté qu'en cas de défaut de cache
+    metrics.CACHE_MISSES.inc(cache="load_catalog")
+    snapshot = get_snapshot(version)
+    if snapshot is not None:
+        return snapshot.catalog
+    return read_catalog_csv()
+
+
+def read_catalog_csv():
+    """
+    Charge le catalogue CSV et force un ID interne cohérent :
+
+    - image_id = index de la ligne + 1
+    - image_path = images/{image_id}.png
+
+    Donc la ligne 1 du CSV = id 1 = images/1.png
+         la ligne 2 du CSV = id 2 = images/2.png
+         etc.
+    """
+    try:
+        df = pd.read_csv(CATALOG_CSV)
+    except Exception:
+        return pd.DataFrame()
+
+    # On ignore complètement les colonnes d'ID existantes,
+    # on repart sur un index propre.
+    df = df.reset_index(drop=True)
+    df["image_id"] = df.index + 1
+    df["image_path"] = df["image_id"].apply(lambda i: f"images/{i}.png")
+    return df
+
+
+@st.cache_data
+def load_compositions(version: str = ""):
+    """
+    Lit parfums_composition.txt avec des sections de type:
+
+    ### NOM DU PARFUM
+    Famille olfactive : ...
+    Notes de tête : ...
+    Notes de cœur : ...
+    Notes de fond : ...
+
+    et retourne un dict {nom: texte_markdown}
+    """
+    path = Path(COMPO_FILE)
+    if not path.exists():
+        return {}
+
+    compositions = {}
+    current_name = None
+    buffer = []
+
+    with path.open("r", encoding="utf-8") as f:
+        for line in f:
+            line = line.rstrip("\n")
+            if line.startswith("### "):
+                # on ferme l’ancien bloc
+                if current_name is not None:
+                    compositions[current_name] = "\n".join(buffer).strip()
+                current_name = line[4:].strip()
+                buffer = []
+            else:
+                buffer.append(line)
+
+    # dernier bloc
+    if current_name is not None:
+        compositions[current_name] = "\n".join(buffer).strip()
+
+    return compositions
+
+
+def canonical_name(name) -> str:
+    """Forme canonique d'un nom de parfum : majuscules, espaces normalisés."""
+    return " ".join(str(name).split()).upper()
+
+
+class NameResolver:
+    """
+    Nom de parfum -> parfum_id (image_id), pour les seuls bords de l'app :
+    migration des anciens comptes et des anciennes commandes, imports.
+    En cas de doublon de nom dans le CSV, le premier parfum l'emporte.
+    """
+
+    def __init__(self, df):
+        self.ids = {}
+        if not df.empty:
+            for image_id, name in zip(df["image_id"], df["name"]):
+                self.ids.setdefault(canonical_name(name), int(image_id))
+
+    def __call__(self, name):
+        return self.ids.get(canonical_name(name))
+
+
+def parfum_row(df, parfum_id):
+    """
+    Ligne du catalogue d'un parfum, ou None si introuvable. image_id =
+    position + 1 (voir read_catalog_csv) : accès direct, sans parcourir le
+    catalogue.
+    """
+    if df is None or parfum_id is None:
+        return None
+    try:
+        parfum_id = int(parfum_id)
+    except (TypeError, ValueError):
+        return None
+    if not 1 <= parfum_id <= len(df):
+        return None
+    return df.iloc[parfum_id - 1]
+
+
+def priced_lines(df, lines):
+    """
+    CartLine au prix actuel du catalogue pour des lignes (parfum_id, qte_ml,
+    flacons). Retourne (CartLine, lignes ignorées : parfum inconnu, taille
+    non vendue ou sans prix).
+    """
+    items, skipped = [], []
+    for parfum_id, qte_ml, units in lines:
+        row = parfum_row(df, parfum_id)
+        price = float(row.get(f"price{qte_ml}", 0) or 0) if row is not None else 0.0
+        if row is None or qte_ml not in (10, 20, 30) or price <= 0:
+            skipped.append((parfum_id, qte_ml, units))
+            continue
+        items.append(CartLine(
+            name=str(row["name"]),
+            price=price,
+            qte_ml=int(qte_ml),
+            units=max(1, int(units or 1)),
+            parfum_id=int(parfum_id),
+        ))
+    return items, skipped
+
+
+@st.cache_resource
+def get_name_resolver(version: str = ""):
+    return NameResolver(load_catalog(version))
+
+
+@st.cache_resource
+def load_compositions_by_id(version: str = ""):
+    """{parfum_id: texte_markdown} : la fiche parfum n'a plus à chercher par nom."""
+    snapshot = get_snapshot(version)
+    if snapshot is not None:
+        return snapshot.compositions
+    return compositions_by_id(load_catalog(version), load_compositions(version))
+
+
+def compositions_by_id(df, compositions: dict) -> dict:
+    resolve = NameResolver(df)
+    by_id = {}
+    for name, text in compositions.items():
+        parfum_id = resolve(name)
+        if parfum_id is not None:
+            by_id[parfum_id] = text
+    return by_id
+
+
+@st.cache_resource
+def get_image_features(version: str = ""):
+    """
+    Caractéristiques visuelles des flacons (memory-map, voir image_features.py),
+    ou None si le job `python image_features.py` n'a pas encore tourné.
+    Aucune image n'est lue ici.
+    """
+    return FeatureStore.load()
+
+
+@st.cache_resource
+def get_facet_index(version: str = ""):
+    """
+    Bitsets des facettes (catégorie, prix, famille, notes, couleur du
+    flacon), construits une seule fois par version du catalogue. Voir facets.py.
+    """
+    snapshot = get_snapshot(version)
+    if snapshot is not None:
+        return snapshot.facet_index()
+    return build_facet_index(load_catalog(version), load_compositions(version), get_image_features(version))
+
+
+def build_facet_index(df, compositions: dict, features) -> FacetIndex:
+    fields = {
+        name.upper(): parse_composition(text)
+        for name, text in compositions.items()
+    }
+    colours = features.colours() if features is not None else {}
+    return FacetIndex.build(df, fields, colours)
+
+
+@st.cache_resource
+def get_category_views(version: str = ""):
+    """Lignes + ordres de tri précalculés de chaque page catégorie (catalog_views.py)."""
+    snapshot = get_snapshot(version)
+    views = snapshot.views(get_facet_index(version), CATEGORY_PAGES) if snapshot is not None else None
+    if views is None:
+        views = build_views(load_catalog(version), get_facet_index(version), CATEGORY_PAGES)
+    return views
+
+
+@st.cache_resource
+def get_grid_payload(page: str, version: str = "") -> str:
+    """JSON compact de la page catégorie pour la grille navigateur (product_grid.py), ordre Nom A-Z."""
+    view = get_category_views(version)[page]
+    urls = get_image_urls(version)
+    thumb_url = (lambda parfum_id: urls.url(parfum_id, "thumb")) if urls is not None else None
+    return catalog_payload(load_catalog(version), view.ordered_positions(SORT_OPTIONS[0]), thumb_url)
+
+
+@st.cache_resource
+def get_thumbnails(version: str = "") -> dict:
+    """Vignettes de la grille navigateur, (re)générées une fois par version du catalogue."""
+    return build_thumbnails()
+
+
+@st.cache_resource
+def get_image_urls(version: str = ""):
+    """
+    URL statiques hashées des images (static_images.py), publiées une fois
+    par version du catalogue ; None si server.enableStaticServing est désactivé.
+    """
+    if not st.get_option("server.enableStaticServing"):
+        return None
+    get_thumbnails(version)
+    publish_images()
+    return ImageUrls.load()
+
+
+def build_snapshot() -> str:
+    """
+    Construit l'instantané Arrow (catalog_store.py) depuis les sources, sans
+    passer par les caches, et retourne la version écrite. Les process qui
+    démarrent ensuite (ou dont la version change) le memory-mappent.
+    """
+    version = catalog_version()
+    df = read_catalog_csv()
+    compositions = load_compositions(version)
+    facet_index = build_facet_index(df, compositions, FeatureStore.load())
+    views = build_views(df, facet_index, CATEGORY_PAGES)
+    write_snapshot(version, df, compositions_by_id(df, compositions), facet_index, views)
+    return version
+
+
+# ================== COMPTES & COMMANDES ==================
+
+def load_users():
+    """Charge le fichier users.json (ou dict vide)."""
+    path = Path(USERS_FILE)
+    if not path.exists():
+        return {}
+    try:
+        with path.open("r", encoding="utf-8") as f:
+            return json.load(f)
+    except Exception:
+        return {}
+
+
+def save_users(users: dict):
+    """Sauvegarde le dictionnaire d’utilisateurs dans users.json (JSON compact)."""
+    path = Path(USERS_FILE)
+    with metrics.SAVE_USERS_SECONDS.time():
+        payload = json.dumps(users, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+        path.write_bytes(payload)
+    metrics.SAVE_USERS_BYTES.observe(len(payload))
+
+
+def store_user_state(username: str, state):
+    """
+    Recopie l'état de session d'un client (password_plain, cart, favorites,
+    history) dans users.json. `state` est st.session_state ou tout mapping
+    équivalent : app.py l'appelle après chaque modification (c'est ce qui
+    permet à session_offload.py de libérer une session inactive sans écrire).
+    """
+    users = load_users()
+    record = UserRecord(
+        password=state.get("password_plain") or "",
+        cart=state.get("cart", []),
+        favorites=state.get("favorites", set()),
+        history=state.get("history", []),
+    ).to_dict()
+    # commandes enregistrées depuis le chargement de la session (import des
+    # canaux, autre onglet) : identifiées par order_id, on ne les écrase pas
+    in_session = {order.get("order_id") for order in record["history"]}
+    added = [
+        order for order in users.get(username, {}).get("history", [])
+        if order.get("order_id") and order["order_id"] not in in_session
+    ]
+    if added:
+        record["history"] = sorted(record["history"] + added, key=lambda o: o.get("timestamp") or "")
+    # les commandes déjà archivées ne reviennent pas dans users.json
+    record["history"] = order_archive.hot_orders(
+        record["history"], order_archive.archive_entry(username)
+    )
+    users[username] = record
+    save_users(users)
+
+
+@st.cache_data
+def load_archived_orders(username: str, version: str = ""):
+    """
+    Commandes archivées d'un client (relues seulement après une compaction).
+    Les lignes archivées avant la v3 reçoivent leur parfum_id ici, une fois.
+    """
+    resolve = get_name_resolver(catalog_version())
+    orders = [Order.from_dict(o) for o in order_archive.read_user_orders(username)]
+    for order in orders:
+        for item in order.items:
+            if item.parfum_id is None:
+                item.parfum_id = resolve(item.name)
+    return orders
+
+
+def aggregates_version() -> str:
+    """
+    Change quand un autre process (import ou rebuild en ligne de commande)
+    a modifié users.json ou copurchase.json : clé de cache des agrégats
+    ci-dessous, qui sont relus au lieu d'être écrasés par le serveur.
+    """
+    try:
+        return str(AGGREGATES_STAMP.stat().st_mtime_ns)
+    except OSError:
+        return "absent"
+
+
+def mark_aggregates_changed():
+    """À appeler après avoir modifié les agrégats hors du serveur."""
+    AGGREGATES_STAMP.parent.mkdir(exist_ok=True)
+    AGGREGATES_STAMP.write_text(datetime.now().isoformat(), encoding="utf-8")
+
+
+@st.cache_resource(max_entries=1)
+def get_order_index(version: str = ""):
+    """
+    Index des commandes (client, parfum, date, montant) pour la page Admin,
+    construit une fois par process (et par aggregates_version()) puis tenu
+    à jour à chaque achat.
+    """
+    users = load_users()
+    archive_index = order_archive.load_index()
+    index = OrderIndex()
+    for username, data in users.items():
+        for order in order_archive.hot_orders(
+            data.get("history", []), archive_index["users"].get(username)
+        ):
+            index.add_order(username, Order.from_dict(order))
+    for username, order in order_archive.iter_archived_orders():
+        index.add_order(username, Order.from_dict(order), archived=True)
+    return index
+
+
+@st.cache_resource(max_entries=1)
+def get_copurchase(version: str = ""):
+    """
+    Matrice de co-achats (recommendations.py) : relue depuis copurchase.json,
+    le journal des paniers y étant replié au passage (compactage, fait au
+    warm-up), ou amorcée une seule fois depuis tout l'historique si le
+    fichier n'existe pas encore (ou date de la v1, indexée par nom).
+    Ensuite, elle n'est plus que mise à jour à chaque achat (et relue si
+    aggregates_version() change).
+    """
+    matrix = compact_matrix()
+    if matrix is None:
+        users = load_users()
+        archive_index = order_archive.load_index()
+        orders = [
+            order
+            for username, data in users.items()
+            for order in order_archive.hot_orders(
+                data.get("history", []), archive_index["users"].get(username)
+            )
+        ] + [order for _, order in order_archive.iter_archived_orders()]
+        # les lignes d'avant la v3 n'ont pas de parfum_id : retrouvé par le nom
+        resolve = get_name_resolver(catalog_version())
+        matrix = build_matrix(
+            [item.get("parfum_id") or resolve(item.get("name")) for item in order.get("items", [])]
+            for order in orders
+        )
+        matrix.save()
+        discard_baskets()  # paniers déjà comptés dans l'historique
+    return matrix
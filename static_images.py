@@ -0,0 +1,119 @@
+"""
+Images des flacons servies en fichiers statiques, nommés par leur contenu.
+
+st.image("images/12.png") fait passer l'image par le gestionnaire de médias
+de Streamlit : URL propre à la session, donc le navigateur retélécharge les
+mêmes PNG d'un rerun, d'une page et d'une session à l'autre.
+
+Avec server.enableStaticServing (.streamlit/config.toml), publish_images()
+copie chaque image (et sa vignette de product_grid.py) dans static/img/
+sous le nom <sha256>.png : le nom change si et seulement si le contenu
+change. Les pages référencent alors /app/static/img/<hash>.png, une URL
+stable que le navigateur peut garder en cache indéfiniment.
+
+Le endpoint statique de Streamlit n'envoie pas d'en-tête Cache-Control :
+ImmutableImageCache (middleware ASGI, voir server.py) ajoute
+"public, max-age=31536000, immutable" sur ces URL. Un visiteur qui revient
+ne retélécharge alors aucune image.
+"""
+import hashlib
+import json
+import os
+import shutil
+from pathlib import Path
+
+from product_grid import THUMBS_DIR
+
+IMAGES_DIR = "images"
+STATIC_DIR = "static"            # servi par Streamlit sous /app/static/
+PUBLISH_DIR = f"{STATIC_DIR}/img"
+MANIFEST_FILE = f"{PUBLISH_DIR}/manifest.json"
+URL_PREFIX = "/app/static/img/"
+CACHE_CONTROL = b"public, max-age=31536000, immutable"
+
+# variante -> dossier source (fichiers <id>.png)
+VARIANTS = {"full": IMAGES_DIR, "thumb": str(THUMBS_DIR)}
+
+
+def _digest(path: Path) -> str:
+    return hashlib.sha256(path.read_bytes()).hexdigest()[:32]
+
+
+def publish_images(directory=PUBLISH_DIR) -> dict:
+    """
+    Publie chaque variante sous static/img/<hash>.png (copie seulement des
+    contenus nouveaux), écrit le manifeste {variante: {id: fichier}} et
+    supprime les fichiers qui ne sont plus référencés.
+    Retourne {"images": nb de fichiers référencés, "copied": nb copiés}.
+    """
+    directory = Path(directory)
+    directory.mkdir(parents=True, exist_ok=True)
+    manifest = {}
+    copied = 0
+    for variant, source_dir in VARIANTS.items():
+        files = manifest[variant] = {}
+        for source in Path(source_dir).glob("*.png"):
+            if not source.stem.isdigit():
+                continue
+            name = f"{_digest(source)}.png"
+            target = directory / name
+            if not target.exists():
+                tmp = target.with_name(name + ".tmp")
+                shutil.copyfile(source, tmp)
+                os.replace(tmp, target)
+                copied += 1
+            files[source.stem] = name
+
+    referenced = {name for files in manifest.values() for name in files.values()}
+    for path in directory.glob("*.png"):
+        if path.name not in referenced:
+            path.unlink(missing_ok=True)
+
+    tmp = directory / "manifest.json.tmp"
+    tmp.write_text(json.dumps(manifest, indent=2), encoding="utf-8")
+    os.replace(tmp, directory / "manifest.json")
+    return {"images": len(referenced), "copied": copied}
+
+
+class ImageUrls:
+    """URL statiques des images publiées, d'après le manifeste."""
+
+    def __init__(self, manifest: dict):
+        self.manifest = manifest
+
+    @classmethod
+    def load(cls, path=MANIFEST_FILE):
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                return cls(json.load(f))
+        except (OSError, ValueError):
+            return None
+
+    def url(self, parfum_id, variant="full"):
+        """"/app/static/img/<hash>.png", ou None si l'image n'est pas publiée."""
+        name = self.manifest.get(variant, {}).get(str(int(parfum_id)))
+        return URL_PREFIX + name if name else None
+
+
+class ImmutableImageCache:
+    """
+    Middleware ASGI : en-tête Cache-Control immuable sur les réponses 200 de
+    /app/static/img/ (noms = hash du contenu, donc jamais périmés).
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or URL_PREFIX not in scope.get("path", ""):
+            await self.app(scope, receive, send)
+            return
+
+        async def send_with_cache(message):
+            if message["type"] == "http.response.start" and message.get("status") == 200:
+                headers = [(k, v) for k, v in message.get("headers", []) if k.lower() != b"cache-control"]
+                headers.append((b"cache-control", CACHE_CONTROL))
+                message = {**message, "headers": headers}
+            await send(message)
+
+        await self.app(scope, receive, send_with_cache)
@@ -0,0 +1,161 @@
+"""
+Démarrage "à chaud" de la boutique.
+
+Au lieu de `streamlit run app.py`, lancer :
+
+    python warmup.py [options de streamlit run...]
+
+Le script construit d'abord, dans le process du serveur, tout ce que le
+premier visiteur paierait sinon dans son propre rerun : caractéristiques
+visuelles des flacons, instantané Arrow du catalogue (catalog_store.py,
+reconstruit seulement s'il est périmé), catalogue, compositions, index de
+facettes, vues catégorie, vignettes et JSON de la grille navigateur, index des commandes et matrice de co-achats. Il affiche le
+temps de chaque étape, puis seulement démarre le serveur Streamlit : le
+endpoint de santé (/_stcore/health) ne répond donc qu'une fois tout prêt.
+
+Les caches Streamlit étant globaux au process, les sessions trouvent
+ensuite toutes les données déjà chargées.
+
+    python warmup.py --check     # préchauffe et affiche les temps, sans serveur
+"""
+import sys
+import time
+
+from streamlit import logger as st_logger
+
+# hors serveur, Streamlit prévient à chaque cache que le runtime n'existe pas
+# encore ; le niveau de log normal est rétabli au démarrage du serveur.
+st_logger.set_log_level("error")
+
+import dependencies  # noqa: E402
+import image_features  # noqa: E402
+import shop_data  # noqa: E402
+import static_images  # noqa: E402
+from catalog_store import open_snapshot  # noqa: E402
+
+
+def _image_features():
+    # recalcule seulement les images modifiées (hash), avant de figer la version
+    result = image_features.build_features()
+    return f"{result['images']} images, {result['computed']} recalculée(s)"
+
+
+def _snapshot():
+    # reconstruit l'instantané Arrow seulement s'il manque ou est périmé ;
+    # les autres process de la machine le memory-mappent ensuite
+    version = shop_data.catalog_version()
+    if open_snapshot(version) is not None:
+        return "à jour"
+    shop_data.build_snapshot()
+    return "reconstruit"
+
+
+def _catalog():
+    version = shop_data.catalog_version()
+    df = shop_data.load_catalog(version)
+    source = "instantané mmap" if shop_data.get_snapshot(version) is not None else "CSV"
+    return f"{len(df)} parfums ({source})"
+
+
+def _compositions():
+    return f"{len(shop_data.load_compositions_by_id(shop_data.catalog_version()))} fiches"
+
+
+def _facet_index():
+    index = shop_data.get_facet_index(shop_data.catalog_version())
+    return f"{sum(len(values) for values in index.bits.values())} valeurs de facettes"
+
+
+def _category_views():
+    views = shop_data.get_category_views(shop_data.catalog_version())
+    return ", ".join(f"{key}: {len(view)}" for key, view in views.items())
+
+
+def _product_grid():
+    version = shop_data.catalog_version()
+    result = shop_data.get_thumbnails(version)
+    sizes = [len(shop_data.get_grid_payload(page, version)) for page in shop_data.CATEGORY_PAGES]
+    return f"{result['built']} vignette(s) générée(s), {sum(sizes) // 1024} Ko de JSON"
+
+
+def _static_images():
+    urls = shop_data.get_image_urls(shop_data.catalog_version())
+    if urls is None:
+        return "désactivé (server.enableStaticServing)"
+    return f"{sum(len(files) for files in urls.manifest.values())} fichiers dans {static_images.PUBLISH_DIR}"
+
+
+def _particles_script():
+    if dependencies.fetch_particles_script():
+        return f"copie locale {dependencies.PARTICLES_FILE}"
+    return f"CDN injoignable, accueil sans animation ({dependencies.DEPENDENCIES['jsdelivr'].last_error})"
+
+
+def _order_index():
+    return f"{len(shop_data.get_order_index(shop_data.aggregates_version()))} lignes de commande"
+
+
+def _copurchase():
+    return f"{len(shop_data.get_copurchase(shop_data.aggregates_version()).top)} parfums avec co-achats"
+
+
+# (libellé, fonction) dans l'ordre des dépendances
+STEPS = [
+    ("Caractéristiques des flacons", _image_features),
+    ("Instantané Arrow du catalogue", _snapshot),
+    ("Catalogue", _catalog),
+    ("Compositions", _compositions),
+    ("Index des facettes", _facet_index),
+    ("Vues catégorie", _category_views),
+    ("Images statiques", _static_images),
+    ("Script particles.js (CDN)", _particles_script),
+    ("Grille navigateur", _product_grid),
+    ("Index des commandes", _order_index),
+    ("Co-achats", _copurchase),
+]
+
+
+def warm_up(report=print) -> list:
+    """
+    Exécute toutes les étapes et retourne [(libellé, secondes, détail)].
+    Une étape qui échoue est signalée mais n'empêche pas le démarrage :
+    la donnée sera alors construite au premier rerun, comme avant.
+    """
+    timings = []
+    for label, step in STEPS:
+        start = time.perf_counter()
+        try:
+            detail = step()
+        except Exception as exc:
+            detail = f"ÉCHEC ({exc})"
+        elapsed = time.perf_counter() - start
+        timings.append((label, elapsed, detail))
+        report(f"  {label:<30} {elapsed * 1000:8.1f} ms  {detail}")
+    report(f"  {'Total':<30} {sum(t for _, t, _ in timings) * 1000:8.1f} ms")
+    return timings
+
+
+def main(argv=None):
+    argv = list(sys.argv[1:] if argv is None else argv)
+    check_only = "--check" in argv
+    if check_only:
+        argv.remove("--check")
+
+    print("Préchauffage des caches...")
+    warm_up()
+    if check_only:
+        return
+
+    print("Caches prêts, démarrage du serveur.")
+    from streamlit.web import cli as stcli
+
+    import streamlit as st
+
+    # server.py ajoute l'en-tête de cache immuable des images statiques (st.App requis)
+    script = "server.py" if hasattr(st, "App") else "app.py"
+    sys.argv = ["streamlit", "run", script, *argv]
+    sys.exit(stcli.main())
+
+
+if __name__ == "__main__":
+    main()